@@ -3,3 +3,4 @@ from ov_django.ov.models import *
 
 admin.site.register(Context, ContextAdmin)
 admin.site.register(Entry, EntryAdmin)
+admin.site.register(URIAlias)
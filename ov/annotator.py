@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# encoding: utf-8
+"""
+annotator.py
+
+Annotation of texts with the concepts of vocabularies: all occurrences of known labels and
+lexical forms (including multi-word ones) are found in one pass over the tokens of the text.
+
+Every context gets a trie of the token sequences of its terms (normalized as in ov/autocomplete.py).
+Thesauri map the labels of word senses and the lexical forms of words to the synsets of the senses,
+other vocabularies (taxonomies) map labels of the entries to the entries themselves. The text is
+scanned token by token and the trie is walked from every position as far as it matches; as terms
+are a few tokens long, this costs about the same as an Aho-Corasick automaton over the tokens
+(without failure links, which save little for such short patterns).
+
+Tries are built on first use and rebuilt when the context is modified (see context_catalog()
+in ov/autocomplete.py).
+
+Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
+"""
+
+import re
+
+from django.conf import settings
+
+from ov_django.ov.models import Entry
+from ov_django.ov.autocomplete import normalize, context_catalog
+
+MAX_LENGTH = getattr(settings, 'OV_ANNOTATE_MAX_LENGTH', 1000000)
+MAX_CANDIDATES = 20
+CHUNK_SIZE = 5000
+
+RE_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+"""
+Key of the candidates of the term ending in a trie node (tokens are never empty)
+"""
+TERMINAL = u""
+
+def tokenize(text):
+	"""
+	Returns list of (normalized token, start, end) of given text
+	"""
+	return [ (normalize(match.group()), match.start(), match.end()) for match in RE_TOKEN.finditer(text) ]
+
+class TermTrie(object):
+	"""
+	Trie of the token sequences of the terms of a context, nodes are dictionaries token -> node
+	and TERMINAL -> candidate ids
+	"""
+	def __init__(self, context_id, stamp, terms):
+		"""
+		terms are (term, candidate id)
+		"""
+		self.context_id = context_id
+		self.stamp = stamp
+		self.root = {}
+		self.size = 0
+		for term, candidate in terms:
+			tokens = [ token for token, start, end in tokenize(term or u"") ]
+			if not tokens:
+				continue
+			node = self.root
+			for token in tokens:
+				node = node.setdefault(token, {})
+			candidates = node.setdefault(TERMINAL, [])
+			if not candidates:
+				self.size += 1
+			if candidate not in candidates and len(candidates) < MAX_CANDIDATES:
+				candidates.append(candidate)
+
+	def matches(self, tokens):
+		"""
+		Yields (first token, last token, candidate ids) of all occurrences of the terms in given tokens
+		"""
+		root = self.root
+		for first in xrange(len(tokens)):
+			node = root
+			for last in xrange(first, len(tokens)):
+				node = node.get(tokens[last][0])
+				if node is None:
+					break
+				if TERMINAL in node:
+					yield first, last, node[TERMINAL]
+
+	def __len__(self):
+		return self.size
+
+def _chunked(queryset, fields):
+	"""
+	Yields values of given fields (the first one is the primary key) of given queryset read in chunks
+	"""
+	last = 0
+	while True:
+		chunk = list(queryset.filter(pk__gt=last).order_by('pk').values_list(*fields)[:CHUNK_SIZE])
+		if not chunk:
+			break
+		last = chunk[-1][0]
+		for row in chunk:
+			yield row
+
+def context_terms(context_id):
+	"""
+	Returns list of (term, candidate id) of given context: labels of word senses and lexical forms
+	of words with their synsets or, if there are no synsets, labels of the entries with the entries
+	"""
+	terms = []
+	synsets = {}
+	senses = Entry.word_senses.through.objects.filter(from_entry__context=context_id)
+	for pk, sense, label, synset in _chunked(senses, ('pk', 'to_entry', 'to_entry__label', 'from_entry')):
+		synsets.setdefault(sense, []).append(synset)
+		terms.append((label, synset))
+	if not synsets:
+		return [ (label, pk) for pk, label in _chunked(Entry.objects.filter(context=context_id), ('pk', 'label')) ]
+	words = Entry.words.through.objects.filter(from_entry__context=context_id)
+	for pk, sense, lexical_form in _chunked(words, ('pk', 'from_entry', 'to_entry__lexical_form')):
+		for synset in synsets.get(sense, ()):
+			terms.append((lexical_form, synset))
+	return terms
+
+_tries = {}
+
+def get_trie(context_id):
+	"""
+	Returns (current) term trie of given context
+	"""
+	stamp = context_catalog().get(context_id, (None, None))[1]
+	trie = _tries.get(context_id)
+	if trie is None or trie.stamp != stamp:
+		trie = _tries[context_id] = TermTrie(context_id, stamp, context_terms(context_id))
+	return trie
+
+def _longest(spans):
+	"""
+	Returns the leftmost longest of given (overlapping) spans
+	"""
+	result = []
+	end = -1
+	for span in sorted(spans, key=lambda span: (span['start'], -span['end'])):
+		if span['start'] >= end:
+			result.append(span)
+			end = span['end']
+	return result
+
+def annotate(text, lang=None, context_id=None, overlapping=False):
+	"""
+	Returns spans (start, end, text, candidates: list of (context id, entry id)) of the occurrences of
+	the terms of given context (or of all the contexts of given language) in given text; only the leftmost
+	longest ones unless overlapping
+	"""
+	tokens = tokenize(text)
+	if context_id is not None:
+		context_ids = [context_id]
+	else:
+		context_ids = [ id for id, (context_lang, modified) in context_catalog().items() if context_lang == lang ]
+	spans = {}
+	for id in context_ids:
+		for first, last, candidates in get_trie(id).matches(tokens):
+			start, end = tokens[first][1], tokens[last][2]
+			span = spans.setdefault((start, end), {'start': start, 'end': end, 'text': text[start:end], 'candidates': []})
+			span['candidates'].extend((id, candidate) for candidate in candidates)
+	spans = sorted(spans.values(), key=lambda span: (span['start'], span['end']))
+	return spans if overlapping else _longest(spans)
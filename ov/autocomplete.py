@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# encoding: utf-8
+"""
+autocomplete.py
+
+In-process prefix index of the labels and lexical forms of entries, one per context,
+behind the autocomplete end-point (an entry with both is found by either of them). Labels are normalized (lower case, no diacritics, single
+spaces) and kept in a sorted array searched with bisect; matches are ranked by tag_count.
+The best ranked entries of every prefix up to TOP_PREFIX_LENGTH characters are computed when
+the index is built, so even one letter prefixes are answered without scanning.
+
+Indexes are built from the snapshot file (settings.OV_AUTOCOMPLETE_SNAPSHOT, written by the
+autocomplete command) if it is up to date, otherwise from the database: all of them by warm(), in a
+background thread as soon as the URLconf is loaded if settings.OV_AUTOCOMPLETE_WARM is set (a WSGI
+script may call warm() before serving), the rest on first use of a context. Every
+CHECK_INTERVAL seconds the modification stamps of the contexts (Context.modified, touched by
+imports - see ov/rendercache.py) are compared with these of the indexes and only the indexes of
+modified contexts are dropped (and rebuilt on their next use).
+
+Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
+"""
+
+import os
+import time
+import threading
+import heapq
+import bisect
+import cPickle
+import unicodedata
+
+from django import db
+from django.conf import settings
+
+from ov_django.ov.models import Context, Entry
+
+MAX_RESULTS = getattr(settings, 'OV_AUTOCOMPLETE_MAX_RESULTS', 20)
+CHECK_INTERVAL = getattr(settings, 'OV_AUTOCOMPLETE_CHECK_INTERVAL', 60)
+SNAPSHOT = getattr(settings, 'OV_AUTOCOMPLETE_SNAPSHOT', None)
+WARM = getattr(settings, 'OV_AUTOCOMPLETE_WARM', False)
+TOP_PREFIX_LENGTH = 3
+"""
+Maximal number of matches ranked for longer prefixes (the first ones in label order)
+"""
+MAX_SCAN = 5000
+CHUNK_SIZE = 5000
+"""
+Version of the indexes (snapshots of other versions are rebuilt)
+"""
+INDEX_VERSION = 2
+
+"""
+Letters with diacritics Unicode does not decompose
+"""
+FOLDED = {0x0141: u"L", 0x0142: u"l", 0x00d8: u"O", 0x00f8: u"o", 0x0110: u"D", 0x0111: u"d", 0x00df: u"ss"}
+
+def normalize(text):
+	"""
+	Returns given text in lower case without diacritics and with single spaces
+	"""
+	text = unicodedata.normalize('NFKD', unicode(text or u"").translate(FOLDED))
+	return u" ".join(u"".join(c for c in text if not unicodedata.combining(c)).lower().split())
+
+def distinct_items(matches, limit):
+	"""
+	Returns the first (at most limit) of given (rank, item) pairs of distinct entries (an entry is
+	indexed under its label and its lexical form)
+	"""
+	seen = set()
+	result = []
+	for match in matches:
+		if match[1][0] not in seen:
+			seen.add(match[1][0])
+			result.append(match)
+			if len(result) == limit:
+				break
+	return result
+
+class PrefixIndex(object):
+	"""
+	Sorted array of normalized labels of the entries of a context
+	"""
+	def __init__(self, context_id, stamp, rows):
+		"""
+		rows are (id, label, tag_count) of the entries
+		"""
+		self.context_id = context_id
+		self.stamp = stamp
+		self.version = INDEX_VERSION
+		rows = sorted((normalize(label), id, label, tag_count or 0) for id, label, tag_count in rows if label)
+		self.keys = [row[0] for row in rows]
+		self.items = [row[1:] for row in rows]
+		# -- best ranked positions of short prefixes
+		self.top = {}
+		for position in sorted(xrange(len(rows)), key=self.rank):
+			key = self.keys[position]
+			for length in xrange(1, min(len(key), TOP_PREFIX_LENGTH) + 1):
+				top = self.top.setdefault(key[:length], [])
+				if len(top) < MAX_RESULTS and not any(self.items[other][0] == self.items[position][0] for other in top):
+					top.append(position)
+
+	def rank(self, position):
+		return (-self.items[position][2], self.keys[position], self.items[position][0])
+
+	def search(self, prefix, limit=MAX_RESULTS):
+		"""
+		Returns (rank, (id, label, tag_count)) of (at most limit) best ranked entries with label starting
+		with given (normalized) prefix
+		"""
+		if len(prefix) <= TOP_PREFIX_LENGTH and limit <= MAX_RESULTS:
+			positions = self.top.get(prefix, [])[:limit]
+		else:
+			start = bisect.bisect_left(self.keys, prefix)
+			end = bisect.bisect_left(self.keys, prefix + u"\uffff", start)
+			# -- twice the limit, an entry may match with both of its keys
+			positions = heapq.nsmallest(2 * limit, xrange(start, min(end, start + MAX_SCAN)), key=self.rank)
+			return distinct_items([ (self.rank(position), self.items[position]) for position in positions ], limit)
+		return [ (self.rank(position), self.items[position]) for position in positions ]
+
+	def __len__(self):
+		return len(self.keys)
+
+def entry_rows(context_id):
+	"""
+	Yields (id, label, tag_count) of the entries of given context, read in primary key order;
+	entries with a lexical form different from the label twice, with each of them
+	"""
+	entries = Entry.objects.filter(context=context_id).order_by('pk')
+	last = 0
+	while True:
+		chunk = list(entries.filter(pk__gt=last).values_list('pk', 'label', 'lexical_form', 'tag_count')[:CHUNK_SIZE])
+		if not chunk:
+			break
+		last = chunk[-1][0]
+		for pk, label, lexical_form, tag_count in chunk:
+			if lexical_form:
+				yield pk, lexical_form, tag_count
+			if label and label != lexical_form:
+				yield pk, label, tag_count
+
+# -------- indexes of the process --------
+
+_indexes = {}
+_snapshot = None
+_catalog = None
+_checked = 0
+
+def _check(force=False):
+	"""
+	Reads modification stamps of the contexts (at most once per CHECK_INTERVAL) and drops stale indexes
+	"""
+	global _catalog, _checked
+	now = time.time()
+	if not force and _catalog is not None and now - _checked < CHECK_INTERVAL:
+		return _catalog
+	catalog = dict((context_id, (lang, modified)) for context_id, lang, modified in
+	               Context.objects.values_list('id', 'lang', 'modified'))
+	for context_id, index in _indexes.items():
+		if catalog.get(context_id, (None, None))[1] != index.stamp:
+			del _indexes[context_id]
+	_catalog, _checked = catalog, now
+	return catalog
+
+def context_catalog():
+	"""
+	Returns {context id: (lang, modification stamp)} of all the contexts (read at most once per CHECK_INTERVAL)
+	"""
+	return _check()
+
+def _load_snapshot():
+	global _snapshot
+	if _snapshot is None:
+		_snapshot = {}
+		if SNAPSHOT and os.path.exists(SNAPSHOT):
+			_snapshot = cPickle.load(open(SNAPSHOT, 'rb'))
+	return _snapshot
+
+def get_index(context_id):
+	"""
+	Returns (current) prefix index of given context
+	"""
+	stamp = _check().get(context_id, (None, None))[1]
+	index = _indexes.get(context_id)
+	if index is None:
+		index = _load_snapshot().pop(context_id, None)
+		if index is None or index.stamp != stamp or getattr(index, 'version', None) != INDEX_VERSION:
+			index = PrefixIndex(context_id, stamp, entry_rows(context_id))
+		_indexes[context_id] = index
+	return index
+
+def complete(prefix, lang=None, context_id=None, limit=MAX_RESULTS):
+	"""
+	Returns dictionaries (id, label, tag_count, context) of the best ranked entries with label starting
+	with given prefix, in given context or in all the contexts of given language
+	"""
+	prefix = normalize(prefix)
+	if not prefix:
+		return []
+	if context_id is not None:
+		context_ids = [context_id]
+	else:
+		context_ids = [ id for id, (context_lang, modified) in _check().items() if context_lang == lang ]
+	matches = []
+	for id in context_ids:
+		matches.extend((rank, item, id) for rank, item in get_index(id).search(prefix, limit))
+	return [ {'id': item[0], 'label': item[1], 'tag_count': item[2], 'context': id}
+	         for rank, item, id in heapq.nsmallest(limit, matches) ]
+
+def warm():
+	"""
+	Builds (or loads from the snapshot) the indexes of all the contexts, so that no request waits
+	for one; returns number of indexed labels
+	"""
+	return sum(len(get_index(context_id)) for context_id in _check(force=True))
+
+def warm_in_background():
+	"""
+	Runs warm() in a daemon thread (with its own database connection)
+	"""
+	def run():
+		try:
+			warm()
+		finally:
+			db.connection.close()
+	thread = threading.Thread(target=run, name="ov-autocomplete-warm")
+	thread.daemon = True
+	thread.start()
+	return thread
+
+def refresh(context_id=None):
+	"""
+	Drops index of given context (all the indexes if None) - after imports run in this process
+	"""
+	if context_id is None:
+		_indexes.clear()
+	else:
+		_indexes.pop(context_id, None)
+	_check(force=True)
+
+def write_snapshot(path):
+	"""
+	Builds indexes of all the contexts and writes them to given file; returns number of indexed entries
+	"""
+	indexes = {}
+	for context_id, (lang, modified) in _check(force=True).items():
+		indexes[context_id] = PrefixIndex(context_id, modified, entry_rows(context_id))
+	out = open(path + ".tmp", 'wb')
+	cPickle.dump(indexes, out, cPickle.HIGHEST_PROTOCOL)
+	out.close()
+	os.rename(path + ".tmp", path)
+	return sum(len(index) for index in indexes.values())
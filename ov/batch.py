@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# encoding: utf-8
+"""
+batch.py
+
+Set based lookups behind the batch REST end-points (batch/search/allsynsets, batch/search/synset
+and batch/get/uri): up to MAX_ITEMS words or URIs are resolved with a fixed number of IN
+queries per chunk (see CHUNK_SIZE in ov/resolver.py) instead of a query (and an HTTP round trip)
+per word.
+
+Results are maps keyed by the words (URIs) as given. Every word gets at most the limit of results
+(MAX_RESULTS unless the request asks for less).
+
+Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
+"""
+
+import operator
+
+from django.conf import settings
+from django.db.models import Q
+
+from ov_django.ov.models import Entry
+from ov_django.ov.resolver import chunks
+
+"""
+Maximal number of words (URIs) in one request and of results per word
+"""
+MAX_ITEMS = getattr(settings, 'OV_BATCH_MAX_ITEMS', 1000)
+MAX_RESULTS = getattr(settings, 'OV_BATCH_MAX_RESULTS', 50)
+
+class BatchError(ValueError):
+	pass
+
+def get_items(request, name, field):
+	"""
+	Returns list of the values given in the body of given POST request - JSON object ({name: [...]})
+	or form fields (field=...&field=...); raises BatchError if there are none or too many
+	"""
+	data = getattr(request, 'data', None) or request.POST
+	if hasattr(data, 'getlist'):
+		items = data.getlist(field)
+	elif isinstance(data, dict):
+		items = data.get(name) or []
+	else:
+		items = []
+	if isinstance(items, basestring) or not isinstance(items, (list, tuple)):
+		raise BatchError("%s should be a list" % name)
+	if not items:
+		raise BatchError("No %s given" % name)
+	if len(items) > MAX_ITEMS:
+		raise BatchError("Too many %s: %d (at most %d)" % (name, len(items), MAX_ITEMS))
+	return [ item if isinstance(item, (list, tuple, dict)) else unicode(item) for item in items ]
+
+def get_param(request, name, header):
+	"""
+	Returns request parameter given in the body, as a header (like the single lookups accept it) or GET argument
+	"""
+	data = getattr(request, 'data', None) or request.POST
+	value = data.get(name) if hasattr(data, 'get') else None
+	return value or request.META.get(header) or request.GET.get(name)
+
+def get_limit(request):
+	"""
+	Returns limit of results per word asked for (never more than MAX_RESULTS)
+	"""
+	try:
+		limit = int(get_param(request, 'limit', 'HTTP_LIMIT') or MAX_RESULTS)
+	except ValueError:
+		raise BatchError("Malformed limit")
+	return max(1, min(limit, MAX_RESULTS))
+
+def load_entries(ids):
+	"""
+	Returns {id: entry} of given entries (with their contexts)
+	"""
+	entries = {}
+	for chunk in chunks(set(ids)):
+		for entry in Entry.objects.filter(pk__in=chunk).select_related('context'):
+			entries[entry.pk] = entry
+	return entries
+
+def _add(result, folded, word, value, limit):
+	"""
+	Appends value to the results of given word or, if the database compares case insensitively,
+	of the words equal to it ignoring case
+	"""
+	for key in [word] if word in result else folded.get(word.lower(), ()):
+		if len(result[key]) < limit and value not in result[key]:
+			result[key].append(value)
+
+def synsets_by_words(words, limit=MAX_RESULTS, lang=None, context=None):
+	"""
+	Returns {word: [synset, ...]} of synsets with a word sense labelled with the word,
+	in vocabularies of given language or in given context
+	"""
+	result = dict((word, []) for word in words)
+	folded = {}
+	for word in result:
+		folded.setdefault(word.lower(), []).append(word)
+	senses = Entry.word_senses.through.objects.filter(from_entry__synset_id__isnull=False)
+	if lang is not None:
+		senses = senses.filter(from_entry__context__lang=lang)
+	if context is not None:
+		senses = senses.filter(from_entry__context=context)
+	for chunk in chunks(set(words)):
+		for label, synset_id in senses.filter(to_entry__label__in=chunk).values_list('to_entry__label', 'from_entry').order_by('from_entry'):
+			_add(result, folded, label, synset_id, limit)
+	entries = load_entries(synset_id for ids in result.values() for synset_id in ids)
+	return dict((word, [entries[synset_id] for synset_id in ids if synset_id in entries]) for word, ids in result.items())
+
+def entries_by_prefixes(words, context, limit=MAX_RESULTS):
+	"""
+	Returns {word: [entry, ...]} of entries of given context with label starting with the word (ignoring case).
+	One query per chunk of words reads at most limit rows per word, so short prefixes matching
+	many labels may leave less than limit to the others.
+	"""
+	result = dict((word, []) for word in words)
+	for chunk in chunks(set(words), 50):
+		condition = reduce(operator.or_, [Q(label__istartswith=word) for word in chunk])
+		rows = Entry.objects.filter(condition, context=context).values_list('pk', 'label').order_by('label', 'pk')
+		for pk, label in rows[:limit * len(chunk)]:
+			folded = (label or u"").lower()
+			for word in chunk:
+				if folded.startswith(word.lower()) and len(result[word]) < limit:
+					result[word].append(pk)
+	entries = load_entries(pk for ids in result.values() for pk in ids)
+	return dict((word, [entries[pk] for pk in ids if pk in entries]) for word, ids in result.items())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# encoding: utf-8
+"""
+conditional.py
+
+HTTP conditional GET (ETag / Last-Modified, RFC 2616 14.26 and 14.25) and Cache-Control
+policies of the end-points.
+
+Validators come from the modification stamps: Context.modified is touched by every write
+to the context (entries, triples, references; once per import, see ov/rendercache.py),
+so it changes whenever any representation of its entries may change. Requests are
+checked right after the entry or context is looked up - before any serialization
+or template rendering.
+
+Cache-Control of each kind of end-point is configurable with settings.OV_CACHE_CONTROL.
+
+Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
+"""
+
+import time
+import hashlib
+
+from django.conf import settings
+from django.db.models import Max
+from django.http import HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe, parse_etags, quote_etag
+from django.utils.encoding import smart_str
+
+from ov_django.ov.models import Context
+
+"""
+Default Cache-Control headers per end-point
+"""
+CACHE_CONTROL = {
+	'html'   : 'public, max-age=3600',
+	'data'   : 'public, max-age=3600',
+	'export' : 'public, max-age=86400',
+	'api'    : 'public, max-age=300',
+}
+CACHE_CONTROL.update(getattr(settings, 'OV_CACHE_CONTROL', {}))
+
+def entry_stamp(entry):
+	"""
+	Returns modification stamp of the representations of given entry (they refer to its neighbours)
+	"""
+	if entry.context_id and entry.context.modified:
+		return max(entry.context.modified, entry.modified or entry.context.modified)
+	return entry.modified
+
+def context_stamp(context):
+	return context.modified
+
+def global_stamp():
+	"""
+	Returns modification stamp of all the vocabularies (for searches)
+	"""
+	return Context.objects.aggregate(Max('modified'))['modified__max']
+
+def make_etag(stamp, *parts):
+	"""
+	Returns entity tag of the representation given by parts (e.g. entry id and media type) modified at stamp
+	"""
+	if stamp is None:
+		return None
+	return hashlib.md5("|".join(smart_str(part) for part in parts + (stamp.isoformat(),))).hexdigest()
+
+def _epoch(stamp):
+	return int(time.mktime(stamp.timetuple()))
+
+def set_validators(response, etag, stamp, policy=None):
+	"""
+	Sets ETag, Last-Modified and Cache-Control (of given end-point kind) headers of given response
+	"""
+	if etag:
+		response['ETag'] = quote_etag(etag)
+	if stamp:
+		response['Last-Modified'] = http_date(_epoch(stamp))
+	if policy and CACHE_CONTROL.get(policy):
+		response['Cache-Control'] = CACHE_CONTROL[policy]
+	return response
+
+def not_modified(request, etag, stamp, policy=None):
+	"""
+	Returns 304 response if the client has the current representation, None otherwise
+	"""
+	if request.method not in ('GET', 'HEAD') or (etag is None and stamp is None):
+		return None
+	if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+	if if_none_match:
+		etags = parse_etags(if_none_match)
+		if etag is None or not ('*' in etags or etag in etags):
+			return None
+	else:
+		since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE'))
+		if since is None or stamp is None or _epoch(stamp) > since:
+			return None
+	return set_validators(HttpResponseNotModified(), etag, stamp, policy)
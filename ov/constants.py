@@ -6,5 +6,11 @@ Created on 29-10-2010
 
 CONTENT_TYPE_TO_SERIALIZATION = {
     'application/json':'json',
-    'text/xml':'xml'
-}
\ No newline at end of file
+    'text/xml':'xml',
+    'application/x-msgpack':'msgpack',
+    'application/msgpack':'msgpack'
+}
+
+# content types of the API in the order of preference (see ov/serialization.py)
+SERIALIZATION_CONTENT_TYPES = ('application/json', 'application/x-msgpack', 'application/msgpack', 'text/xml')
+DEFAULT_SERIALIZATION_TYPE = 'application/json'
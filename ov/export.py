@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# encoding: utf-8
+"""
+export.py
+
+Streaming export of a whole vocabulary (Context with all its entries) in any format
+of ov/negotiation.py (N-Triples, Turtle, RDF/XML, JSON-LD). Entries are read in primary key
+ordered chunks (keyset, no OFFSET) with their neighbourhood prefetched, so memory usage
+does not depend on the vocabulary size.
+
+Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
+"""
+
+import zlib
+import itertools
+
+from django import db
+
+from ov_django.ov.models import Entry
+from ov_django.ov.negotiation import SERIALIZERS, SERIALIZERS_BY_NAME
+
+"""
+Supported export formats: name -> (media type, file extension)
+"""
+EXPORT_FORMATS = dict((serializer.name, (serializer.media_types[0], serializer.extension)) for serializer in SERIALIZERS)
+
+DEFAULT_CHUNK_SIZE = 500
+
+def iter_entry_chunks(context, chunk_size=DEFAULT_CHUNK_SIZE):
+	"""
+	Yields lists of entries of given context (with prefetched neighbourhood), ordered by primary key
+	"""
+	last_id = 0
+	while True:
+		chunk = list(Entry.objects.filter(context=context, pk__gt=last_id)
+		             .select_related('context').order_by('pk')[:chunk_size])
+		if not chunk:
+			break
+		last_id = chunk[-1].pk
+		yield Entry.objects.prefetch_neighbourhood(chunk)
+		# -- do not keep query log of long exports (settings.DEBUG)
+		db.reset_queries()
+
+def export_context(context, format, chunk_size=DEFAULT_CHUNK_SIZE):
+	"""
+	Yields UTF-8 encoded pieces of the serialization of given context in given format
+	"""
+	if format not in SERIALIZERS_BY_NAME:
+		raise ValueError("Unknown export format: %s" % format)
+	plans = [ context.get_rdf_plan(), Entry().get_rdf_plan() ]
+	chunks = itertools.chain([[context]], iter_entry_chunks(context, chunk_size))
+	return SERIALIZERS_BY_NAME[format].serialize(plans, chunks)
+
+def gzip_stream(pieces, level=6):
+	"""
+	Compresses given stream of strings into gzip format on the fly
+	"""
+	compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+	for piece in pieces:
+		data = compressor.compress(piece)
+		if data:
+			yield data
+	yield compressor.flush()
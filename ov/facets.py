@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# encoding: utf-8
+"""
+facets.py
+
+Facet counts of the visible vocabularies: number of contexts per type, language and tag.
+All of them come from a single query and are kept in the render cache store
+(see ov/rendercache.py) under a stamp read from the database: the last modification of the
+contexts and their number. Changes of tags touch the modification stamp of their contexts,
+so writes of any process (e.g. imports run from the command line) make the counts stale.
+
+Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
+"""
+
+import datetime
+
+from django.db.models import Max, Count
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
+
+from ov_django.ov.models import Context, Tag
+from ov_django.ov.rendercache import get_store, RENDER_TIMEOUT
+
+FACETS_KEY = "ov:facets:%s"
+
+def compute_facets():
+	"""
+	Returns {'types': {type: count}, 'langs': {lang: count}, 'tags': {label: count}} of visible contexts
+	"""
+	facets = {'types': {}, 'langs': {}, 'tags': {}}
+	seen = set()
+	# -- one row per (context, tag) pair, contexts without tags once with None
+	for context_id, type, lang, tag in Context.objects.filter(visible=True).values_list('id', 'type', 'lang', 'tags__label').order_by():
+		if tag is not None:
+			facets['tags'][tag] = facets['tags'].get(tag, 0) + 1
+		if context_id not in seen:
+			seen.add(context_id)
+			facets['types'][type] = facets['types'].get(type, 0) + 1
+			facets['langs'][lang] = facets['langs'].get(lang, 0) + 1
+	return facets
+
+def facets_stamp():
+	"""
+	Returns stamp of the facet counts: the last modification of the contexts and their number (deletions)
+	"""
+	stamp = Context.objects.aggregate(Max('modified'), Count('id'))
+	return "%s:%d" % (stamp['modified__max'] and stamp['modified__max'].isoformat(), stamp['id__count'])
+
+def get_facets():
+	"""
+	Returns (cached) facet counts, see compute_facets()
+	"""
+	store = get_store()
+	key = FACETS_KEY % facets_stamp()
+	facets = store.get(key)
+	if facets is None:
+		facets = compute_facets()
+		store.set(key, facets, RENDER_TIMEOUT)
+	return facets
+
+def count_by(facet, value):
+	"""
+	Returns number of visible contexts with given value of given facet (types, langs, tags)
+	"""
+	return get_facets()[facet].get(value, 0)
+
+def get_langs():
+	return sorted(get_facets()['langs'])
+
+def get_tags():
+	"""
+	Returns list of used tags as dictionaries with label and usages (number of visible contexts)
+	"""
+	return [ {'label': label, 'usages': count} for label, count in sorted(get_facets()['tags'].items()) ]
+
+# -------- tags touch their contexts --------
+
+def _touch(context_ids):
+	if context_ids:
+		Context.objects.filter(pk__in=list(context_ids)).update(modified=datetime.datetime.now())
+
+def _on_tags_change(sender, instance, action, reverse, pk_set, **kwargs):
+	if not reverse:
+		if action in ('post_add', 'post_remove', 'post_clear'):
+			_touch([instance.pk])
+	elif action == 'pre_clear':
+		# -- the contexts of a tag are gone after the clear
+		instance._ov_tagged = list(Context.objects.filter(tags=instance).values_list('pk', flat=True))
+	elif action == 'post_clear':
+		_touch(getattr(instance, '_ov_tagged', None))
+	elif action in ('post_add', 'post_remove'):
+		_touch(pk_set)
+
+def _on_tag_save(sender, instance, **kwargs):
+	_touch(Context.objects.filter(tags=instance).values_list('pk', flat=True))
+
+def _on_tag_pre_delete(sender, instance, **kwargs):
+	instance._ov_tagged = list(Context.objects.filter(tags=instance).values_list('pk', flat=True))
+
+def _on_tag_delete(sender, instance, **kwargs):
+	_touch(getattr(instance, '_ov_tagged', None))
+
+m2m_changed.connect(_on_tags_change, sender=Context.tags.through, dispatch_uid="ov_facets_tags")
+post_save.connect(_on_tag_save, sender=Tag, dispatch_uid="ov_facets_tag_save")
+pre_delete.connect(_on_tag_pre_delete, sender=Tag, dispatch_uid="ov_facets_tag_pre_delete")
+post_delete.connect(_on_tag_delete, sender=Tag, dispatch_uid="ov_facets_tag_delete")
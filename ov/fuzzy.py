@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# encoding: utf-8
+"""
+fuzzy.py
+
+Typo tolerant lookup of labels: entries with labels (or lexical forms) within edit distance k
+of the query, after the normalization of ov/autocomplete.py (case and diacritics folded, so
+"zolw" finds "Żółw" at distance 0).
+
+Every context gets an index of the trigrams of its distinct normalized labels (postings are
+arrays of label positions, labels ordered by length). A label within distance k of the query
+differs in length by at most k and shares at least |grams(query)| - k * GRAM grams with it:
+postings are cut to the labels of near length with bisect, shared grams are counted and only
+labels reaching the bound are verified with banded Levenshtein distance. Queries too short
+for the bound fall back to all the labels of near length.
+
+Indexes are built on first use and rebuilt when the context is modified (see context_catalog()
+in ov/autocomplete.py). The benchfuzzy command measures build time and latency on synthetic labels.
+
+Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
+"""
+
+import heapq
+import bisect
+from array import array
+
+from django.conf import settings
+
+from ov_django.ov.autocomplete import normalize, entry_rows, context_catalog, distinct_items
+
+GRAM = 3
+MAX_DISTANCE = 2
+MAX_RESULTS = getattr(settings, 'OV_FUZZY_MAX_RESULTS', 20)
+
+def default_distance(query):
+	"""
+	Returns the edit distance tolerated for given (normalized) query: 0 for the shortest ones, 1 up to 7
+	characters (so the query always keeps at least one gram of a match, see GramIndex.candidates)
+	"""
+	if len(query) < 4:
+		return 0
+	return 1 if len(query) < 8 else MAX_DISTANCE
+
+def grams(key):
+	"""
+	Returns set of trigrams of given key (padded, so the first and last characters count twice)
+	"""
+	padded = u"\x02" + key + u"\x03"
+	return set(padded[i:i + GRAM] for i in xrange(max(len(padded) - GRAM + 1, 1)))
+
+def distance(a, b, k):
+	"""
+	Returns Levenshtein distance of given strings, or k + 1 if it is greater than k
+	(only the diagonal band of width 2k + 1 is computed)
+	"""
+	if abs(len(a) - len(b)) > k:
+		return k + 1
+	out = k + 1
+	previous = [ min(j, out) for j in xrange(len(b) + 1) ]
+	for i in xrange(1, len(a) + 1):
+		current = [out] * (len(b) + 1)
+		current[0] = min(i, out)
+		ca = a[i - 1]
+		best = current[0]
+		for j in xrange(max(1, i - k), min(len(b), i + k) + 1):
+			cost = min(previous[j - 1] + (ca != b[j - 1]), previous[j] + 1, current[j - 1] + 1, out)
+			current[j] = cost
+			if cost < best:
+				best = cost
+		if best > k:
+			return out
+		previous = current
+	return previous[len(b)]
+
+class GramIndex(object):
+	"""
+	Trigram index of the distinct normalized labels of the entries of a context. Labels are kept
+	in (length, label) order, so the labels of lengths in any range are a range of positions
+	and every posting array can be cut to it with bisect.
+	"""
+	def __init__(self, context_id, stamp, rows):
+		"""
+		rows are (id, label, tag_count) of the entries
+		"""
+		self.context_id = context_id
+		self.stamp = stamp
+		labels = {}
+		for id, label, tag_count in rows:
+			key = normalize(label)
+			if key:
+				labels.setdefault(key, []).append((id, label, tag_count or 0))
+		self.keys = sorted(labels, key=lambda key: (len(key), key))
+		self.items = [ labels.pop(key) for key in self.keys ]
+		# -- starts[n] is the first position of the labels not shorter than n
+		lengths = [ len(key) for key in self.keys ]
+		self.starts = array('i', [ bisect.bisect_left(lengths, n) for n in xrange((lengths[-1] if lengths else 0) + 2) ])
+		postings = {}
+		for position, key in enumerate(self.keys):
+			for gram in grams(key):
+				postings.setdefault(gram, []).append(position)
+		self.postings = dict((gram, array('i', values)) for gram, values in postings.iteritems())
+
+	def window(self, length, k):
+		"""
+		Returns range (start, end) of positions of the labels of length within k of given one
+		"""
+		last = len(self.starts) - 1
+		return self.starts[min(max(length - k, 0), last)], self.starts[min(max(length + k + 1, 0), last)]
+
+	def candidates(self, key, k):
+		"""
+		Returns positions of labels which may be within distance k of given key: of near length
+		and sharing enough grams with it
+		"""
+		start, end = self.window(len(key), k)
+		query = grams(key)
+		threshold = len(query) - k * GRAM
+		if threshold <= 0:
+			return xrange(start, end)
+		counts = {}
+		get = counts.get
+		for gram in query:
+			postings = self.postings.get(gram)
+			if postings:
+				for position in postings[bisect.bisect_left(postings, start):bisect.bisect_left(postings, end)]:
+					counts[position] = get(position, 0) + 1
+		return [ position for position, count in counts.iteritems() if count >= threshold ]
+
+	def search(self, key, k, limit=MAX_RESULTS):
+		"""
+		Returns ((distance, -tag_count, label), (id, label, tag_count)) of (at most limit) entries with labels
+		nearest to given (normalized) key, within distance k
+		"""
+		matches = []
+		for position in self.candidates(key, k):
+			candidate = self.keys[position]
+			d = distance(key, candidate, k)
+			if d <= k:
+				for item in self.items[position]:
+					matches.append(((d, -item[2], candidate, item[0]), item))
+		# -- twice the limit, an entry may match with both its label and its lexical form
+		return distinct_items(heapq.nsmallest(2 * limit, matches), limit)
+
+	def __len__(self):
+		return len(self.keys)
+
+_indexes = {}
+
+def get_index(context_id):
+	"""
+	Returns (current) trigram index of given context
+	"""
+	stamp = context_catalog().get(context_id, (None, None))[1]
+	index = _indexes.get(context_id)
+	if index is None or index.stamp != stamp:
+		index = _indexes[context_id] = GramIndex(context_id, stamp, entry_rows(context_id))
+	return index
+
+def match(label, lang=None, context_id=None, k=None, limit=MAX_RESULTS):
+	"""
+	Returns dictionaries (id, label, tag_count, context, distance) of the entries with labels nearest
+	to given one (within edit distance k, by default depending on its length), in given context
+	or in all the contexts of given language
+	"""
+	key = normalize(label)
+	if not key:
+		return []
+	k = default_distance(key) if k is None else min(max(k, 0), MAX_DISTANCE)
+	if context_id is not None:
+		context_ids = [context_id]
+	else:
+		context_ids = [ id for id, (context_lang, modified) in context_catalog().items() if context_lang == lang ]
+	matches = []
+	for id in context_ids:
+		matches.extend((rank, item, id) for rank, item in get_index(id).search(key, k, limit))
+	return [ {'id': item[0], 'label': item[1], 'tag_count': item[2], 'context': id, 'distance': rank[0]}
+	         for rank, item, id in heapq.nsmallest(limit, matches) ]
@@ -34,11 +34,40 @@
 #for more information
 
 from piston.handler import BaseHandler
-from ov_django.ov.models import Entry, EntryReference
+from ov_django.ov.models import Entry, EntryReference, Context
+from ov_django.ov.resolver import resolve, resolve_many
+from ov_django.ov import batch, facets, autocomplete, fuzzy, similarity, annotator
+from ov_django.ov.paging import keyset_union_page
+from ov_django.ov.streaming import iter_chunks
+from ov_django.ov.conditional import entry_stamp, make_etag
+from ov_django.ov.serialization import DataResponse
 from django.db.models.query_utils import Q
 from django.http import HttpResponse
 import simplejson as json
 
+def stream_synset_dicts(synsets):
+    """
+    Yields dictionaries of given synsets (queryset) serialized a chunk at a time
+    """
+    for chunk in iter_chunks(synsets):
+        for synset in Entry.objects.synset_dicts(chunk):
+            yield synset
+
+def synset_dict_map(result):
+    """
+    Returns given map of lists of entries (or entries) with the entries replaced by their dictionaries,
+    each serialized once
+    """
+    entries = {}
+    for value in result.values():
+        for entry in value if isinstance(value, list) else [value]:
+            if entry is not None:
+                entries[entry.pk] = entry
+    entries = entries.values()
+    dicts = dict(zip([entry.pk for entry in entries], Entry.objects.synset_dicts(entries)))
+    return dict((key, [dicts[entry.pk] for entry in value] if isinstance(value, list) else value and dicts[value.pk])
+                for key, value in result.items())
+
 # searches all available thesauri in a given language (passed as http request parameter)
 # for all synsets with at least one wordsense with a given label
 # NOTE - taxonomies (DDC etc.) are not searched by this method, only thesauri with clear synset definition
@@ -56,7 +85,15 @@ class SearchAllSynsetsByWordHandler(BaseHandler):
         currently removed for better performance)
         uri pattern: search/allsynsets/<word_to_search>
         """
-            
+        return DataResponse(Entry.objects.synset_dicts(self.synsets(request, word)))
+    
+    def stream(self, request, word):
+        """
+        the same as read() - streamed (see ov/streaming.py)
+        """
+        return stream_synset_dicts(self.synsets(request, word))
+    
+    def synsets(self, request, word):
         # Notice - Django automatically CAPITALIZES and adds "HTTP_" prefix to all GET properties added in Java using setRequestProperty()
         try:   
             lang = request.META["HTTP_LANG"]
@@ -64,13 +101,7 @@ class SearchAllSynsetsByWordHandler(BaseHandler):
         except KeyError:
             lang = request.GET["lang"]
             
-        synsets = list(Entry.objects.filter(context__lang=lang, word_senses__label=word, synset_id__isnull=False))
-        
-        result = []
-        for synset in synsets:
-            result.append(synset.prepare_synset_dict())
-        
-        return HttpResponse(json.dumps(result), mimetype="application/json")
+        return Entry.objects.filter(context__lang=lang, word_senses__label=word, synset_id__isnull=False).distinct().select_related('context')
 
 
 # looks for a synset with at least one wordsense whose label is equal to a given one or an entry (from taxonomy) whose label contains given word
@@ -84,25 +115,43 @@ class SearchSynsetByWordHandler(BaseHandler):
     
     
     def read(self, request, word):
+        return DataResponse(Entry.objects.synset_dicts(self.synsets(request, word)))
+    
+    def stream(self, request, word):
+        """
+        the same as read() - streamed (see ov/streaming.py)
+        """
+        return stream_synset_dicts(self.synsets(request, word))
+    
+    def synsets(self, request, word):
         try:   
             context_uri = request.META["HTTP_CONTEXT_NAMESPACE"]
         except KeyError:
             context_uri = request.GET["context_namespace"]
             
-        synsets = list(Entry.objects.filter(context__uri=context_uri, word_senses__label=word, synset_id__isnull=False))
-        if len(synsets) == 0:
-            synsets = list(Entry.objects.filter(context__uri=context_uri, label__istartswith=word))
-        
-        result = []
-        for synset in synsets:
-            result.append(synset.prepare_synset_dict())
-        
-        return HttpResponse(json.dumps(result), mimetype="application/json")
+        synsets = Entry.objects.filter(context__uri=context_uri, word_senses__label=word, synset_id__isnull=False).distinct().select_related('context')
+        if not synsets.exists():
+            synsets = Entry.objects.filter(context__uri=context_uri, label__istartswith=word).select_related('context')
+        return synsets
     
+def entry_validators(request, id):
+    """
+    Conditional GET validators (etag, stamp) of the API responses about the entry with given id
+    """
+    try:
+        entry = Entry.objects.select_related('context').get(pk=id)
+    except Entry.DoesNotExist:
+        return None, None
+    stamp = entry_stamp(entry)
+    return make_etag(stamp, request.get_full_path(), request.META.get('HTTP_ACCEPT')), stamp
+
 class GetSynsetForIdHandler(BaseHandler):
     
     allowed_methods = ('GET')
     
+    def validators(self, request, id):
+        return entry_validators(request, id)
+    
     def read(self, request, id):
         synset = Entry.objects.get(pk=id)
         
@@ -116,6 +165,9 @@ class GetSynsetForIdHandler(BaseHandler):
     
 class GetPathForIdHandler(BaseHandler):
     
+    def validators(self, request, id):
+        return entry_validators(request, id)
+    
     def read(self, request, id):
         e = Entry.objects.get(pk=id)
         result = {}
@@ -138,20 +190,252 @@ class GetSynsetForUriHandler(BaseHandler):
             uri = request.META["HTTP_URI"]
         except KeyError:
             uri = request.GET["uri"]
-        synset = Entry.objects.get(uri=uri)
+        synset = resolve(uri, (Entry,))
+        if synset is None:
+            raise Entry.DoesNotExist("No entry with uri %s" % uri)
         
-        result = synset.prepare_synset_dict()
-        
-        return HttpResponse(json.dumps(result), mimetype="application/json")
+        return DataResponse(synset.prepare_synset_dict())
+
 
+def bad_request(error):
+    return DataResponse({'error': unicode(error)}, status=400)
+
+# batch variants of the lookups above - up to batch.MAX_ITEMS words (uris) given in POST body
+# as JSON ({"words": [...], "lang": "en"}) or form fields (word=...&word=...); results are maps keyed by the words
+class BatchSearchAllSynsetsByWordHandler(BaseHandler):
+    
+    allowed_methods = ('POST',)
+    
+    def create(self, request):
+        """
+        part of REST API - searches all the thesauri in a given language for synsets with word senses
+        labelled with any of given words
+        uri pattern: batch/search/allsynsets
+        """
+        try:
+            words = batch.get_items(request, 'words', 'word')
+            limit = batch.get_limit(request)
+        except batch.BatchError, e:
+            return bad_request(e)
+        lang = batch.get_param(request, 'lang', 'HTTP_LANG')
+        if not lang:
+            return bad_request("No lang given")
+        return DataResponse(synset_dict_map(batch.synsets_by_words(words, limit, lang=lang)))
+
+class BatchSearchSynsetByWordHandler(BaseHandler):
+    
+    allowed_methods = ('POST',)
+    
+    def create(self, request):
+        """
+        part of REST API - like search/synset, for many words in one thesaurus/taxonomy
+        uri pattern: batch/search/synset
+        """
+        try:
+            words = batch.get_items(request, 'words', 'word')
+            limit = batch.get_limit(request)
+        except batch.BatchError, e:
+            return bad_request(e)
+        context = resolve(batch.get_param(request, 'context_namespace', 'HTTP_CONTEXT_NAMESPACE'), (Context,))
+        if context is None:
+            return DataResponse(dict((word, []) for word in words))
+        result = batch.synsets_by_words(words, limit, context=context)
+        # -- entries (from taxonomies) with labels starting with the words without synsets
+        missing = [word for word, synsets in result.items() if not synsets]
+        if missing:
+            result.update(batch.entries_by_prefixes(missing, context, limit))
+        return DataResponse(synset_dict_map(result))
+
+class BatchGetSynsetForUriHandler(BaseHandler):
+    
+    allowed_methods = ('POST',)
     
+    def create(self, request):
+        """
+        part of REST API - entries of given uris (null for unknown ones)
+        uri pattern: batch/get/uri
+        """
+        try:
+            uris = batch.get_items(request, 'uris', 'uri')
+        except batch.BatchError, e:
+            return bad_request(e)
+        return DataResponse(synset_dict_map(resolve_many(uris, (Entry,))))
+
+RELATED_PAGE_SIZE = 100
+RELATED_MAX_PAGE_SIZE = 1000
+
+def _entry_ref(entry):
+    return {'id': entry.id, 'label': entry.label, 'uri': entry.uri}
+
 class SearchRelatedHandler(BaseHandler): 
     
     allowed_methods = ('GET')
-    model = EntryReference
-    fields = (('subject', ()), 'relation', ('object', ()));
-    
     
     def read(self, request, id):
-        return EntryReference.objects.filter(Q(subject=id) | Q(object=id))
-    
+        """
+        part of REST API - references from and to the entry with a given id, grouped by relation;
+        GET params: relation (only references of this type), size (of the page), cursor (next of the previous page)
+        uri pattern: search/related/<id>
+        """
+        try:
+            size = min(max(int(request.GET.get('size', RELATED_PAGE_SIZE)), 1), RELATED_MAX_PAGE_SIZE)
+            # -- one keyset query per direction, both on the (entry, relation, id) indexes
+            references = EntryReference.objects.select_related('subject', 'object')
+            relation = request.GET.get('relation', None)
+            if relation:
+                references = references.filter(relation=relation)
+            # -- references from the entry are stored in its context (the partition key, see ov/partitions.py)
+            context_ids = Entry.objects.filter(pk=id).values_list('context', flat=True)
+            outgoing = references.filter(subject=id, context=context_ids[0]) if context_ids else references.none()
+            objects, next = keyset_union_page([outgoing, references.filter(object=id)],
+                                              'relation', request.GET.get('cursor', None), size)
+        except ValueError, e:
+            return bad_request(e)
+        relations = {}
+        for reference in objects:
+            relations.setdefault(reference.relation, []).append({
+                'subject': _entry_ref(reference.subject),
+                'relation': reference.relation,
+                'object': _entry_ref(reference.object),
+            })
+        return DataResponse({'relations': relations, 'next': next})
+
+
+class AutocompleteHandler(BaseHandler):
+
+    allowed_methods = ('GET')
+
+    def read(self, request, prefix):
+        """
+        part of REST API - best ranked (by tag count) entries with labels starting with a given prefix,
+        in all the vocabularies of a language (lang) or in one of them (context_namespace)
+        uri pattern: autocomplete/<prefix>
+        """
+        context_uri = request.META.get("HTTP_CONTEXT_NAMESPACE", request.GET.get("context_namespace", None))
+        lang = request.META.get("HTTP_LANG", request.GET.get("lang", None))
+        try:
+            limit = min(max(int(request.GET.get('limit', autocomplete.MAX_RESULTS)), 1), autocomplete.MAX_RESULTS)
+        except ValueError, e:
+            return bad_request(e)
+        if context_uri:
+            context = resolve(context_uri, (Context,))
+            result = autocomplete.complete(prefix, context_id=context.id, limit=limit) if context else []
+        elif lang:
+            result = autocomplete.complete(prefix, lang=lang, limit=limit)
+        else:
+            return bad_request("No lang nor context_namespace given")
+        return DataResponse(result)
+
+
+class FuzzyLabelHandler(BaseHandler):
+
+    allowed_methods = ('GET')
+
+    def read(self, request, label):
+        """
+        part of REST API - entries with labels nearest to a given one (within edit distance k, at most 2),
+        in all the vocabularies of a language (lang) or in one of them (context_namespace)
+        uri pattern: fuzzy/<label>
+        """
+        context_uri = request.META.get("HTTP_CONTEXT_NAMESPACE", request.GET.get("context_namespace", None))
+        lang = request.META.get("HTTP_LANG", request.GET.get("lang", None))
+        try:
+            limit = min(max(int(request.GET.get('limit', fuzzy.MAX_RESULTS)), 1), fuzzy.MAX_RESULTS)
+            k = int(request.GET['k']) if 'k' in request.GET else None
+        except ValueError, e:
+            return bad_request(e)
+        if context_uri:
+            context = resolve(context_uri, (Context,))
+            result = fuzzy.match(label, context_id=context.id, k=k, limit=limit) if context else []
+        elif lang:
+            result = fuzzy.match(label, lang=lang, k=k, limit=limit)
+        else:
+            return bad_request("No lang nor context_namespace given")
+        return DataResponse(result)
+
+
+def with_lcs_entries(similarities):
+    """
+    Returns given similarities (see ov/similarity.py) with the lowest common subsumers as id, label and uri
+    """
+    lcs_ids = set(similarity['lcs'] for similarity in similarities if similarity['lcs'] is not None)
+    entries = batch.load_entries(lcs_ids) if lcs_ids else {}
+    for similarity in similarities:
+        if similarity['lcs'] is not None:
+            similarity['lcs'] = _entry_ref(entries[similarity['lcs']])
+    return similarities
+
+class SimilarityHandler(BaseHandler):
+
+    allowed_methods = ('GET', 'POST')
+
+    def read(self, request, id1, id2):
+        """
+        part of REST API - lowest common subsumer and similarity (path, Wu-Palmer, Leacock-Chodorow)
+        of two synsets in the hypernym graph of their vocabulary
+        uri pattern: similarity/<id1>/<id2>
+        """
+        return DataResponse(with_lcs_entries(similarity.compare([(int(id1), int(id2))]))[0])
+
+    def create(self, request):
+        """
+        part of REST API - the same for a batch of pairs given in POST body as JSON ({"pairs": [[id1, id2], ...]})
+        or form fields (pair=id1,id2&pair=...); results are in the order of the pairs
+        uri pattern: similarity
+        """
+        try:
+            pairs = []
+            for pair in batch.get_items(request, 'pairs', 'pair'):
+                ids = pair if isinstance(pair, (list, tuple)) else pair.split(",")
+                if len(ids) != 2:
+                    raise batch.BatchError("Malformed pair: %s" % (pair,))
+                pairs.append((int(ids[0]), int(ids[1])))
+        except (batch.BatchError, ValueError), e:
+            return bad_request(e)
+        return DataResponse(with_lcs_entries(similarity.compare(pairs)))
+
+
+class AnnotateHandler(BaseHandler):
+
+    allowed_methods = ('POST',)
+
+    def create(self, request):
+        """
+        part of REST API - occurrences of the labels and lexical forms (multi-word too) of the vocabularies
+        of a language (lang) or of one of them (context_namespace) in a text given in POST body as JSON
+        ({"text": "...", "lang": "en"}) or form field; spans are the leftmost longest ones unless
+        overlapping=1, with candidate synsets (entries of vocabularies without synsets)
+        uri pattern: annotate
+        """
+        text = batch.get_param(request, 'text', 'HTTP_TEXT')
+        if not text:
+            return bad_request("No text given")
+        if len(text) > annotator.MAX_LENGTH:
+            return bad_request("Text too long: %d characters (at most %d)" % (len(text), annotator.MAX_LENGTH))
+        context_uri = batch.get_param(request, 'context_namespace', 'HTTP_CONTEXT_NAMESPACE')
+        lang = batch.get_param(request, 'lang', 'HTTP_LANG')
+        overlapping = unicode(batch.get_param(request, 'overlapping', 'HTTP_OVERLAPPING')) in ('1', 'true', 'True')
+        if context_uri:
+            context = resolve(context_uri, (Context,))
+            spans = annotator.annotate(unicode(text), context_id=context.id, overlapping=overlapping) if context else []
+        elif lang:
+            spans = annotator.annotate(unicode(text), lang=lang, overlapping=overlapping)
+        else:
+            return bad_request("No lang nor context_namespace given")
+        entries = batch.load_entries(id for span in spans for context_id, id in span['candidates'])
+        for span in spans:
+            span['candidates'] = [ dict(_entry_ref(entries[id]), context=context_id)
+                                   for context_id, id in span['candidates'] if id in entries ]
+        return DataResponse({'spans': spans})
+
+
+class FacetsHandler(BaseHandler):
+
+    allowed_methods = ('GET')
+
+    def read(self, request):
+        """
+        part of REST API - numbers of visible vocabularies per type, language and tag
+        uri pattern: facets
+        """
+        return facets.get_facets()
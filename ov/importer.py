@@ -18,6 +18,8 @@ import datetime
 import fileinput
 from django import db
 from ov_django.ov.models import *
+from ov_django.ov import rendercache
+from ov_django.ov.uris import canonical_uri
 from django.utils.encoding import smart_unicode
 
 """
@@ -203,7 +205,7 @@ class TriplesParser:
 		"""
 		Initialize processor - with alternative URIs for labels and narrowers
 		"""
-		pass
+		self._rescoped = {}
 
 
 	def read(self, file_name):
@@ -211,27 +213,46 @@ class TriplesParser:
 		Read in given file - line by line
 		"""
 		file = codecs.open(file_name, encoding='utf-8', mode="r")
-		i = 0
-		size = 100
-		date = time.mktime(datetime.datetime.utcnow().timetuple())
-		for line in file:
-			line = line.rstrip()
-			if line:
-				self.process_line(line)
-				i += 1
-				if not i % size:
-					now_date = time.mktime(datetime.datetime.utcnow().timetuple())
-					db.reset_queries()
-					gc.collect()
-					print "[INFO] importing next %d lines [%d, %d]" % (size, i, now_date - date)
-					date = now_date
-		# update is_root column to 1 for all root entries:
-		for (orphan,) in Entry.objects\
-				.filter(types__uri__regex=r"http://www\.w3\.org/2006/03/wn/wn20/schema/(Noun|Verb|Adverb|Adjective)?Synset")\
-				.filter(parent__isnull=True)\
-				.values_list("id"):
-			if Entry.objects.filter(parent__id=orphan):
-				Entry.objects.filter(id=orphan).update(is_root=1)
+		rendercache.suspend_invalidation()
+		try:
+			i = 0
+			size = 100
+			date = time.mktime(datetime.datetime.utcnow().timetuple())
+			for line in file:
+				line = line.rstrip()
+				if line:
+					self.process_line(line)
+					i += 1
+					if not i % size:
+						now_date = time.mktime(datetime.datetime.utcnow().timetuple())
+						db.reset_queries()
+						gc.collect()
+						print "[INFO] importing next %d lines [%d, %d]" % (size, i, now_date - date)
+						date = now_date
+			# update is_root column to 1 for all root entries:
+			for (orphan,) in Entry.objects\
+					.filter(types__uri__regex=r"http://www\.w3\.org/2006/03/wn/wn20/schema/(Noun|Verb|Adverb|Adjective)?Synset")\
+					.filter(parent__isnull=True)\
+					.values_list("id"):
+				if Entry.objects.filter(parent__id=orphan):
+					Entry.objects.filter(id=orphan).update(is_root=1, modified=datetime.datetime.now())
+			self.update_statement_contexts()
+		finally:
+			# -- also after a failed import: what was stored so far must not be served stale
+			rendercache.resume_invalidation()
+
+	def update_statement_contexts(self, size=500):
+		"""
+		Copies context of the entries whose scheme was set during the import to their triples and references
+		(the partition key, see ov/partitions.py) - one UPDATE per table and chunk of entries
+		"""
+		for context_id, entry_ids in self._rescoped.items():
+			entry_ids = sorted(entry_ids)
+			for i in xrange(0, len(entry_ids), size):
+				chunk = entry_ids[i:i + size]
+				Triple.objects.filter(subject__in=chunk).update(context=context_id)
+				EntryReference.objects.filter(subject__in=chunk).update(context=context_id)
+		self._rescoped = {}
 
 	def process_line(self, line):
 		"""
@@ -256,7 +277,7 @@ class TriplesParser:
 			# get subject Entry
 			entry = None
 			if 'subject' in gdict and gdict['subject']:
-				dsubj = self._encode(gdict['subject'])
+				dsubj = self._canonical(gdict['subject'])
 				entry, created = Entry.objects.get_or_create(uri=dsubj)
 
 				if created:
@@ -310,7 +331,8 @@ class TriplesParser:
 
 				if processed:
 					try:
-						entry.save()
+						# -- statements of entries moved by set_scheme are moved at the end of the import
+						entry.save(propagate_context=False)
 					except Exception, e:
 						print "[ERROR] Could not save entry from line [%s]." % line
 						raise e
@@ -446,7 +468,7 @@ class TriplesParser:
 		utype = None
 
 		if 'pred' in obj and obj['pred']:
-			upred, created = Predicate.objects.get_or_create(uri=obj['pred'])
+			upred, created = Predicate.objects.get_or_create(uri=canonical_uri(obj['pred']))
 			if created:
 				upred.save()
 		else:
@@ -457,7 +479,7 @@ class TriplesParser:
 			uobj = self._get_uri(obj)
 
 		if 'type' in obj and obj['type']:
-			utype, created = URI.objects.get_or_create(uri=obj['type'])
+			utype, created = URI.objects.get_or_create(uri=canonical_uri(obj['type']))
 			if created:
 				utype.save()
 
@@ -477,11 +499,14 @@ class TriplesParser:
 		sets scheme for given entry
 		"""
 		if 'uri' in obj and obj['uri']:
-			ouri = obj['uri']
+			ouri = canonical_uri(obj['uri'])
 			context, created = Context.objects.get_or_create(uri=ouri) #lookup(ouri)
 			if created:
 				context.save()
 
+			if entry.context_id != context.id:
+				# -- statements of the entry read before its scheme are moved at the end of the import
+				self._rescoped.setdefault(context.id, set()).add(entry.id)
 			entry.context = context
 
 			return True
@@ -498,7 +523,7 @@ class TriplesParser:
 		retrieves URI object based on obj map
 		"""
 		if 'uri' in obj and obj['uri']:
-			ouri = self._encode(obj['uri'])
+			ouri = self._canonical(obj['uri'])
 			uri, created = URI.objects.get_or_create(uri=ouri) #lookup(ouri)
 			if created:
 				uri.save()
@@ -526,7 +551,7 @@ class TriplesParser:
 		retrieves Entry object based on given URI
 		"""
 		if 'uri' in obj and obj['uri']:
-			ouri = self._encode(obj['uri'])
+			ouri = self._canonical(obj['uri'])
 			oentry, created = Entry.objects.get_or_create(uri=ouri) #lookup(ouri)
 			if created:
 				try:
@@ -540,6 +565,12 @@ class TriplesParser:
 		print "[WARNING] cannot retrieve a non existing object: " + str(obj)
 		return None
 
+	def _canonical(self, uri):
+		"""
+		Returns canonical form of given (encoded) uri, see ov/uris.py
+		"""
+		return canonical_uri(self._encode(uri))
+
 	def _encode(self, text):
 		"""
 		Encodes \u???? into utf-8 text
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ov_django.ov import autocomplete
+
+class Command(BaseCommand):
+    args = "<snapshot file>"
+    help = "Writes snapshot of the autocomplete indexes of all vocabularies (see ov/autocomplete.py)"
+
+    def handle(self, path=None, **options):
+        path = path or autocomplete.SNAPSHOT
+        if not path:
+            raise CommandError("No snapshot file given (nor OV_AUTOCOMPLETE_SNAPSHOT set)")
+        count = autocomplete.write_snapshot(path)
+        self.stdout.write("%d labels indexed\n" % count)
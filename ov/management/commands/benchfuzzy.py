@@ -0,0 +1,78 @@
+import time
+import random
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ov_django.ov import fuzzy
+from ov_django.ov.autocomplete import entry_rows
+from ov_django.ov.models import Context
+
+SYLLABLES = [ c + v for c in u"bcdfghjklmnprstwz\u0142" for v in u"aeiouy\u0105\u0119\xf3" ]
+
+def synthetic_rows(count, seed=0):
+    """
+    Yields (id, label, tag_count) of count random labels of 2-5 syllables (some of them two words)
+    """
+    generator = random.Random(seed)
+    for i in xrange(count):
+        words = [ u"".join(generator.choice(SYLLABLES) for j in range(generator.randint(2, 5)))
+                  for w in range(1 if generator.random() < 0.8 else 2) ]
+        yield i, u" ".join(words), generator.randint(0, 100)
+
+def typo(label, generator):
+    """
+    Returns given label with one random edit
+    """
+    i = generator.randrange(len(label))
+    edit = generator.randint(0, 2)
+    if edit == 0:
+        return label[:i] + label[i + 1:]
+    if edit == 1:
+        return label[:i] + generator.choice(u"abcdefghijklmnopqrstuvwxyz") + label[i:]
+    return label[:i] + generator.choice(u"abcdefghijklmnopqrstuvwxyz") + label[i + 1:]
+
+class Command(BaseCommand):
+    args = "[context uri]"
+    help = "Benchmark of the fuzzy label index (see ov/fuzzy.py): build time and query latency"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--labels', action='store', dest='labels', type='int', default=1000000,
+            help='Number of synthetic labels (unless a context is given)'),
+        make_option('--queries', action='store', dest='queries', type='int', default=1000,
+            help='Number of queries (labels with one random edit)'),
+        make_option('-k', action='store', dest='k', type='int', default=None,
+            help='Edit distance (by default depending on the query length)'),
+    )
+
+    def handle(self, uri=None, **options):
+        if uri:
+            try:
+                rows = list(entry_rows(Context.objects.get(uri=uri).id))
+            except Context.DoesNotExist:
+                raise CommandError("Unknown context: %s" % uri)
+        else:
+            rows = list(synthetic_rows(options['labels']))
+        if not rows:
+            raise CommandError("No labels to index")
+
+        start = time.time()
+        index = fuzzy.GramIndex(None, None, rows)
+        self.stdout.write("%d labels (%d distinct, %d grams) indexed in %.1f s\n"
+                          % (len(rows), len(index), len(index.postings), time.time() - start))
+
+        generator = random.Random(1)
+        latencies = []
+        found = 0
+        for i in xrange(options['queries']):
+            label = generator.choice(rows)[1]
+            query = fuzzy.normalize(typo(label, generator))
+            k = fuzzy.default_distance(query) if options['k'] is None else options['k']
+            start = time.time()
+            matches = index.search(query, k)
+            latencies.append(time.time() - start)
+            found += any(item[1] == label for rank, item in matches)
+        latencies.sort()
+        percentile = lambda p: latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000.0
+        self.stdout.write("%d queries: p50 %.2f ms, p95 %.2f ms, p99 %.2f ms, max %.2f ms; original label found for %d\n"
+                          % (len(latencies), percentile(0.5), percentile(0.95), percentile(0.99), latencies[-1] * 1000.0, found))
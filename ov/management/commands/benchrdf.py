@@ -0,0 +1,160 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from django.db.models.query import QuerySet
+
+from ov_django.rdf import RdfConcept, URI, NAMESPACES, TURTLE_NS_HEAD
+from ov_django.ov.models import Context, Entry
+
+class SyntheticEntry(RdfConcept):
+    """
+    In-memory concept with the properties of Entry (serialization cost without database access)
+    """
+    rdfMeta = Entry.rdfMeta.im_func
+    get_rdf_types = Entry.get_rdf_types.im_func
+
+    def __init__(self, i):
+        self.uri = "http://www.openvocabulary.info/thesauri/bench/synset-%d" % i
+        self.label = "synset %d" % i
+        self.gloss = "gloss of the synset %d" % i
+        self.context = URI("http://www.openvocabulary.info/thesauri/bench")
+        self.is_root = False
+        self.type_tag = "Poetic"
+        self.in_synset = None
+        self.parent = URI("http://www.openvocabulary.info/thesauri/bench/synset-%d" % (i - 1))
+        self.word_senses = [ URI("%s/ws-%d" % (self.uri, j)) for j in range(3) ]
+        self.childOf = [ URI("http://www.openvocabulary.info/thesauri/bench/synset-%d" % (i + 1)) ]
+
+    def get_uri(self):
+        return self.uri
+
+    def get_description(self):
+        return self.gloss
+
+    def list_related(self):
+        return self.childOf
+
+# -------- the previous (interpreted) serialization, as the baseline --------
+
+def previous_uri(value):
+    if hasattr(value, "get_uri"):
+        return previous_uri(value.get_uri())
+    if value.split(":")[0] in NAMESPACES:
+        return value
+    return "<%s>" % value
+
+def previous_object(obj):
+    if hasattr(obj, "get_uri"):
+        return previous_uri(obj.get_uri())
+    elif isinstance(obj, (list, tuple, QuerySet)):
+        return previous_list(obj)
+    elif obj:
+        return '"' + unicode(obj) + '"'
+    return None
+
+def previous_list(objects):
+    if len(objects) == 0:
+        raise ValueError("Cannot list empty array or non-array")
+    elif len(objects) == 1:
+        return previous_object(objects[0])
+    return ", ".join("%s" % previous_object(v) for v in objects)
+
+def previous_value(entry, prop, rdfprops):
+    if "property" in rdfprops and hasattr(entry, rdfprops["property"]):
+        if callable(eval("entry." + rdfprops["property"])):
+            dbval = eval("entry." + rdfprops["property"] + "()")
+        else:
+            dbval = getattr(entry, rdfprops["property"])
+    else:
+        dbval = getattr(entry, prop)
+    if 'value' in rdfprops:
+        if 'dict' in rdfprops:
+            dbval = rdfprops['dict'][dbval]
+        dbval = eval(rdfprops["value"] % dbval)
+    elif 'attribute' in rdfprops:
+        dbval = getattr(dbval, rdfprops['attribute'])
+    if dbval and 'uri_pattern' in rdfprops:
+        return previous_uri(rdfprops["uri_pattern"] % dbval)
+    elif 'literal_pattern' in rdfprops:
+        return rdfprops["literal_pattern"] % dbval
+    return previous_object(dbval)
+
+def previous_to_rdf(entry):
+    """
+    Turtle of given entry the way RdfConcept.to_rdf built it before the serialization plans:
+    rdfMeta interpreted (with eval) for every entry and every namespace in the head
+    """
+    rdf = "".join(TURTLE_NS_HEAD % (key, value) for key, value in NAMESPACES.items())
+    rdf += "\n%s\n" % previous_uri(entry.get_uri())
+    rdf += "\ta %s" % previous_object(entry.get_rdf_types())
+    rdfMeta = entry.rdfMeta()
+    for prop, rdfprops in rdfMeta.items():
+        if "condition" in rdfprops:
+            cname, cvalue = rdfprops["condition"]
+            value = getattr(entry, cname)
+            if callable(value):
+                value = value()
+            if value != cvalue:
+                continue
+        try:
+            dbval = getattr(entry, rdfprops["property"]) if "property" in rdfprops else getattr(entry, prop)
+            if callable(dbval):
+                rval = previous_list(dbval())
+            elif hasattr(dbval, 'all') and callable(dbval.all):
+                rval = previous_list(dbval.all())
+            else:
+                rval = previous_value(entry, prop, rdfprops)
+        except ValueError:
+            continue
+        uris = rdfprops["uri"] if isinstance(rdfprops["uri"], (list, tuple, QuerySet)) else [ rdfprops["uri"] ]
+        if rval:
+            for puri in uris:
+                rdf += ";\n\t%s %s" % (previous_uri(puri), rval)
+    return rdf + ".\n"
+
+def best_time(entries, serialize, repeat):
+    """
+    Returns the best of given number of rounds serializing all entries
+    """
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        for entry in entries:
+            serialize(entry)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+class Command(BaseCommand):
+    args = "[context uri]"
+    help = "Microbenchmark of the per-entry RDF (Turtle) serialization cost"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--count', action='store', dest='count', type='int', default=200,
+            help='Number of entries to serialize'),
+        make_option('--repeat', action='store', dest='repeat', type='int', default=5,
+            help='Number of rounds (the best one is reported)'),
+        make_option('--synthetic', action='store_true', dest='synthetic', default=False,
+            help='Serialize in-memory entries (no database access)'),
+    )
+
+    def handle(self, uri=None, **options):
+        if options['synthetic']:
+            entries = [ SyntheticEntry(i) for i in range(options['count']) ]
+        else:
+            entries = Entry.objects.order_by('pk')
+            if uri:
+                try:
+                    entries = entries.filter(context=Context.objects.get(uri=uri))
+                except Context.DoesNotExist:
+                    raise CommandError("Unknown context: %s" % uri)
+            entries = list(entries.select_related('context')[:options['count']])
+        if not entries:
+            raise CommandError("No entries to serialize")
+
+        for name, serialize in (("previous", previous_to_rdf), ("plan", lambda entry: entry.to_rdf())):
+            best = best_time(entries, serialize, options['repeat'])
+            self.stdout.write("%s: %d entries, best of %d rounds: %.1f us/entry\n"
+                              % (name, len(entries), options['repeat'], best * 1000000.0 / len(entries)))
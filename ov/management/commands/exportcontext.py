@@ -0,0 +1,41 @@
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ov_django.ov.models import Context
+from ov_django.ov.export import EXPORT_FORMATS, DEFAULT_CHUNK_SIZE, export_context, gzip_stream
+
+class Command(BaseCommand):
+    args = "<context uri>"
+    help = "Exports whole vocabulary as N-Triples, Turtle or JSON-LD"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--format', action='store', dest='format', default='nt',
+            help='Output format: %s' % ", ".join(sorted(EXPORT_FORMATS))),
+        make_option('--output', action='store', dest='output', default=None,
+            help='Output file (defaults to standard output)'),
+        make_option('--gzip', action='store_true', dest='gzip', default=False,
+            help='Compress the output with gzip'),
+        make_option('--chunk-size', action='store', dest='chunk_size', type='int', default=DEFAULT_CHUNK_SIZE,
+            help='Number of entries read at once'),
+    )
+
+    def handle(self, uri=None, **options):
+        if options['format'] not in EXPORT_FORMATS:
+            raise CommandError("Unknown format: %s" % options['format'])
+        try:
+            context = Context.objects.get(uri=uri)
+        except Context.DoesNotExist:
+            raise CommandError("Unknown context: %s" % uri)
+
+        content = export_context(context, options['format'], options['chunk_size'])
+        if options['gzip']:
+            content = gzip_stream(content)
+        output = open(options['output'], 'wb') if options['output'] else sys.stdout
+        try:
+            for piece in content:
+                output.write(piece)
+        finally:
+            if options['output']:
+                output.close()
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from ov_django.ov.models import Context, URI, Predicate, Entry
+from ov_django.ov.uris import canonical_uri
+
+class Command(BaseCommand):
+    help = "Canonicalizes uris and fills in uri hashes of existing URIs, Predicates and Entries (after ov/sql/upgrade_uri_hash.sql)"
+
+    chunk_size = 1000
+
+    def handle(self, *args, **kwargs):
+        for context in Context.objects.all():
+            canonical = canonical_uri(context.uri)
+            if canonical != context.uri and Context.objects.filter(uri=canonical).exclude(pk=context.pk).exists():
+                self.stdout.write("Context %s duplicates %s - skipped\n" % (context.uri, canonical))
+                continue
+            context.save()
+        for model in (URI, Predicate, Entry):
+            last_id = 0
+            count = 0
+            while True:
+                chunk = list(model.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', 'uri')[:self.chunk_size])
+                if not chunk:
+                    break
+                for pk, uri in chunk:
+                    obj = model(pk=pk, uri=uri)
+                    obj.hash_uri()
+                    if obj.uri != uri and model.objects.filter(uri_hash=obj.uri_hash).exclude(pk=pk).exists():
+                        # -- another spelling of the same uri is stored already, needs manual merge
+                        self.stdout.write("%s %s duplicates %s - skipped\n" % (model.__name__, uri, obj.uri))
+                        continue
+                    model.objects.filter(pk=pk).update(uri=obj.uri, uri_hash=obj.uri_hash)
+                last_id = chunk[-1][0]
+                count += len(chunk)
+            self.stdout.write("%s: %d uris hashed\n" % (model.__name__, count))
+        self.stdout.write('All uris processed\n')
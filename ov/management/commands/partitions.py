@@ -0,0 +1,67 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from ov_django.ov.models import Context
+from ov_django.ov import partitions
+
+class Command(BaseCommand):
+    args = "backfill | convert | create <context uri>... | detach <context uri>... | drop <context uri>... | swap <context uri>..."
+    help = ("Manages per-context partitions of the Triple and EntryReference tables (PostgreSQL 11+).\n"
+            "backfill copies context of the subjects to their triples and references (convert does it too); "
+            "several contexts may share one partition (see --name); "
+            "swap replaces a partition with tables named <partition>_staging.")
+
+    option_list = BaseCommand.option_list + (
+        make_option('--name', action='store', dest='name', default=None,
+            help='Name of the partition (defaults to the id of the only given context)'),
+        make_option('--dry-run', action='store_true', dest='dry_run', default=False,
+            help='Only print SQL statements'),
+    )
+
+    def handle(self, action=None, *uris, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("Partitioning is supported only on PostgreSQL")
+
+        context_ids = []
+        for uri in uris:
+            try:
+                context_ids.append(Context.objects.get(uri=uri).id)
+            except Context.DoesNotExist:
+                raise CommandError("Unknown context: %s" % uri)
+        name = options['name']
+        if action not in ('backfill', 'convert'):
+            if not context_ids:
+                raise CommandError("No contexts given")
+            if not name:
+                if len(context_ids) > 1:
+                    raise CommandError("--name is required for partitions with several contexts")
+                name = str(context_ids[0])
+
+        cursor = connection.cursor()
+        statements = []
+        for table in partitions.partitioned_tables():
+            if action == 'backfill':
+                statements += partitions.backfill_sql(table)
+            elif action == 'convert':
+                statements += partitions.convert_sql(cursor, table)
+            elif action == 'create':
+                statements += partitions.create_sql(table, name, context_ids)
+            elif action == 'detach':
+                statements += partitions.detach_sql(table, name)
+            elif action == 'drop':
+                statements += partitions.drop_sql(table, name)
+            elif action == 'swap':
+                staging = "%s_staging" % partitions.partition_name(table, name)
+                statements += partitions.swap_sql(table, name, context_ids, staging)
+            else:
+                raise CommandError("Unknown action: %s" % action)
+
+        for statement in statements:
+            self.stdout.write("%s;\n" % statement)
+            if not options['dry_run']:
+                cursor.execute(statement)
+        if not options['dry_run']:
+            transaction.commit_unless_managed()
+            self.stdout.write('All partitions processed\n')
@@ -0,0 +1,22 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ov_django.ov import sitemaps
+
+class Command(BaseCommand):
+    args = "<output directory>"
+    help = "Generates sharded semantic sitemap of all vocabularies (see ov/sitemaps.py)"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--incremental', action='store_true', dest='incremental', default=False,
+            help='Rewrite only shards with entries modified since the previous run'),
+        make_option('--shard-size', action='store', dest='shard_size', type='int', default=sitemaps.SHARD_SIZE,
+            help='Maximal number of urls in a shard'),
+    )
+
+    def handle(self, output=None, **options):
+        if not output:
+            raise CommandError("No output directory given")
+        written = sitemaps.generate(output, incremental=options['incremental'], size=options['shard_size'])
+        self.stdout.write("%d sitemap shards written\n" % written)
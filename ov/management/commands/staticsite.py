@@ -0,0 +1,30 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ov_django.ov.models import Context
+from ov_django.ov import staticsite
+
+class Command(BaseCommand):
+    args = "<context uri> <output directory>"
+    help = "Pre-renders entries of a vocabulary to static HTML and Turtle files (see ov/staticsite.py)"
+
+    option_list = BaseCommand.option_list + (
+        make_option('--workers', action='store', dest='workers', type='int', default=None,
+            help='Number of worker processes (defaults to the number of CPUs)'),
+        make_option('--incremental', action='store_true', dest='incremental', default=False,
+            help='Render only entries changed since the previous run'),
+        make_option('--chunk-size', action='store', dest='chunk_size', type='int', default=200,
+            help='Number of entries rendered by a worker at once'),
+    )
+
+    def handle(self, uri=None, output=None, **options):
+        if not output:
+            raise CommandError("No output directory given")
+        try:
+            context = Context.objects.get(uri=uri)
+        except Context.DoesNotExist:
+            raise CommandError("Unknown context: %s" % uri)
+        written = staticsite.generate(context, output, workers=options['workers'],
+                                      incremental=options['incremental'], chunk_size=options['chunk_size'])
+        self.stdout.write("%d entries rendered\n" % written)
@@ -1,14 +1,16 @@
 from django.core.management.base import BaseCommand
 
 from ov_django.ov.models import Context, Tag
+from ov_django.ov.facets import compute_facets
 
 class Command(BaseCommand):
     help = "Updates tag usage counters"
 
     def handle(self, *args, **kwargs):
+        usages = compute_facets()['tags']
         tags = Tag.objects.all()
         for tag in tags:
-            tag.usages = Context.objects.filter(visible=True, tags__label__exact=tag.label).count()
+            tag.usages = usages.get(tag.label, 0)
             self.stdout.write("Tag '%s' had %d usages\n" % (tag.label, tag.usages))
             tag.save()
         self.stdout.write('All tags processed\n')
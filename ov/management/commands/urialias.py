@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ov_django.ov.models import URIAlias
+from ov_django.ov.uris import uri_hash
+
+class Command(BaseCommand):
+    args = "<alias uri> <uri>"
+    help = "Registers legacy alias of a uri (resolved by html/, data/ and get/uri end-points)"
+
+    def handle(self, alias=None, uri=None, **options):
+        if not alias or not uri:
+            raise CommandError("Both alias and uri are required")
+        try:
+            record = URIAlias.objects.get(alias_hash=uri_hash(alias))
+        except URIAlias.DoesNotExist:
+            record = URIAlias(alias=alias)
+        record.uri = uri
+        record.save()
+        self.stdout.write("%s\n" % record)
@@ -0,0 +1,260 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# encoding: utf-8
+"""
+metrics.py
+
+Request metrics of this process, per URL pattern (of ov/urls.py, prefixed by the includes):
+latency histogram, responses per status class, SQL queries (count and time), serialization
+time (of DataResponse, see ov/serialization.py, and compression) and response size. They are
+exposed in the Prometheus text format by the metrics view, to the addresses of
+settings.OV_METRICS_ALLOWED_IPS (the local ones by default), together with the hit rates of
+the render cache (see ov/rendercache.py).
+
+Requests taking at least SLOW_REQUEST seconds are logged (logger ov.metrics, level WARNING)
+with their slowest queries.
+
+Kept cheap to stay on under load: MetricsMiddleware (to be the first of MIDDLEWARE_CLASSES)
+records a request with a few dictionary updates under a lock. Cursors of the connections are
+wrapped once, the wrapper only times execute() into the list of the current request (no SQL
+formatting unless the request is logged as slow). The URL pattern of a request is found among
+the few patterns of its view only.
+
+Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
+"""
+
+import time
+import bisect
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections
+from django.core.urlresolvers import get_resolver, RegexURLResolver
+
+from ov_django.ov import rendercache
+
+"""
+Upper bounds (seconds) of the latency histogram buckets
+"""
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SLOW_REQUEST = getattr(settings, 'OV_METRICS_SLOW_REQUEST', 1.0)
+SLOW_QUERIES_LOGGED = 20
+ALLOWED_IPS = getattr(settings, 'OV_METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+UNMATCHED = "unmatched"
+
+logger = logging.getLogger('ov.metrics')
+
+# -------- SQL timing --------
+
+_local = threading.local()
+
+class TimedCursor(object):
+	"""
+	Cursor appending (sql, params, duration) of the executed statements to given list
+	"""
+	def __init__(self, cursor, log):
+		self.cursor = cursor
+		self.log = log
+
+	def execute(self, sql, params=()):
+		start = time.time()
+		try:
+			return self.cursor.execute(sql, params)
+		finally:
+			self.log.append((sql, params, time.time() - start))
+
+	def executemany(self, sql, param_list):
+		start = time.time()
+		try:
+			return self.cursor.executemany(sql, param_list)
+		finally:
+			self.log.append((sql, param_list, time.time() - start))
+
+	def __getattr__(self, attr):
+		return getattr(self.cursor, attr)
+
+	def __iter__(self):
+		return iter(self.cursor)
+
+def _timed(cursor_method):
+	def cursor():
+		cursor = cursor_method()
+		log = getattr(_local, 'queries', None)
+		return cursor if log is None else TimedCursor(cursor, log)
+	return cursor
+
+def instrument_connections():
+	"""
+	Wraps cursor() of all the connections (once) to time the queries of the requests
+	"""
+	for connection in connections.all():
+		if not getattr(connection, 'ov_metrics', False):
+			connection.cursor = _timed(connection.cursor)
+			connection.ov_metrics = True
+
+# -------- URL patterns --------
+
+_routes = None
+
+def _collect(resolver, chain, routes):
+	for pattern in resolver.url_patterns:
+		if isinstance(pattern, RegexURLResolver):
+			_collect(pattern, chain + (pattern.regex,), routes)
+			continue
+		try:
+			callback = pattern.callback
+		except Exception:
+			continue
+		regexes = chain + (pattern.regex,)
+		label = u"".join(regex.pattern.lstrip(u"^") for regex in regexes[1:])
+		routes.setdefault(callback, []).append((regexes, label))
+
+def get_routes():
+	"""
+	Returns {view: [(regular expressions from the root, label), ...]} of the URL patterns of the root URLconf
+	"""
+	global _routes
+	if _routes is None:
+		routes = {}
+		_collect(get_resolver(None), (get_resolver(None).regex,), routes)
+		_routes = routes
+	return _routes
+
+def route_of(path, view):
+	"""
+	Returns label of the URL pattern of given view matching given path (searched like Django resolves it)
+	"""
+	candidates = get_routes().get(view, ())
+	if len(candidates) == 1:
+		return candidates[0][1]
+	for regexes, label in candidates:
+		rest = path
+		for regex in regexes:
+			match = regex.search(rest)
+			if match is None:
+				break
+			rest = rest[match.end():]
+		else:
+			return label
+	return UNMATCHED
+
+# -------- metrics of the process --------
+
+_lock = threading.Lock()
+_metrics = {}
+
+def _new_metrics():
+	return {'buckets': [0] * (len(LATENCY_BUCKETS) + 1), 'seconds': 0.0, 'count': 0, 'statuses': {},
+	        'queries': 0, 'sql_seconds': 0.0, 'serialization_seconds': 0.0, 'bytes': 0}
+
+def record(route, status, seconds, queries, sql_seconds, serialization_seconds, size):
+	with _lock:
+		metrics = _metrics.get(route)
+		if metrics is None:
+			metrics = _metrics[route] = _new_metrics()
+		metrics['buckets'][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+		metrics['seconds'] += seconds
+		metrics['count'] += 1
+		status = "%dxx" % (status // 100)
+		metrics['statuses'][status] = metrics['statuses'].get(status, 0) + 1
+		metrics['queries'] += queries
+		metrics['sql_seconds'] += sql_seconds
+		metrics['serialization_seconds'] += serialization_seconds
+		metrics['bytes'] += size
+
+def get_metrics():
+	"""
+	Returns copy of {route: metrics} of this process
+	"""
+	with _lock:
+		return dict((route, dict(metrics, buckets=list(metrics['buckets']), statuses=dict(metrics['statuses'])))
+		            for route, metrics in _metrics.items())
+
+def reset():
+	with _lock:
+		_metrics.clear()
+
+def _label(value):
+	return unicode(value).replace(u"\\", u"\\\\").replace(u"\"", u"\\\"").replace(u"\n", u"\\n")
+
+def _number(value):
+	return "%d" % value if isinstance(value, (int, long)) else repr(value)
+
+def exposition():
+	"""
+	Returns the metrics of this process in the Prometheus text exposition format
+	"""
+	lines = []
+	def family(name, kind, help):
+		lines.append(u"# HELP %s %s" % (name, help))
+		lines.append(u"# TYPE %s %s" % (name, kind))
+	metrics = sorted(get_metrics().items())
+	family("ov_request_duration_seconds", "histogram", "Latency of the requests per URL pattern.")
+	for route, values in metrics:
+		route = _label(route)
+		count = 0
+		for bound, n in zip(LATENCY_BUCKETS + ("+Inf",), values['buckets']):
+			count += n
+			lines.append(u"ov_request_duration_seconds_bucket{route=\"%s\",le=\"%s\"} %d" % (route, bound, count))
+		lines.append(u"ov_request_duration_seconds_sum{route=\"%s\"} %s" % (route, _number(values['seconds'])))
+		lines.append(u"ov_request_duration_seconds_count{route=\"%s\"} %d" % (route, values['count']))
+	family("ov_responses_total", "counter", "Responses per URL pattern and status class.")
+	for route, values in metrics:
+		for status, n in sorted(values['statuses'].items()):
+			lines.append(u"ov_responses_total{route=\"%s\",status=\"%s\"} %d" % (_label(route), status, n))
+	for name, key, kind, help in (
+			("ov_sql_queries_total", 'queries', "counter", "SQL queries of the requests per URL pattern."),
+			("ov_sql_seconds_total", 'sql_seconds', "counter", "Time of the SQL queries of the requests per URL pattern."),
+			("ov_serialization_seconds_total", 'serialization_seconds', "counter", "Time of serialization and compression of the responses per URL pattern."),
+			("ov_response_bytes_total", 'bytes', "counter", "Size of the (not streamed) responses per URL pattern.")):
+		family(name, kind, help)
+		for route, values in metrics:
+			lines.append(u"%s{route=\"%s\"} %s" % (name, _label(route), _number(values[key])))
+	stats = sorted(rendercache.get_stats().items())
+	for name, key, help in (("ov_render_cache_hits_total", 'hits', "Render cache hits per format."),
+	                        ("ov_render_cache_misses_total", 'misses', "Render cache misses per format.")):
+		family(name, "counter", help)
+		for format, values in stats:
+			lines.append(u"%s{format=\"%s\"} %d" % (name, _label(format), values[key]))
+	return u"\n".join(lines) + u"\n"
+
+# -------- middleware --------
+
+def _response_size(response):
+	if response.has_header('Content-Length'):
+		return int(response['Content-Length'])
+	return len(response.content) if response._is_string else 0
+
+def _log_slow(request, route, seconds, queries):
+	slowest = sorted(queries, key=lambda query: -query[2])[:SLOW_QUERIES_LOGGED]
+	logger.warning(u"Slow request %s %s (%s): %.3f s, %d queries\n%s", request.method, request.get_full_path(), route,
+	               seconds, len(queries), u"\n".join(u"(%.3f) %s; args=%r" % (duration, sql, params)
+	                                                  for sql, params, duration in slowest))
+
+class MetricsMiddleware(object):
+	"""
+	Records the metrics of the requests (should be the first middleware, to measure the others too)
+	"""
+	def __init__(self):
+		instrument_connections()
+
+	def process_request(self, request):
+		request.ov_metrics_start = time.time()
+		_local.queries = []
+
+	def process_view(self, request, view_func, view_args, view_kwargs):
+		request.ov_metrics_route = route_of(request.path_info, view_func)
+
+	def process_response(self, request, response):
+		start = getattr(request, 'ov_metrics_start', None)
+		if start is None:
+			return response
+		queries, _local.queries = getattr(_local, 'queries', None) or [], None
+		seconds = time.time() - start
+		route = getattr(request, 'ov_metrics_route', UNMATCHED)
+		record(route, response.status_code, seconds, len(queries), sum(query[2] for query in queries),
+		       getattr(response, 'serialization_time', 0.0), _response_size(response))
+		if seconds >= SLOW_REQUEST:
+			_log_slow(request, route, seconds, queries)
+		return response
@@ -8,10 +8,140 @@ Created by Sebastian Kruk on .
 Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
 """
 
+import datetime
+
 from django.db import models
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
+from django.db.models.query import QuerySet
+from django.db.models.sql.constants import LOOKUP_SEP
+from django.db.models.fields import FieldDoesNotExist
 from django.contrib import admin
 from ov_django.rdf import RdfClass
 from ov_django.rdf import URI as RdfURI
+from ov_django.ov.uris import URI_HASH_LENGTH, uri_hash, canonical_uri
+
+# --------------------- hashed URIs -----------------------------
+
+def _hashed_uri_lookup(model, key, value):
+	"""
+	Translates exact (and in) lookups on uri of hashed uri models into lookups on uri_hash.
+	Returns (key, value) to use instead, or None if given lookup should stay as it is.
+	"""
+	parts = key.split(LOOKUP_SEP)
+	lookup = None
+	if parts[-1] in ('exact', 'in'):
+		lookup = parts.pop()
+	if not parts or parts[-1] != 'uri' or value is None:
+		return None
+	for name in parts[:-1]:
+		try:
+			field, owner, direct, m2m = model._meta.get_field_by_name(name)
+		except FieldDoesNotExist:
+			return None
+		if not direct:
+			model = field.model
+		elif getattr(field, 'rel', None):
+			model = field.rel.to
+		else:
+			return None
+	if not isinstance(model, type) or not issubclass(model, HashedURIModel):
+		return None
+	parts[-1] = 'uri_hash'
+	if lookup == 'in':
+		return LOOKUP_SEP.join(parts + [lookup]), [uri_hash(v) for v in value]
+	return LOOKUP_SEP.join(parts), uri_hash(value)
+
+def _hashed_uri_q(model, q):
+	"""
+	Returns copy of given Q object with uri lookups translated
+	"""
+	clone = Q()
+	clone.connector = q.connector
+	clone.negated = q.negated
+	for child in q.children:
+		if isinstance(child, Q):
+			clone.children.append(_hashed_uri_q(model, child))
+		else:
+			key, value = child
+			clone.children.append(_hashed_uri_lookup(model, key, value) or child)
+	return clone
+
+class HashedURIQuerySet(QuerySet):
+	"""
+	Queryset transparently redirecting uri equality lookups to the uri_hash index
+	"""
+	def _filter_or_exclude(self, negate, *args, **kwargs):
+		args = [_hashed_uri_q(self.model, arg) if isinstance(arg, Q) else arg for arg in args]
+		for key, value in kwargs.items():
+			translated = _hashed_uri_lookup(self.model, key, value)
+			if translated:
+				del kwargs[key]
+				kwargs[translated[0]] = translated[1]
+		return super(HashedURIQuerySet, self)._filter_or_exclude(negate, *args, **kwargs)
+
+class HashedURIManager(models.Manager):
+	def get_query_set(self):
+		return HashedURIQuerySet(self.model, using=self._db)
+
+class CanonicalURIQuerySet(QuerySet):
+	"""
+	Queryset canonicalizing values of uri equality lookups (for models storing canonical uri in plain column)
+	"""
+	def _filter_or_exclude(self, negate, *args, **kwargs):
+		for key in ('uri', 'uri__exact'):
+			if kwargs.get(key):
+				kwargs[key] = canonical_uri(kwargs[key])
+		if kwargs.get('uri__in'):
+			kwargs['uri__in'] = [canonical_uri(value) for value in kwargs['uri__in']]
+		return super(CanonicalURIQuerySet, self)._filter_or_exclude(negate, *args, **kwargs)
+
+class URIAliasManager(models.Manager):
+	def resolve(self, uri):
+		"""
+		Returns (canonical) uri given uri is an alias of, None if it is not an alias
+		"""
+		aliases = list(self.filter(alias_hash=uri_hash(uri)).values_list('uri', flat=True)[:1])
+		return aliases[0] if aliases else None
+
+class URIAlias(models.Model):
+	"""
+	Legacy variant of a uri which cannot be derived by canonicalization (e.g. old host name)
+	"""
+	alias = models.URLField(max_length=255, verify_exists=False)
+	alias_hash = models.CharField(max_length=URI_HASH_LENGTH, unique=True, editable=False)
+	uri = models.URLField(max_length=255, verify_exists=False)
+	objects = URIAliasManager()
+
+	def save(self, *args, **kwargs):
+		self.alias = canonical_uri(self.alias)
+		self.alias_hash = uri_hash(self.alias)
+		self.uri = canonical_uri(self.uri)
+		super(URIAlias, self).save(*args, **kwargs)
+
+	def __unicode__(self):
+		return "%s -> %s" % (self.alias, self.uri)
+
+class HashedURIModel(models.Model):
+	"""
+	Stores canonical uri (not indexed) with fixed-width hash of it, the unique index of equality lookups
+	(narrower than an index of the uri column itself). Schema changes of existing databases: ov/sql/upgrade_uri_hash.sql
+	"""
+	uri_hash = models.CharField(max_length=URI_HASH_LENGTH, unique=True, null=True, editable=False)
+
+	def hash_uri(self):
+		"""
+		Canonicalizes the uri and updates its hash
+		"""
+		self.uri = canonical_uri(self.uri)
+		self.uri_hash = uri_hash(self.uri)
+
+	def save(self, *args, **kwargs):
+		self.hash_uri()
+		super(HashedURIModel, self).save(*args, **kwargs)
+
+	class Meta:
+		abstract = True
 
 # --------------------- context -----------------------------    
 
@@ -24,6 +154,9 @@ DICT_CONTEXT_TYPE = dict(CONTEXT_TYPE)
 
 
 class ContextManager(models.Manager):
+	def get_query_set(self):
+		return CanonicalURIQuerySet(self.model, using=self._db)
+
 	def search(self, key):
 		results = [] #Publisher.objects.filter(name__icontains=key) | Publisher.objects.filter(address__icontains=key)
 		print "Found %d results for %s" % (len(results), key)
@@ -71,6 +204,7 @@ class Context(models.Model, RdfClass):
 	tags = models.ManyToManyField(Tag, related_name='tag', symmetrical=False, blank=True, null=True)
 	term_uri_pattern = models.CharField(max_length=500, blank=True, null=True, verbose_name="uri pattern")
 	visible = models.BooleanField(default=True)
+	modified = models.DateTimeField(auto_now=True, null=True, editable=False)
 	# additional_properties
 	# tree_properties
 	objects = ContextManager()
@@ -87,6 +221,10 @@ class Context(models.Model, RdfClass):
 	def get_root_entries(self):
 		return Entry.objects.filter(is_root=True, context=self)
 
+	def save(self, *args, **kwargs):
+		self.uri = canonical_uri(self.uri)
+		super(Context, self).save(*args, **kwargs)
+
 	"""
 	Django meta information
 	"""
@@ -145,7 +283,7 @@ class ContextAdmin(admin.ModelAdmin):
 
 # --------------------- URI -----------------------------    
 
-class URIManager(models.Manager):
+class URIManager(HashedURIManager):
 	def search(self, key):
 		results = [] #Publisher.objects.filter(name__icontains=key) | Publisher.objects.filter(address__icontains=key)
 		print "Found %d results for %s" % (len(results), key)
@@ -164,8 +302,8 @@ class URIManager(models.Manager):
 """
 Represents an arbitrary URI
 """    
-class URI(models.Model):
-	uri = models.URLField(max_length=255, verify_exists=False, db_index=True, unique=True)
+class URI(HashedURIModel):
+	uri = models.URLField(max_length=255, verify_exists=False)
 	label = models.CharField(max_length=100, null=True, blank=True)
 	objects = URIManager()
 
@@ -187,7 +325,7 @@ class URIAdmin(admin.ModelAdmin):
 
 # --------------------- Predicate -----------------------------    
 
-class PredicateManager(models.Manager):
+class PredicateManager(HashedURIManager):
 	def search(self, key):
 		results = [] #Publisher.objects.filter(name__icontains=key) | Publisher.objects.filter(address__icontains=key)
 		print "Found %d results for %s" % (len(results), key)
@@ -206,8 +344,8 @@ class PredicateManager(models.Manager):
 """
 Represents an arbitrary URI
 """    
-class Predicate(models.Model):
-	uri = models.URLField(max_length=255, verify_exists=True, db_index=True, unique=True)
+class Predicate(HashedURIModel):
+	uri = models.URLField(max_length=255, verify_exists=True)
 	label = models.CharField(max_length=100, null=True, blank=True)
 	objects = PredicateManager()
 
@@ -263,7 +401,7 @@ DICT_ENTRY_RELATION_TYPES = dict(ENTRY_RELATION_TYPES)
 
 
 
-class EntryManager(models.Manager):
+class EntryManager(HashedURIManager):
 	def search(self, key, value):
 		results = Entry.objects.get(label__icontains=value) #Publisher.objects.filter(name__icontains=key) | Publisher.objects.filter(address__icontains=key)
 		print "Found %d results for %s=%s" % (len(results), key, value)
@@ -279,13 +417,115 @@ class EntryManager(models.Manager):
 			result = None
 		return result
 
-class Entry(models.Model, RdfClass):
+	def prefetch_neighbourhood(self, entries):
+		"""
+		Loads everything RDF output of given entries refers to (context, synset, parent,
+		word senses, narrower entries and related objects) with a fixed number of bulk queries.
+		Returns list of given entries with the neighbourhood cached on them.
+		"""
+		entries = list(entries)
+		ids = [entry.id for entry in entries]
+		if not ids:
+			return entries
+		# -- contexts
+		context_ids = set(entry.context_id for entry in entries if entry.context_id) - \
+		              set(entry.context_id for entry in entries if hasattr(entry, '_context_cache'))
+		contexts = Context.objects.in_bulk(list(context_ids)) if context_ids else {}
+		# -- synsets and parents
+		entry_ids = set(entry.in_synset_id for entry in entries if entry.in_synset_id) | \
+		            set(entry.parent_id for entry in entries if entry.parent_id)
+		referenced = Entry.objects.in_bulk(list(entry_ids)) if entry_ids else {}
+		# -- word senses, narrower entries and related objects
+		prefetched = dict((entry_id, {'word_senses': [], 'childOf': [], 'list_related': []}) for entry_id in ids)
+		through = Entry.word_senses.through
+		for link in through.objects.filter(from_entry__in=ids).select_related('to_entry').order_by('to_entry__label'):
+			prefetched[link.from_entry_id]['word_senses'].append(link.to_entry)
+		for child in Entry.objects.filter(parent__in=ids):
+			prefetched[child.parent_id]['childOf'].append(child)
+		related = Triple.objects.filter(subject__in=ids, predicate__uri=SKOS_RELATED)
+		context_ids = set(entry.context_id for entry in entries)
+		if None not in context_ids:
+			# -- lets PostgreSQL scan only the partitions of these contexts (see ov/partitions.py)
+			related = related.filter(context__in=list(context_ids))
+		for triple in related.select_related('object'):
+			prefetched[triple.subject_id]['list_related'].append(triple.object)
+
+		for entry in entries:
+			if entry.context_id in contexts:
+				entry._context_cache = contexts[entry.context_id]
+			if entry.in_synset_id:
+				entry._in_synset_cache = referenced.get(entry.in_synset_id)
+			if entry.parent_id:
+				entry._parent_cache = referenced.get(entry.parent_id)
+			entry._rdf_prefetched = prefetched[entry.id]
+		return entries
+
+	def synset_dicts(self, synsets):
+		"""
+		Returns list of dictionaries (for JSON output of the REST API) of given synsets (or other entries)
+		with their context, parent and word senses (with their words), built with at most four bulk queries
+		whatever the number of synsets
+		"""
+		synsets = list(synsets)
+		if not synsets:
+			return []
+		ids = [synset.id for synset in synsets]
+		# -- contexts and parents
+		context_ids = set(synset.context_id for synset in synsets if synset.context_id and not hasattr(synset, '_context_cache'))
+		contexts = Context.objects.in_bulk(list(context_ids)) if context_ids else {}
+		for synset in synsets:
+			if hasattr(synset, '_context_cache') and synset.context_id:
+				contexts[synset.context_id] = synset._context_cache
+		parent_ids = set(synset.parent_id for synset in synsets if synset.parent_id)
+		parents = dict((parent['id'], parent) for parent in
+		               Entry.objects.filter(pk__in=list(parent_ids)).values('id', 'label', 'uri')) if parent_ids else {}
+		# -- word senses and their words
+		senses = dict((synset_id, []) for synset_id in ids)
+		words = {}
+		for synset_id, sense_id, label, tag_count in Entry.word_senses.through.objects.filter(from_entry__in=ids) \
+		        .values_list('from_entry', 'to_entry', 'to_entry__label', 'to_entry__tag_count').order_by('to_entry__label'):
+			senses[synset_id].append({'id': sense_id, 'label': label, 'tag_count': tag_count, 'words': words.setdefault(sense_id, [])})
+		if words:
+			for sense_id, word_id, lexical_form in Entry.words.through.objects.filter(from_entry__in=list(words)) \
+			        .values_list('from_entry', 'to_entry', 'to_entry__lexical_form'):
+				words[sense_id].append({'id': word_id, 'lexical_form': lexical_form})
+
+		result = []
+		for synset in synsets:
+			context = contexts.get(synset.context_id)
+			result.append({
+				'id': synset.id,
+				'label': synset.label,
+				'gloss': synset.gloss or synset.description,
+				'uri': synset.uri,
+				'is_root': synset.is_root,
+				'synset_id': synset.synset_id,
+				'pos': synset.pos,
+				'context': context and {'id': context.id, 'uri': context.uri, 'lang': context.lang},
+				'parent': parents.get(synset.parent_id),
+				'word_senses': senses[synset.id],
+			})
+		return result
+
+	def to_rdf(self, entries):
+		"""
+		Returns RDF (Turtle) representation of given entries using constant number of queries
+		"""
+		entries = self.prefetch_neighbourhood(entries)
+		if not entries:
+			return ""
+		plan = entries[0].get_rdf_plan()
+		return plan.head + "".join(plan.to_turtle(entry) for entry in entries)
+
+SKOS_RELATED = "http://www.w3.org/2004/02/skos/core#related"
+
+class Entry(HashedURIModel, RdfClass):
 	"""
 	Represents the dictionary entry
 	"""
 	label = models.CharField(max_length=255, null=True)
 	description = models.TextField(blank=True, null=True)
-	uri = models.URLField(max_length=255, verify_exists=False, db_index=True, unique=True)
+	uri = models.URLField(max_length=255, verify_exists=False)
 	context = models.ForeignKey(Context, null=True)
 	is_root = models.BooleanField(default=False)
 	# -- thesaurus --
@@ -310,8 +550,28 @@ class Entry(models.Model, RdfClass):
 	triples = models.ManyToManyField(Predicate, related_name='triples', symmetrical=False, through='Triple', blank=True, null=True)
 	types = models.ManyToManyField(URI, related_name='types', symmetrical=False, blank=True, null=True)
 	#
+	modified = models.DateTimeField(auto_now=True, null=True, db_index=True, editable=False)
 	objects = EntryManager()
 
+	def __init__(self, *args, **kwargs):
+		super(Entry, self).__init__(*args, **kwargs)
+		# -- context stored in the database (see save)
+		self._stored_context_id = self.context_id
+
+	def save(self, *args, **kwargs):
+		"""
+		Saves the entry; triples and references of an entry moved to another context follow it (their
+		context is the partition key, see ov/partitions.py) unless propagate_context is False - the
+		importer moves them in bulk at the end of the import
+		"""
+		propagate = kwargs.pop('propagate_context', True)
+		moved = self.pk is not None and self.context_id != self._stored_context_id
+		super(Entry, self).save(*args, **kwargs)
+		if moved and propagate:
+			Triple.objects.filter(subject=self).update(context=self.context_id)
+			EntryReference.objects.filter(subject=self).update(context=self.context_id)
+		self._stored_context_id = self.context_id
+
 	def __unicode__(self):
 		"""
 		to-string representation
@@ -324,6 +584,12 @@ class Entry(models.Model, RdfClass):
 		else:
 			return "%s [%s | !!!]" % (self.get_label(), self.uri)
 
+	def prepare_synset_dict(self):
+		"""
+		Returns dictionary of this synset for JSON output (see EntryManager.synset_dicts)
+		"""
+		return Entry.objects.synset_dicts([self])[0]
+
 	def get_sub_entries(self):
 		"""
 		Returns array of entries that are children of this one in the tree
@@ -356,11 +622,13 @@ class Entry(models.Model, RdfClass):
 			return self.label
 		return self.uri
 
-	def list_related(self, prop="http://www.w3.org/2004/02/skos/core#related"):
+	def list_related(self, prop=SKOS_RELATED):
 		"""
 		Lists objects related via given property
 		"""
-		return [e.object for e in Triple.objects.filter(subject=self,
+		if prop == SKOS_RELATED and hasattr(self, '_rdf_prefetched'):
+			return self._rdf_prefetched['list_related']
+		return [e.object for e in Triple.objects.filter(subject=self, context=self.context_id,
 		                                         predicate__uri=prop)
 												.order_by("predicate")]
 
@@ -453,6 +721,12 @@ class EntryReference(models.Model):
 	subject = models.ForeignKey(Entry, related_name='ref_subject')
 	object = models.ForeignKey(Entry, related_name='ref_object')
 	relation = models.CharField(max_length=30, choices=ENTRY_RELATION_TYPES)
+	context = models.ForeignKey(Context, null=True, blank=True, editable=False) #copy of subject.context (partition key)
+	objects = HashedURIManager()
+
+	def save(self, *args, **kwargs):
+		self.context_id = self.subject.context_id
+		super(EntryReference, self).save(*args, **kwargs)
 
 	"""
 	to-string representation
@@ -470,6 +744,25 @@ class Triple(models.Model):
 	literal = models.CharField(max_length=1000, null=True, blank=True)
 	literal_type = models.ForeignKey(URI, related_name='triple_literal_type', null=True, blank=True)
 	literal_lang = models.CharField(max_length=10, null=True, blank=True)
+	context = models.ForeignKey(Context, null=True, blank=True, editable=False) #copy of subject.context (partition key)
+	objects = HashedURIManager()
+
+	def save(self, *args, **kwargs):
+		self.context_id = self.subject.context_id
+		super(Triple, self).save(*args, **kwargs)
+
+def _touch_entries(sender, instance, **kwargs):
+	"""
+	Marks the entries of a saved or deleted statement as modified (see staticsite.changed_entry_ids)
+	"""
+	ids = [ instance.subject_id ]
+	if sender is EntryReference:
+		ids.append(instance.object_id)
+	Entry.objects.filter(pk__in=ids).update(modified=datetime.datetime.now())
+
+for model in (Triple, EntryReference):
+	post_save.connect(_touch_entries, sender=model, dispatch_uid="ov_touch_%s_save" % model.__name__)
+	post_delete.connect(_touch_entries, sender=model, dispatch_uid="ov_touch_%s_delete" % model.__name__)
 
 
 class EntryAdmin(admin.ModelAdmin):
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# encoding: utf-8
+"""
+negotiation.py
+
+Content negotiation of the linked data end-points: registry of RDF serializers keyed
+by media type and Accept header parsing (with quality values, RFC 2616 14.1).
+
+All the serializers write from the compiled RdfPlan of the serialized classes and yield
+UTF-8 encoded pieces, so they can stream whole vocabularies as well as single entries.
+
+Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
+"""
+
+import simplejson as json
+
+from ov_django.rdf import TURTLE_NS_HEAD, RDFXML_HEAD, RDFXML_FOOT
+
+class RdfSerializer(object):
+	"""
+	Base of the serializers: subclasses define name, media types (the preferred one first),
+	file extension and override head(), node() and foot()
+	"""
+	name = None
+	media_types = ()
+	extension = None
+	separator = u""
+
+	def head(self, plans):
+		return u""
+
+	def node(self, plan, obj):
+		raise NotImplementedError
+
+	def foot(self):
+		return u""
+
+	def serialize(self, plans, chunks):
+		"""
+		Yields UTF-8 encoded pieces of the serialization of given chunks (lists of RdfConcept objects),
+		plans are these of all the classes of the objects
+		"""
+		yield self.head(plans).encode('utf-8')
+		first = True
+		for chunk in chunks:
+			pieces = []
+			for obj in chunk:
+				if not first:
+					pieces.append(self.separator)
+				first = False
+				pieces.append(self.node(obj.get_rdf_plan(), obj))
+			yield u"".join(pieces).encode('utf-8')
+		yield self.foot().encode('utf-8')
+
+class TurtleSerializer(RdfSerializer):
+	name = 'ttl'
+	media_types = ('text/turtle', 'application/x-turtle')
+	extension = 'ttl'
+
+	def head(self, plans):
+		prefixes = set()
+		for plan in plans:
+			prefixes.update(plan.prefixes)
+		return u"".join(TURTLE_NS_HEAD % (prefix, ns) for ns, prefix in sorted(prefixes, key=lambda (ns, prefix): prefix))
+
+	def node(self, plan, obj):
+		return plan.to_turtle(obj)
+
+class NTriplesSerializer(RdfSerializer):
+	name = 'nt'
+	media_types = ('application/n-triples',)
+	extension = 'nt'
+
+	def node(self, plan, obj):
+		return plan.to_ntriples(obj)
+
+class RdfXmlSerializer(RdfSerializer):
+	name = 'rdf'
+	media_types = ('application/rdf+xml',)
+	extension = 'rdf'
+
+	def head(self, plans):
+		namespaces = {}
+		for plan in plans:
+			namespaces.update(plan.xml_namespaces())
+		return RDFXML_HEAD % u"".join(u'\n\txmlns:%s="%s"' % item for item in sorted(namespaces.items()))
+
+	def node(self, plan, obj):
+		return plan.to_rdfxml(obj)
+
+	def foot(self):
+		return RDFXML_FOOT
+
+class JsonLdSerializer(RdfSerializer):
+	name = 'jsonld'
+	media_types = ('application/ld+json',)
+	extension = 'jsonld'
+	separator = u",\n"
+
+	def head(self, plans):
+		context = {}
+		for plan in plans:
+			context.update(plan.jsonld_context())
+		return u'{"@context": %s,\n"@graph": [\n' % json.dumps(context)
+
+	def node(self, plan, obj):
+		return json.dumps(plan.to_jsonld(obj))
+
+	def foot(self):
+		return u"\n]}\n"
+
+"""
+Registered serializers, in the order of preference of the server
+"""
+SERIALIZERS = []
+SERIALIZERS_BY_NAME = {}
+SERIALIZERS_BY_MEDIA_TYPE = {}
+
+def register(serializer):
+	SERIALIZERS.append(serializer)
+	SERIALIZERS_BY_NAME[serializer.name] = serializer
+	for media_type in serializer.media_types:
+		SERIALIZERS_BY_MEDIA_TYPE[media_type] = serializer
+
+for serializer in (TurtleSerializer(), NTriplesSerializer(), RdfXmlSerializer(), JsonLdSerializer()):
+	register(serializer)
+
+DEFAULT_SERIALIZER = SERIALIZERS_BY_NAME['ttl']
+
+def rdf_media_types():
+	"""
+	Returns media types of all the registered serializers, in the order of preference
+	"""
+	return [ media_type for serializer in SERIALIZERS for media_type in serializer.media_types ]
+
+# -------- Accept header --------
+
+def parse_accept(header):
+	"""
+	Returns list of (media range, quality) of given Accept header; malformed parts are skipped
+	"""
+	result = []
+	for part in (header or "").split(","):
+		params = part.split(";")
+		media_range = params[0].strip().lower()
+		if media_range.count("/") != 1:
+			continue
+		quality = 1.0
+		for param in params[1:]:
+			name, _, value = param.partition("=")
+			if name.strip().lower() == "q":
+				try:
+					quality = min(max(float(value), 0.0), 1.0)
+				except ValueError:
+					quality = 0.0
+		result.append((media_range, quality))
+	return result
+
+def _quality(ranges, media_type):
+	"""
+	Returns quality of given media type - that of the most specific matching range (0 if none matches)
+	"""
+	major = media_type.split("/")[0] + "/*"
+	best, quality = -1, 0.0
+	for media_range, q in ranges:
+		if media_range == media_type:
+			specificity = 2
+		elif media_range == major:
+			specificity = 1
+		elif media_range == "*/*":
+			specificity = 0
+		else:
+			continue
+		if specificity > best:
+			best, quality = specificity, q
+	return quality
+
+def negotiate(header, offered):
+	"""
+	Returns the offered media type (list in the order of preference of the server) best accepted
+	by given Accept header, None if none is acceptable. Missing header accepts anything.
+	"""
+	if not header or not header.strip():
+		return offered[0] if offered else None
+	ranges = parse_accept(header)
+	best, best_quality = None, 0.0
+	for media_type in offered:
+		quality = _quality(ranges, media_type)
+		if quality > best_quality:
+			best, best_quality = media_type, quality
+	return best
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# encoding: utf-8
+"""
+paging.py
+
+Keyset (seek) pagination: a page starts right after the (value, primary key) of the last
+object of the previous page instead of skipping OFFSET rows, so any page costs the same
+as the first one no matter how deep it is.
+
+Cursors are opaque URL-safe strings. Objects with NULL in the ordering field come after all
+the others (the same on every database). Pages can be read forwards (after a cursor)
+and backwards (before a cursor).
+
+Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
+"""
+
+import base64
+import datetime
+
+from django.db.models import Q
+import simplejson as json
+
+def encode_cursor(value, pk):
+	"""
+	Returns cursor pointing right after the object with given ordering value and primary key
+	"""
+	if isinstance(value, (datetime.date, datetime.datetime)):
+		value = value.isoformat()
+	return base64.urlsafe_b64encode(json.dumps([value, pk]))
+
+def decode_cursor(cursor):
+	"""
+	Returns (value, pk) of given cursor; raises ValueError if it is malformed
+	"""
+	try:
+		value, pk = json.loads(base64.urlsafe_b64decode(str(cursor)))
+		return value, int(pk)
+	except (TypeError, ValueError, UnicodeError):
+		raise ValueError("Malformed cursor: %r" % cursor)
+
+def _after(field, value, pk):
+	return Q(**{field + '__gt': value}) | Q(**{field: value, 'pk__gt': pk})
+
+def _before(field, value, pk):
+	return Q(**{field + '__lt': value}) | Q(**{field: value, 'pk__lt': pk})
+
+def keyset_page(queryset, field, cursor=None, size=50):
+	"""
+	Returns (objects, next cursor) of the page of given queryset ordered by (field, pk) that starts
+	after given cursor. The next cursor is None on the last page.
+	"""
+	model_field = queryset.model._meta.get_field(field)
+	after = decode_cursor(cursor) if cursor else None
+	objects = []
+	# -- objects with the field set
+	if after is None or after[0] is not None:
+		page = queryset.filter(**{field + '__isnull': False}) if model_field.null else queryset
+		if after:
+			page = page.filter(_after(field, *after))
+		objects = list(page.order_by(field, 'pk')[:size + 1])
+	# -- then objects without it
+	if model_field.null and len(objects) <= size:
+		page = queryset.filter(**{field + '__isnull': True})
+		if after and after[0] is None:
+			page = page.filter(pk__gt=after[1])
+		objects += list(page.order_by('pk')[:size + 1 - len(objects)])
+	if len(objects) <= size:
+		return objects, None
+	objects = objects[:size]
+	return objects, cursor_of(objects[-1], model_field)
+
+def keyset_union_page(querysets, field, cursor=None, size=50):
+	"""
+	Returns (objects, next cursor) of the page of the union of given querysets (of the same model) ordered
+	by (field, pk) starting after given cursor. Each queryset is read with its own keyset query (so each
+	can use its own index instead of one OR condition); objects in more than one of them come once.
+	"""
+	model_field = querysets[0].model._meta.get_field(field)
+	merged = {}
+	more = False
+	for queryset in querysets:
+		objects, next = keyset_page(queryset, field, cursor, size)
+		more = more or next is not None
+		for obj in objects:
+			merged[obj.pk] = obj
+	# -- NULLs last, as in keyset_page
+	objects = sorted(merged.values(), key=lambda obj: (getattr(obj, model_field.attname) is None, getattr(obj, model_field.attname), obj.pk))
+	if len(objects) <= size and not more:
+		return objects, None
+	objects = objects[:size]
+	return objects, cursor_of(objects[-1], model_field)
+
+def keyset_page_before(queryset, field, cursor, size=50):
+	"""
+	Returns (objects, previous cursor) of the page of given queryset ordered by (field, pk) that ends
+	right before given cursor. The previous cursor is None on the first page.
+	"""
+	model_field = queryset.model._meta.get_field(field)
+	value, pk = decode_cursor(cursor)
+	objects = []
+	# -- walking backwards: objects without the field first
+	if model_field.null and value is None:
+		objects = list(queryset.filter(pk__lt=pk, **{field + '__isnull': True}).order_by('-pk')[:size + 1])
+	if len(objects) <= size:
+		page = queryset.filter(**{field + '__isnull': False}) if model_field.null else queryset
+		if value is not None:
+			page = page.filter(_before(field, value, pk))
+		objects += list(page.order_by('-' + field, '-pk')[:size + 1 - len(objects)])
+	objects.reverse()
+	if len(objects) <= size:
+		return objects, None
+	objects = objects[1:]
+	return objects, cursor_of(objects[0], model_field)
+
+def cursor_of(obj, model_field):
+	return encode_cursor(getattr(obj, model_field.attname), obj.pk)
+
+class KeysetPage(object):
+	"""
+	Page of objects browsed with next/previous cursors (in place of django.core.paginator.Page).
+	number and num_pages are known only if the total was counted.
+	"""
+	def __init__(self, object_list, next_cursor, previous_cursor, number=None, total=None, size=None):
+		self.object_list = object_list
+		self.next_cursor = next_cursor
+		self.previous_cursor = previous_cursor
+		self.number = number
+		self.total = total
+		self.num_pages = (total + size - 1) // size if total is not None and size else None
+
+	def has_next(self):
+		return self.next_cursor is not None
+
+	def has_previous(self):
+		return self.previous_cursor is not None
+
+	def __len__(self):
+		return len(self.object_list)
+
+def browse(queryset, field, after=None, before=None, size=50, number=None, total=None):
+	"""
+	Returns KeysetPage of given queryset ordered by (field, pk): the page after the cursor after,
+	before the cursor before, or the first page
+	"""
+	model_field = queryset.model._meta.get_field(field)
+	if before:
+		objects, previous_cursor = keyset_page_before(queryset, field, before, size)
+		next_cursor = cursor_of(objects[-1], model_field) if objects else None
+	else:
+		objects, next_cursor = keyset_page(queryset, field, after, size)
+		previous_cursor = cursor_of(objects[0], model_field) if objects and after else None
+	return KeysetPage(objects, next_cursor, previous_cursor, number, total, size)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# encoding: utf-8
+"""
+partitions.py
+
+PostgreSQL (11+) LIST partitioning of the big statement tables (Triple, EntryReference)
+by context_id (a copy of the context of their subject). Each vocabulary (or a group of
+vocabularies) lives in its own partition, everything else stays in the default partition.
+
+Reloading a vocabulary becomes detach + drop of its partition instead of a massive DELETE,
+and a partition prepared elsewhere (e.g. with COPY) can be swapped in atomically.
+
+NOTE: partitioned tables cannot be referenced by foreign keys without the partition key,
+so converting a table drops the foreign key constraints pointing to it
+(integrity is kept by the application).
+
+NOTE: for the same reason a unique index of a partitioned table must contain the partition key.
+Entry stays a plain table: uri_hash must stay unique across all contexts (Entry.objects.get(uri=...)
+and get_or_create of the importer and the resolver rely on it). The statement tables have no unique
+indexes besides the primary key; their ids come from one sequence and are unique per partition.
+
+Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
+"""
+
+import re
+
+from ov_django.ov.models import Entry, Triple, EntryReference
+
+"""
+Models partitioned by context_id (not Entry, see the note above)
+"""
+PARTITIONED_MODELS = (Triple, EntryReference)
+
+PARTITION_KEY = 'context_id'
+
+RE_INDEX_DEF = re.compile(r"^CREATE (UNIQUE )?INDEX (\S+) ON (\S+) ")
+
+def partitioned_tables():
+	return [model._meta.db_table for model in PARTITIONED_MODELS]
+
+def partition_name(table, name):
+	"""
+	Returns name of the partition table (name is context id or name of the group)
+	"""
+	return "%s_p_%s" % (table, name)
+
+def default_partition_name(table):
+	return "%s_p_default" % table
+
+def _in_list(context_ids):
+	return ", ".join("%d" % int(cid) for cid in context_ids)
+
+def backfill_sql(table):
+	"""
+	Returns statements copying context of the subjects to the rows of given table of statements (Triple,
+	EntryReference) where it differs, e.g. rows stored before the column existed
+	"""
+	return [ 'UPDATE "%s" t SET %s = e.context_id FROM "%s" e WHERE e.id = t.subject_id AND t.%s IS DISTINCT FROM e.context_id'
+	         % (table, PARTITION_KEY, Entry._meta.db_table, PARTITION_KEY) ]
+
+def convert_sql(cursor, table):
+	"""
+	Returns statements converting given plain table of statements into a table partitioned by context
+	(rows are moved to the partitions of their subjects)
+	"""
+	old = "%s_unpartitioned" % table
+	statements = backfill_sql(table)
+	# -- foreign keys pointing to this table cannot stay
+	cursor.execute("""
+		SELECT c.conrelid::regclass::text, c.conname
+		FROM pg_constraint c
+		WHERE c.contype = 'f' AND c.confrelid = %s::regclass""", [table])
+	for referencing, constraint in cursor.fetchall():
+		statements.append('ALTER TABLE "%s" DROP CONSTRAINT "%s"' % (referencing, constraint))
+	# -- indexes are recreated on the partitioned table (as non unique, uniqueness
+	# -- across partitions would require the partition key to be a part of the index)
+	cursor.execute("""
+		SELECT indexdef FROM pg_indexes
+		WHERE tablename = %s AND indexname NOT LIKE '%%_pkey'""", [table])
+	indexes = [RE_INDEX_DEF.sub('CREATE INDEX "\\2_p" ON "%s" ' % table, definition)
+	           for (definition,) in cursor.fetchall()]
+	statements += [
+		'ALTER TABLE "%s" RENAME TO "%s"' % (table, old),
+		'CREATE TABLE "%s" (LIKE "%s" INCLUDING DEFAULTS) PARTITION BY LIST (%s)' % (table, old, PARTITION_KEY),
+		'ALTER SEQUENCE "%s_id_seq" OWNED BY "%s".id' % (table, table),
+		'CREATE TABLE "%s" PARTITION OF "%s" DEFAULT' % (default_partition_name(table), table),
+		'CREATE UNIQUE INDEX "%s_id" ON "%s" (id)' % (default_partition_name(table), default_partition_name(table)),
+	]
+	statements += indexes + [
+		'INSERT INTO "%s" SELECT * FROM "%s"' % (table, old),
+		'DROP TABLE "%s"' % old,
+	]
+	return statements
+
+def create_sql(table, name, context_ids):
+	"""
+	Returns statements creating a partition for given contexts and moving their rows from the default partition
+	"""
+	partition = partition_name(table, name)
+	ids = _in_list(context_ids)
+	return [
+		'CREATE TABLE "%s" (LIKE "%s" INCLUDING DEFAULTS)' % (partition, table),
+		'INSERT INTO "%s" SELECT * FROM "%s" WHERE %s IN (%s)' % (partition, default_partition_name(table), PARTITION_KEY, ids),
+		'DELETE FROM "%s" WHERE %s IN (%s)' % (default_partition_name(table), PARTITION_KEY, ids),
+		'CREATE UNIQUE INDEX "%s_id" ON "%s" (id)' % (partition, partition),
+	] + attach_sql(table, name, context_ids)
+
+def attach_sql(table, name, context_ids):
+	"""
+	Returns statements attaching given (standalone) partition table.
+	The check constraint lets PostgreSQL skip the validation scan.
+	"""
+	partition = partition_name(table, name)
+	ids = _in_list(context_ids)
+	return [
+		'ALTER TABLE "%s" ADD CONSTRAINT "%s_key" CHECK (%s IS NOT NULL AND %s IN (%s))' % (partition, partition, PARTITION_KEY, PARTITION_KEY, ids),
+		'ALTER TABLE "%s" ATTACH PARTITION "%s" FOR VALUES IN (%s)' % (table, partition, ids),
+		'ALTER TABLE "%s" DROP CONSTRAINT "%s_key"' % (partition, partition),
+	]
+
+def detach_sql(table, name):
+	"""
+	Returns statements detaching given partition (its rows disappear from the table at once)
+	"""
+	return [ 'ALTER TABLE "%s" DETACH PARTITION "%s"' % (table, partition_name(table, name)) ]
+
+def drop_sql(table, name):
+	"""
+	Returns statements detaching and dropping given partition (instead of row by row DELETE)
+	"""
+	return detach_sql(table, name) + [ 'DROP TABLE "%s"' % partition_name(table, name) ]
+
+def swap_sql(table, name, context_ids, staging):
+	"""
+	Returns statements replacing given partition with the staging table (loaded elsewhere, e.g. with COPY)
+	"""
+	partition = partition_name(table, name)
+	return detach_sql(table, name) + [
+		'ALTER TABLE "%s" RENAME TO "%s_old"' % (partition, partition),
+		'ALTER TABLE "%s" RENAME TO "%s"' % (staging, partition),
+	] + attach_sql(table, name, context_ids) + [
+		'DROP TABLE "%s_old"' % partition,
+	]
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# encoding: utf-8
+"""
+rendercache.py
+
+Cache of rendered representations (Turtle, HTML, JSON) of entries and of values
+(counts) derived from whole contexts.
+
+Keys contain the modification stamp of the context read from the database (Context.modified,
+the one of the HTTP validators, see ov/conditional.py). Any write to an Entry, Triple or
+EntryReference touches the stamp of its context (Context saves set it themselves), so all the
+renderings of that context become unreachable at once (rendered entries refer to their neighbours).
+Imports suspend the invalidation and touch the stamps of the touched contexts only once at the end.
+
+The store is any Django cache (settings.OV_RENDER_CACHE names the alias: local memory,
+file based, memcached, ...). As the stamps live in the database, writes of other processes
+(e.g. imports run from the command line) make the renderings of every store stale too.
+
+Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
+"""
+
+import datetime
+import threading
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.db.models.signals import post_save, post_delete, m2m_changed
+
+from ov_django.ov.models import Context, Entry, Triple, EntryReference
+from ov_django.ov.conditional import entry_stamp
+
+RENDER_TIMEOUT = getattr(settings, 'OV_RENDER_CACHE_TIMEOUT', 24 * 60 * 60)
+
+_cache = None
+_stats = {}
+# -- contexts invalidated while suspended, per thread (an import must not swallow the writes of requests)
+_local = threading.local()
+
+def get_store():
+	global _cache
+	if _cache is None:
+		_cache = get_cache(getattr(settings, 'OV_RENDER_CACHE', 'default'))
+	return _cache
+
+def _version(stamp):
+	return stamp.isoformat() if stamp else "none"
+
+def get_context_version(context_id):
+	"""
+	Returns current version stamp of given context (of its modification stamp in the database)
+	"""
+	stamps = Context.objects.filter(pk=context_id).values_list('modified', flat=True)
+	return _version(stamps[0] if stamps else None)
+
+def invalidate_context(context_id):
+	"""
+	Makes all rendered entries of given context stale by updating its modification stamp
+	"""
+	suspended = getattr(_local, 'suspended', None)
+	if suspended is not None:
+		suspended.add(context_id)
+	elif context_id:
+		Context.objects.filter(pk=context_id).update(modified=datetime.datetime.now())
+
+def suspend_invalidation():
+	"""
+	Collects invalidated contexts instead of invalidating them one write at a time (bulk imports)
+	"""
+	if getattr(_local, 'suspended', None) is None:
+		_local.suspended = set()
+
+def resume_invalidation():
+	"""
+	Invalidates all the contexts touched since suspend_invalidation()
+	"""
+	touched = getattr(_local, 'suspended', None) or set()
+	_local.suspended = None
+	for context_id in touched:
+		invalidate_context(context_id)
+
+def _get(key, kind, compute):
+	store = get_store()
+	content = store.get(key)
+	stats = _stats.setdefault(kind, {'hits': 0, 'misses': 0})
+	if content is None:
+		stats['misses'] += 1
+		content = compute()
+		store.set(key, content, RENDER_TIMEOUT)
+	else:
+		stats['hits'] += 1
+	return content
+
+def get_rendered(entry, format, render):
+	"""
+	Returns cached rendering of given entry in given format, calls render() to create it if needed
+	(keyed on the stamp of the HTTP validators, the context is usually loaded by the view already)
+	"""
+	return _get("ov:render:%s:%s:%s" % (format, entry.pk, _version(entry_stamp(entry))), format, render)
+
+def get_context_value(context_id, name, compute):
+	"""
+	Returns cached value (e.g. a count) derived from given context, calls compute() to create it if needed
+	"""
+	return _get("ov:value:%s:%s:%s" % (name, context_id, get_context_version(context_id)), name, compute)
+
+def get_stats():
+	"""
+	Returns hits, misses and hit rate of this process, per format
+	"""
+	result = {}
+	for format, stats in _stats.items():
+		total = stats['hits'] + stats['misses']
+		result[format] = dict(stats, hit_rate=float(stats['hits']) / total if total else 0.0)
+	return result
+
+# -------- invalidation on write --------
+
+def _on_change(sender, instance, **kwargs):
+	invalidate_context(getattr(instance, 'context_id', None))
+
+# -- saves of a Context set its stamp themselves
+for model in (Entry, Triple, EntryReference):
+	post_save.connect(_on_change, sender=model, dispatch_uid="ov_render_%s_save" % model.__name__)
+	post_delete.connect(_on_change, sender=model, dispatch_uid="ov_render_%s_delete" % model.__name__)
+for relation in (Entry.word_senses, Entry.words, Entry.meanings, Entry.types):
+	m2m_changed.connect(_on_change, sender=relation.through, dispatch_uid="ov_render_%s_m2m" % relation.through.__name__)
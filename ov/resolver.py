@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# encoding: utf-8
+"""
+resolver.py
+
+Resolves any form of a URI (see canonical_uri in ov/uris.py) or its registered legacy
+alias (URIAlias) to the Context or Entry it identifies, with one indexed equality lookup
+per model (and one more on the alias table if the URI is not known).
+
+resolve_many() does the same for a batch of URIs with IN lookups, so the number of queries
+does not depend on the number of URIs (only on the number of chunks of CHUNK_SIZE).
+
+Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
+"""
+
+from ov_django.ov.models import Context, Entry, URIAlias
+from ov_django.ov.uris import canonical_uri, uri_hash
+
+"""
+Maximal number of values in one IN lookup (SQLite allows 999 query parameters)
+"""
+CHUNK_SIZE = 500
+
+def chunks(values, size=CHUNK_SIZE):
+	values = list(values)
+	for i in xrange(0, len(values), size):
+		yield values[i:i + size]
+
+def _lookup(uri, models):
+	for model in models:
+		queryset = model.objects.filter(uri=uri)
+		if model is Entry:
+			queryset = queryset.select_related('context')
+		found = list(queryset[:1])
+		if found:
+			return found[0]
+	return None
+
+def resolve(uri, models=(Context, Entry)):
+	"""
+	Returns object of the first of given models identified by given uri, None if there is none
+	"""
+	if not uri:
+		return None
+	uri = canonical_uri(uri)
+	result = _lookup(uri, models)
+	if result is None:
+		target = URIAlias.objects.resolve(uri)
+		if target:
+			result = _lookup(target, models)
+	return result
+
+def _lookup_many(uris, models):
+	"""
+	Returns {canonical uri: object} of given canonical uris (the first of given models wins)
+	"""
+	found = {}
+	for model in models:
+		missing = [uri for uri in uris if uri not in found]
+		for chunk in chunks(missing):
+			queryset = model.objects.filter(uri__in=chunk)
+			if model is Entry:
+				queryset = queryset.select_related('context')
+			for obj in queryset:
+				found.setdefault(obj.uri, obj)
+	return found
+
+def resolve_many(uris, models=(Context, Entry)):
+	"""
+	Returns {uri: object or None} for given uris (any form, see resolve())
+	"""
+	canonical = dict((uri, canonical_uri(uri)) for uri in uris if uri)
+	found = _lookup_many(set(canonical.values()), models)
+	# -- legacy aliases of the unknown ones
+	missing = dict((uri_hash(uri), uri) for uri in set(canonical.values()) if uri not in found)
+	if missing:
+		targets = {}
+		for chunk in chunks(missing):
+			for alias_hash, target in URIAlias.objects.filter(alias_hash__in=chunk).values_list('alias_hash', 'uri'):
+				targets[missing[alias_hash]] = target
+		resolved = _lookup_many(set(targets.values()), models)
+		for uri, target in targets.items():
+			if target in resolved:
+				found[uri] = resolved[target]
+	return dict((uri, found.get(canonical.get(uri))) for uri in uris)
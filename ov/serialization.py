@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# encoding: utf-8
+"""
+serialization.py
+
+Serialization of the REST API responses: the encoder is chosen by the Accept header (or the
+format GET argument, like piston does) and large responses are compressed if the client accepts it.
+Handlers return DataResponse (serialized here) or models (serialized by piston emitters, MsgpackEmitter
+is registered for them).
+
+	application/json                           - compact JSON (the default)
+	application/x-msgpack, application/msgpack - MessagePack (http://msgpack.org), binary and
+	                                             about a fifth smaller than JSON for synset dictionaries
+
+MessagePack is written and read by the C extension of the msgpack package (see requirements.txt),
+strings of both str and unicode as the UTF-8 string type; dates are written as ISO 8601 strings
+like in JSON.
+
+Responses of at least COMPRESS_MIN_SIZE bytes are compressed with gzip or deflate, as asked for
+by the Accept-Encoding header, smaller ones are not worth the CPU.
+
+Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
+"""
+
+import zlib
+import time
+import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from piston.emitters import Emitter
+from piston.utils import Mimer
+import simplejson as json
+import msgpack
+
+from ov_django.ov.negotiation import negotiate
+from ov_django.ov.constants import CONTENT_TYPE_TO_SERIALIZATION, SERIALIZATION_CONTENT_TYPES, DEFAULT_SERIALIZATION_TYPE
+
+COMPRESS_MIN_SIZE = getattr(settings, 'OV_COMPRESS_MIN_SIZE', 1024)
+COMPRESS_LEVEL = getattr(settings, 'OV_COMPRESS_LEVEL', 6)
+
+MSGPACK_MEDIA_TYPES = ('application/x-msgpack', 'application/msgpack')
+
+class SerializationError(TypeError):
+	pass
+
+# -------- MessagePack --------
+
+def _default(obj):
+	if isinstance(obj, (datetime.date, datetime.time)):
+		return obj.isoformat()
+	if isinstance(obj, Decimal):
+		return float(obj)
+	raise SerializationError("Cannot serialize %r" % (obj,))
+
+def packb(obj):
+	"""
+	Returns MessagePack encoding (str) of given object
+	"""
+	return msgpack.packb(obj, default=_default, use_bin_type=False)
+
+def unpackb(data):
+	"""
+	Returns object decoded from given MessagePack encoding
+	"""
+	return msgpack.unpackb(data, raw=False)
+
+# -------- encoders --------
+
+def json_dumps(data):
+	return json.dumps(data, separators=(',', ':'), default=_default)
+
+"""
+Encoders of the API responses (piston emitters serialize models): format -> (encoder, media type)
+"""
+ENCODERS = {
+	'json'    : (json_dumps, "application/json"),
+	'msgpack' : (packb, MSGPACK_MEDIA_TYPES[0]),
+}
+
+def response_format(request, formats=None):
+	"""
+	Returns name of the format asked for by given request: format GET argument or that of the best
+	accepted content type (see ov/constants.py), of given formats (any by default); JSON if none is acceptable
+	"""
+	format = request.GET.get('format', None)
+	if format and (formats is None or format in formats):
+		return format
+	offered = [ content_type for content_type in SERIALIZATION_CONTENT_TYPES
+	            if formats is None or CONTENT_TYPE_TO_SERIALIZATION[content_type] in formats ]
+	content_type = negotiate(request.META.get('HTTP_ACCEPT'), offered)
+	return CONTENT_TYPE_TO_SERIALIZATION.get(content_type or DEFAULT_SERIALIZATION_TYPE)
+
+class DataResponse(HttpResponse):
+	"""
+	Response with data (dictionaries, lists, strings, numbers) serialized by serialize()
+	in the format asked for by the request
+	"""
+	def __init__(self, data, status=200):
+		super(DataResponse, self).__init__("", status=status)
+		self.data = data
+
+	def serialize(self, request, format=None):
+		start = time.time()
+		encoder, media_type = ENCODERS[format or response_format(request, ENCODERS)]
+		self.content = encoder(self.data)
+		self['Content-Type'] = media_type
+		patch_vary_headers(self, ('Accept',))
+		self.serialization_time = getattr(self, 'serialization_time', 0.0) + time.time() - start
+		return self
+
+class MsgpackEmitter(Emitter):
+	"""
+	Piston emitter of the handlers returning models and dictionaries
+	"""
+	def render(self, request):
+		return packb(self.construct())
+
+Emitter.register('msgpack', MsgpackEmitter, MSGPACK_MEDIA_TYPES[0])
+# -- POST bodies of batch requests may be MessagePack too
+Mimer.register(unpackb, MSGPACK_MEDIA_TYPES)
+
+# -------- compression --------
+
+def accepted_encoding(request):
+	"""
+	Returns content coding (gzip, deflate) accepted by given request, None if neither is
+	"""
+	codings = {}
+	for part in request.META.get('HTTP_ACCEPT_ENCODING', "").split(","):
+		params = part.split(";")
+		coding = params[0].strip().lower()
+		quality = 1.0
+		for param in params[1:]:
+			name, _, value = param.partition("=")
+			if name.strip().lower() == "q":
+				try:
+					quality = float(value)
+				except ValueError:
+					quality = 0.0
+		codings[coding] = quality
+	for coding in ('gzip', 'deflate'):
+		if codings.get(coding, codings.get('*', 0.0)) > 0:
+			return coding
+	return None
+
+def compress(request, response):
+	"""
+	Compresses content of given (not streamed) response if it is large enough and the request accepts gzip or deflate
+	"""
+	if not response._is_string or response.has_header('Content-Encoding') or response.status_code not in (200, 201):
+		return response
+	patch_vary_headers(response, ('Accept-Encoding',))
+	if len(response.content) < COMPRESS_MIN_SIZE:
+		return response
+	coding = accepted_encoding(request)
+	if coding is None:
+		return response
+	start = time.time()
+	compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS if coding == 'gzip' else zlib.MAX_WBITS)
+	response.content = compressor.compress(response.content) + compressor.flush()
+	response['Content-Encoding'] = coding
+	response['Content-Length'] = str(len(response.content))
+	# -- reported by the metrics (see ov/metrics.py)
+	response.serialization_time = getattr(response, 'serialization_time', 0.0) + time.time() - start
+	return response
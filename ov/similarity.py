@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# encoding: utf-8
+"""
+similarity.py
+
+WordNet style similarity of synsets over the hypernym graph of their vocabulary: shortest path
+through the lowest common subsumer (LCS), path similarity, Wu-Palmer and Leacock-Chodorow.
+
+The graph of a context (hypernyms from Entry.parent and from hypernym / hyponym references)
+is read with three queries and kept in memory; the depth of every node and the depth of the
+whole taxonomy are computed once, when the graph is built, so a pair costs two walks up its
+ancestors and no query. Graphs are rebuilt when the context is modified (see context_catalog()
+in ov/autocomplete.py).
+
+Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
+"""
+
+import math
+from collections import deque
+
+from ov_django.ov.models import Entry, EntryReference
+from ov_django.ov.autocomplete import context_catalog
+from ov_django.ov.resolver import chunks
+
+CHUNK_SIZE = 5000
+
+NO_SIMILARITY = {'lcs': None, 'path_length': None, 'path': None, 'wup': None, 'lch': None}
+
+class HypernymGraph(object):
+	"""
+	Hypernyms of the synsets of a context with the (minimal) depth of every synset, roots have depth 1
+	"""
+	def __init__(self, context_id, stamp, edges):
+		"""
+		edges are (synset id, hypernym id)
+		"""
+		self.context_id = context_id
+		self.stamp = stamp
+		hypernyms = {}
+		children = {}
+		for synset, hypernym in edges:
+			if synset == hypernym:
+				continue
+			if hypernym not in hypernyms.setdefault(synset, ()):
+				hypernyms[synset] += (hypernym,)
+				children.setdefault(hypernym, []).append(synset)
+		self.hypernyms = hypernyms
+		# -- depths of all the nodes at once, breadth first from the roots
+		self.depths = {}
+		queue = deque()
+		for node in children:
+			if node not in hypernyms:
+				self.depths[node] = 1
+				queue.append(node)
+		while queue:
+			node = queue.popleft()
+			for child in children.get(node, ()):
+				if child not in self.depths:
+					self.depths[child] = self.depths[node] + 1
+					queue.append(child)
+		self.max_depth = max(self.depths.values()) if self.depths else 1
+
+	def depth(self, node):
+		return self.depths.get(node, 1)
+
+	def ancestors(self, node):
+		"""
+		Returns {ancestor: distance} of given node (itself at distance 0)
+		"""
+		distances = {node: 0}
+		queue = deque([node])
+		while queue:
+			current = queue.popleft()
+			for hypernym in self.hypernyms.get(current, ()):
+				if hypernym not in distances:
+					distances[hypernym] = distances[current] + 1
+					queue.append(hypernym)
+		return distances
+
+	def lcs(self, a, b, memo=None):
+		"""
+		Returns (lowest common subsumer, length of the shortest path through it) of given synsets,
+		(None, None) if they have no common ancestor. memo keeps ancestors of the synsets of a batch.
+		"""
+		if memo is None:
+			memo = {}
+		for node in (a, b):
+			if node not in memo:
+				memo[node] = self.ancestors(node)
+		up_a, up_b = memo[a], memo[b]
+		best = None
+		for node, distance in up_a.iteritems():
+			if node in up_b:
+				# -- the shortest path, the deepest subsumer on ties
+				key = (distance + up_b[node], -self.depth(node), node)
+				if best is None or key < best:
+					best = key
+		if best is None:
+			return None, None
+		return best[2], best[0]
+
+	def similarity(self, a, b, memo=None):
+		"""
+		Returns dictionary with the lcs, path length and similarities of given synsets
+		"""
+		lcs, path = self.lcs(a, b, memo)
+		if lcs is None:
+			return dict(NO_SIMILARITY)
+		depth = self.depth(lcs)
+		return {
+			'lcs': lcs,
+			'path_length': path,
+			'path': 1.0 / (path + 1),
+			'wup': 2.0 * depth / (path + 2 * depth),
+			'lch': -math.log((path + 1) / (2.0 * self.max_depth)),
+		}
+
+def hypernym_edges(context_id):
+	"""
+	Yields (synset id, hypernym id) of the synsets of given context (references joined through their
+	subjects, so rows with a stale partition key are not missed)
+	"""
+	queries = (
+		(Entry.objects.filter(context=context_id, parent__isnull=False), ('pk', 'parent')),
+		(EntryReference.objects.filter(subject__context=context_id, relation='hypernym'), ('pk', 'subject', 'object')),
+		(EntryReference.objects.filter(subject__context=context_id, relation='hyponym'), ('pk', 'object', 'subject')),
+	)
+	for queryset, fields in queries:
+		last = 0
+		while True:
+			chunk = list(queryset.filter(pk__gt=last).order_by('pk').values_list(*fields)[:CHUNK_SIZE])
+			if not chunk:
+				break
+			last = chunk[-1][0]
+			for row in chunk:
+				yield row[-2:]
+
+_graphs = {}
+
+def get_graph(context_id):
+	"""
+	Returns (current) hypernym graph of given context
+	"""
+	stamp = context_catalog().get(context_id, (None, None))[1]
+	graph = _graphs.get(context_id)
+	if graph is None or graph.stamp != stamp:
+		graph = _graphs[context_id] = HypernymGraph(context_id, stamp, hypernym_edges(context_id))
+	return graph
+
+def compare(pairs):
+	"""
+	Returns similarity dictionaries (see HypernymGraph.similarity, with ids of the synsets) of given
+	pairs of synset ids; synsets of different (or unknown) vocabularies have no similarity
+	"""
+	contexts = {}
+	for chunk in chunks(set(id for pair in pairs for id in pair)):
+		contexts.update(Entry.objects.filter(pk__in=chunk).values_list('pk', 'context'))
+	result = []
+	memos = {}
+	for a, b in pairs:
+		context_id = contexts.get(a)
+		if context_id is not None and context_id == contexts.get(b):
+			similarity = get_graph(context_id).similarity(a, b, memos.setdefault(context_id, {}))
+		else:
+			similarity = dict(NO_SIMILARITY)
+		similarity.update({'synset1': a, 'synset2': b})
+		result.append(similarity)
+	return result
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# encoding: utf-8
+"""
+sitemaps.py
+
+Semantic sitemap (http://sw.deri.org/2007/07/sitemapextension/) of the OpenVocabulary end-point,
+as required for the Sindice indexing (see the licence notes in ov/handlers.py).
+
+The output directory gets:
+	sitemap.xml                  - sitemap index (point robots.txt at it: Sitemap: <base>sitemap.xml)
+	sitemap-datasets.xml         - sc:dataset per vocabulary with its data dump (export/nt) location
+	sitemap-entries-<n>.xml.gz   - shards with html/ pages of entries, at most SHARD_SIZE urls each
+	sitemap.json                 - manifest (primary key range of every shard) for incremental updates
+
+Entries are read in primary key order (keyset pagination), so memory usage does not depend on the
+number of entries. Incremental update rewrites only shards with entries modified since the previous
+run and the last shard (where the new entries go).
+
+Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
+"""
+
+import os
+import gzip
+import urllib
+import datetime
+from xml.sax.saxutils import escape
+
+import simplejson as json
+
+from ov_django.settings import BASE_URL_PATH, BASE_OV_PATH
+from ov_django.ov.models import Context, Entry
+
+SHARD_SIZE = 50000
+CHUNK_SIZE = 5000
+MANIFEST = "sitemap.json"
+SHARD_NAME = "sitemap-entries-%d.xml.gz"
+DATASETS_NAME = "sitemap-datasets.xml"
+INDEX_NAME = "sitemap.xml"
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+URLSET_HEAD = '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+URL_ENTRY = '<url><loc>%s</loc><lastmod>%s</lastmod></url>\n'
+URL_ENTRY_NO_DATE = '<url><loc>%s</loc></url>\n'
+
+def iter_served_entries(first_id=0, last_id=None):
+	"""
+	Yields (id, uri, modified) of entries served by this end-point with id >= first_id (and <= last_id)
+	"""
+	entries = Entry.objects.filter(uri__startswith=BASE_OV_PATH)
+	if last_id is not None:
+		entries = entries.filter(pk__lte=last_id)
+	last = first_id - 1
+	while True:
+		chunk = list(entries.filter(pk__gt=last).order_by('pk').values_list('pk', 'uri', 'modified')[:CHUNK_SIZE])
+		if not chunk:
+			break
+		last = chunk[-1][0]
+		for row in chunk:
+			yield row
+
+def page_url(uri):
+	return BASE_URL_PATH + "html/" + uri[len(BASE_OV_PATH):]
+
+def _write_shard(output, number, rows, size):
+	"""
+	Writes shard with (up to size) given rows; returns its manifest record, None if there were no rows
+	"""
+	shard = None
+	out = None
+	for pk, uri, modified in rows:
+		if shard is None:
+			shard = {'file': SHARD_NAME % number, 'first_id': pk, 'count': 0, 'lastmod': None}
+			out = gzip.open(os.path.join(output, shard['file'] + ".tmp"), 'wb')
+			out.write(URLSET_HEAD)
+		loc = escape(page_url(uri)).encode('utf-8')
+		if modified:
+			out.write(URL_ENTRY % (loc, modified.strftime(DATE_FORMAT)))
+			shard['lastmod'] = max(shard['lastmod'], modified.strftime(DATE_FORMAT))
+		else:
+			out.write(URL_ENTRY_NO_DATE % loc)
+		shard['last_id'] = pk
+		shard['count'] += 1
+		if shard['count'] >= size:
+			break
+	if shard:
+		out.write('</urlset>\n')
+		out.close()
+		os.rename(os.path.join(output, shard['file'] + ".tmp"), os.path.join(output, shard['file']))
+	return shard
+
+def _write_empty_shard(output, shard):
+	"""
+	Empties shard all entries of which were removed (keeps its place and range)
+	"""
+	out = gzip.open(os.path.join(output, shard['file']), 'wb')
+	out.write(URLSET_HEAD + '</urlset>\n')
+	out.close()
+	return dict(shard, count=0, lastmod=None)
+
+def _write_shards(output, first_number, rows, size):
+	"""
+	Writes consecutive shards from given rows iterator; returns their manifest records
+	"""
+	shards = []
+	while True:
+		shard = _write_shard(output, first_number + len(shards), rows, size)
+		if not shard:
+			return shards
+		shards.append(shard)
+
+def _write_datasets(output):
+	out = open(os.path.join(output, DATASETS_NAME), 'wb')
+	out.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+	          '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" '
+	          'xmlns:sc="http://sw.deri.org/2007/07/sitemapextension/scschema.xsd">\n')
+	for context in Context.objects.filter(visible=True):
+		dump = "%sexport/nt?%s" % (BASE_URL_PATH, urllib.urlencode({'uri': context.uri.encode('utf-8'), 'gzip': 1}))
+		out.write(('<sc:dataset>\n'
+		           '\t<sc:datasetLabel>%s</sc:datasetLabel>\n'
+		           '\t<sc:datasetURI>%s</sc:datasetURI>\n'
+		           '\t<sc:linkedDataPrefix sc:slicing="subject-object">%s</sc:linkedDataPrefix>\n'
+		           '\t<sc:dataDumpLocation>%s</sc:dataDumpLocation>\n'
+		           '\t<changefreq>weekly</changefreq>\n'
+		           '</sc:dataset>\n') % tuple(escape(value or '').encode('utf-8') for value in
+		                                      (context.label, context.uri, context.uri, dump)))
+	out.write('</urlset>\n')
+	out.close()
+
+def _write_index(output, shards):
+	out = open(os.path.join(output, INDEX_NAME), 'wb')
+	out.write('<?xml version="1.0" encoding="UTF-8"?>\n<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n')
+	out.write('<sitemap><loc>%s%s</loc></sitemap>\n' % (escape(BASE_URL_PATH), DATASETS_NAME))
+	for shard in shards:
+		lastmod = '<lastmod>%s</lastmod>' % shard['lastmod'] if shard['lastmod'] else ''
+		out.write('<sitemap><loc>%s%s</loc>%s</sitemap>\n' % (escape(BASE_URL_PATH), shard['file'], lastmod))
+	out.write('</sitemapindex>\n')
+	out.close()
+
+def _read_manifest(output):
+	try:
+		return json.load(open(os.path.join(output, MANIFEST)))
+	except (IOError, ValueError):
+		return None
+
+def generate(output, incremental=False, size=SHARD_SIZE):
+	"""
+	Generates (or updates) sitemap files in given directory. Returns number of shards written.
+	"""
+	started = datetime.datetime.now()
+	if not os.path.isdir(output):
+		os.makedirs(output)
+	manifest = _read_manifest(output) if incremental else None
+	if manifest and manifest.get('size') == size and manifest['shards']:
+		since = datetime.datetime.strptime(manifest['generated'], DATE_FORMAT)
+		shards = manifest['shards']
+		written = 0
+		# -- shards with modified entries
+		for i, shard in enumerate(shards[:-1]):
+			if Entry.objects.filter(pk__gte=shard['first_id'], pk__lte=shard['last_id'], modified__gte=since).exists():
+				shards[i] = _write_shard(output, i, iter_served_entries(shard['first_id'], shard['last_id']), size) or \
+				            _write_empty_shard(output, shard)
+				written += 1
+		# -- the last shard and new entries
+		tail = _write_shards(output, len(shards) - 1, iter_served_entries(shards[-1]['first_id']), size)
+		shards = shards[:-1] + tail
+		written += len(tail)
+	else:
+		shards = _write_shards(output, 0, iter_served_entries(), size)
+		written = len(shards)
+	_write_datasets(output)
+	_write_index(output, shards)
+	out = open(os.path.join(output, MANIFEST), 'wb')
+	json.dump({'generated': started.strftime(DATE_FORMAT), 'size': size, 'shards': shards}, out)
+	out.close()
+	return written
@@ -0,0 +1,2 @@
+-- roots of a context browsed in (label, id) order (keyset pagination, see ov/paging.py)
+CREATE INDEX ov_entry_roots ON ov_entry (context_id, is_root, label, id);
@@ -0,0 +1,3 @@
+-- references from and to an entry listed in (relation, id) order (search/related, see keyset_union_page in ov/paging.py)
+CREATE INDEX ov_entryreference_subject_relation ON ov_entryreference (subject_id, relation, id);
+CREATE INDEX ov_entryreference_object_relation ON ov_entryreference (object_id, relation, id);
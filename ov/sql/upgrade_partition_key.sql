@@ -0,0 +1,11 @@
+-- Upgrade of databases created before the partition key of Triple and EntryReference (PostgreSQL),
+-- run once with psql; new databases get the columns from syncdb. Not run by syncdb (not named after a model).
+-- Existing rows get the context of their subjects (manage.py partitions backfill does the same later on).
+BEGIN;
+ALTER TABLE ov_triple ADD COLUMN context_id integer NULL REFERENCES ov_context (id) DEFERRABLE INITIALLY DEFERRED;
+ALTER TABLE ov_entryreference ADD COLUMN context_id integer NULL REFERENCES ov_context (id) DEFERRABLE INITIALLY DEFERRED;
+UPDATE ov_triple t SET context_id = e.context_id FROM ov_entry e WHERE e.id = t.subject_id;
+UPDATE ov_entryreference t SET context_id = e.context_id FROM ov_entry e WHERE e.id = t.subject_id;
+CREATE INDEX ov_triple_context_id ON ov_triple (context_id);
+CREATE INDEX ov_entryreference_context_id ON ov_entryreference (context_id);
+COMMIT;
@@ -0,0 +1,18 @@
+-- Upgrade of databases created before the hashed uri storage (PostgreSQL), run once with psql;
+-- new databases get the columns from syncdb. Not run by syncdb (not named after a model).
+-- The unique index moves from the uri column (up to 255 characters) to the 32 characters of its MD5
+-- hash, afterwards manage.py hashuris canonicalizes the uris (and rehashes the changed ones).
+BEGIN;
+ALTER TABLE ov_uri ADD COLUMN uri_hash varchar(32) NULL;
+ALTER TABLE ov_predicate ADD COLUMN uri_hash varchar(32) NULL;
+ALTER TABLE ov_entry ADD COLUMN uri_hash varchar(32) NULL;
+UPDATE ov_uri SET uri_hash = md5(uri);
+UPDATE ov_predicate SET uri_hash = md5(uri);
+UPDATE ov_entry SET uri_hash = md5(uri);
+CREATE UNIQUE INDEX ov_uri_uri_hash_key ON ov_uri (uri_hash);
+CREATE UNIQUE INDEX ov_predicate_uri_hash_key ON ov_predicate (uri_hash);
+CREATE UNIQUE INDEX ov_entry_uri_hash_key ON ov_entry (uri_hash);
+ALTER TABLE ov_uri DROP CONSTRAINT IF EXISTS ov_uri_uri_key;
+ALTER TABLE ov_predicate DROP CONSTRAINT IF EXISTS ov_predicate_uri_key;
+ALTER TABLE ov_entry DROP CONSTRAINT IF EXISTS ov_entry_uri_key;
+COMMIT;
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# encoding: utf-8
+"""
+staticsite.py
+
+Pre-renders entries of a vocabulary to static HTML and Turtle files in the URL layout
+served by ov/urls.py, so that a web server can serve linked data without Django:
+
+	<output>/html/<path>/index.html     for  html/<path>
+	<output>/data/<path>/index.ttl      for  data/<path>
+
+where <path> is the entry uri without BASE_OV_PATH. An nginx configuration could be:
+
+	location /html/ { root <output>; try_files $uri/index.html @django; }
+	location /data/ { root <output>; default_type text/turtle; try_files $uri/index.ttl @django; }
+
+Incremental generation re-renders entries modified since the previous run together with
+their direct neighbours (renderings refer to labels and uris of parents, children, synsets
+and related entries). Removed entries are not detected - run a full generation after deletions.
+
+Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
+"""
+
+import os
+import datetime
+import multiprocessing
+
+from django import db
+from django.db.models import Q
+
+from ov_django.settings import BASE_OV_PATH
+from ov_django.ov.models import Entry, EntryReference
+from ov_django.ov.views import build_entry_pages, render_entry_page
+
+STAMP_FILE = ".generated"
+STAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+def entry_path(uri):
+	"""
+	Returns path of given entry uri relative to html/ and data/, None if it is not served by OV
+	"""
+	if uri and uri.startswith(BASE_OV_PATH):
+		path = uri[len(BASE_OV_PATH):].strip('/')
+		if path and not '..' in path.split('/'):
+			return path
+	return None
+
+def _write(file_name, content):
+	directory = os.path.dirname(file_name)
+	if not os.path.isdir(directory):
+		try:
+			os.makedirs(directory)
+		except OSError:
+			# -- created by another worker in the meantime
+			pass
+	temp_name = "%s.%d.tmp" % (file_name, os.getpid())
+	output = open(temp_name, 'wb')
+	try:
+		output.write(content.encode('utf-8') if isinstance(content, unicode) else content)
+	finally:
+		output.close()
+	os.rename(temp_name, file_name)
+
+def render_entries(output, ids):
+	"""
+	Renders HTML and Turtle files of entries with given ids; returns number of entries written
+	"""
+	entries = [ entry for entry in Entry.objects.filter(pk__in=ids).select_related('context') if entry_path(entry.uri) ]
+	# -- the whole chunk loaded with bulk queries, the files are rendered from the loaded objects
+	entries = Entry.objects.prefetch_neighbourhood(entries)
+	pages = build_entry_pages(entries)
+	written = 0
+	for entry, page in zip(entries, pages):
+		path = entry_path(entry.uri)
+		plan = entry.get_rdf_plan()
+		_write(os.path.join(output, 'data', path, 'index.ttl'), plan.head + plan.to_turtle(entry))
+		_write(os.path.join(output, 'html', path, 'index.html'), render_entry_page(entry, page))
+		written += 1
+	db.reset_queries()
+	return written
+
+def _render_chunk(args):
+	return render_entries(*args)
+
+def _init_worker():
+	# -- forked workers must not share the database connection of the parent
+	db.connection.close()
+
+def iter_entry_ids(context, chunk_size):
+	"""
+	Yields lists of ids of all (served) entries of given context, keyset paginated
+	"""
+	last_id = 0
+	while True:
+		ids = list(Entry.objects.filter(context=context, pk__gt=last_id, uri__startswith=BASE_OV_PATH)
+		           .order_by('pk').values_list('pk', flat=True)[:chunk_size])
+		if not ids:
+			break
+		last_id = ids[-1]
+		yield ids
+
+def changed_entry_ids(context, since):
+	"""
+	Returns ids of entries of given context modified since given time, together with their neighbours
+	"""
+	modified = Entry.objects.filter(context=context, modified__gte=since)
+	ids = set(modified.values_list('pk', flat=True))
+	if not ids:
+		return []
+	neighbours = set()
+	for parent_id, synset_id in modified.values_list('parent', 'in_synset'):
+		neighbours.update([parent_id, synset_id])
+	neighbours.update(Entry.objects.filter(Q(parent__in=ids) | Q(in_synset__in=ids)).values_list('pk', flat=True))
+	neighbours.update(Entry.word_senses.through.objects.filter(to_entry__in=ids).values_list('from_entry', flat=True))
+	neighbours.update(EntryReference.objects.filter(object__in=ids).values_list('subject', flat=True))
+	neighbours.discard(None)
+	# -- only neighbours served from this context
+	ids |= set(Entry.objects.filter(pk__in=list(neighbours - ids), context=context).values_list('pk', flat=True))
+	return sorted(ids)
+
+def read_stamp(output):
+	try:
+		stamp = open(os.path.join(output, STAMP_FILE)).read().strip()
+		return datetime.datetime.strptime(stamp, STAMP_FORMAT)
+	except (IOError, ValueError):
+		return None
+
+def generate(context, output, workers=None, incremental=False, chunk_size=200):
+	"""
+	Generates static files of given context into output directory using given number of worker processes.
+	Returns number of entries written.
+	"""
+	started = datetime.datetime.now()
+	since = read_stamp(output) if incremental else None
+	if since:
+		ids = changed_entry_ids(context, since)
+		chunks = [ ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size) ]
+	else:
+		chunks = iter_entry_ids(context, chunk_size)
+	tasks = ((output, ids) for ids in chunks)
+
+	if workers == 1:
+		written = sum(_render_chunk(task) for task in tasks)
+	else:
+		db.connection.close()
+		pool = multiprocessing.Pool(workers, _init_worker)
+		try:
+			written = sum(pool.imap_unordered(_render_chunk, tasks))
+		finally:
+			pool.close()
+			pool.join()
+
+	if not os.path.isdir(output):
+		os.makedirs(output)
+	_write(os.path.join(output, STAMP_FILE), started.strftime(STAMP_FORMAT))
+	return written
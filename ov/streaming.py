@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# encoding: utf-8
+"""
+streaming.py
+
+Streamed responses of the REST API for large result sets. Handlers defining
+stream(request, ...) (an iterator of dictionaries) are asked for it instead of read()
+when the client opts in with
+
+	?stream=ndjson (or ?stream=1)   - newline delimited JSON, one object per line
+	?stream=json                    - JSON array sent in pieces
+	Accept: application/x-ndjson    - the same as ?stream=ndjson
+
+Results are read in primary key order, CHUNK_SIZE objects per query (keyset pagination),
+and serialized chunk by chunk, so memory usage and time to the first byte do not depend on
+the size of the result.
+
+Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
+"""
+
+from django.http import HttpResponse
+import simplejson as json
+
+from ov_django.ov.negotiation import parse_accept
+
+CHUNK_SIZE = 500
+
+NDJSON_MEDIA_TYPES = ('application/x-ndjson', 'application/ndjson')
+
+def stream_format(request):
+	"""
+	Returns format of the streamed response asked for by given request (ndjson, json), None if not asked for
+	"""
+	param = request.GET.get('stream', None)
+	if param in ('1', 'ndjson'):
+		return 'ndjson'
+	if param == 'json':
+		return 'json'
+	for media_range, quality in parse_accept(request.META.get('HTTP_ACCEPT')):
+		if media_range in NDJSON_MEDIA_TYPES and quality > 0:
+			return 'ndjson'
+	return None
+
+def iter_chunks(queryset, size=CHUNK_SIZE):
+	"""
+	Yields lists of (at most size) objects of given queryset in primary key order
+	"""
+	last = None
+	while True:
+		chunk = queryset.filter(pk__gt=last) if last is not None else queryset
+		chunk = list(chunk.order_by('pk')[:size])
+		if not chunk:
+			break
+		last = chunk[-1].pk
+		yield chunk
+		if len(chunk) < size:
+			break
+
+def _dumps(item):
+	return json.dumps(item, separators=(',', ':'))
+
+def ndjson(items):
+	for item in items:
+		yield _dumps(item) + "\n"
+
+def json_array(items):
+	yield "["
+	first = True
+	for item in items:
+		yield (_dumps(item) if first else "," + _dumps(item))
+		first = False
+	yield "]"
+
+STREAM_FORMATS = {
+	'ndjson' : (ndjson, NDJSON_MEDIA_TYPES[0]),
+	'json'   : (json_array, "application/json"),
+}
+
+def streaming_response(items, format):
+	"""
+	Returns response streaming given dictionaries in given format
+	"""
+	writer, mimetype = STREAM_FORMATS[format]
+	return HttpResponse(writer(items), mimetype=mimetype)
@@ -3,6 +3,7 @@ import re
 from django import template
 from django.utils.safestring import mark_safe
 from ov_django.ov.models import *
+from ov_django.ov import facets
 from ov_django.rdf import NAMESPACES, INV_NAMESPACE
 from ov_django.settings import BASE_OV_PATH, BASE_URL_PATH
 
@@ -121,14 +122,14 @@ def count_by_type(value):
     """
     Counts contexts of given type
     """
-    return str(Context.objects.filter(visible=True, type=value).count())
+    return str(facets.count_by('types', value))
 
 @register.simple_tag
 def count_by_lang(value):
     """
     Counts contexts of given lang
     """
-    return str(Context.objects.filter(visible=True, lang=value).count())
+    return str(facets.count_by('langs', value))
 
 @register.filter
 def expand_context_type(value):
@@ -152,14 +153,14 @@ def list_entry_relations(entry):
     """
     Lists all EntryRelation objects with given entry as subject
     """
-    return EntryReference.objects.filter(subject=entry).order_by("relation")
+    return EntryReference.objects.filter(subject=entry, context=entry.context_id).order_by("relation")
 
 @register.filter
 def list_entry_triples(entry):
     """
     Lists all Triples with given entry as subject
     """
-    return Triple.objects.filter(subject=entry).order_by("predicate")
+    return Triple.objects.filter(subject=entry, context=entry.context_id).order_by("predicate")
 
 @register.filter
 def get_entry(uri):
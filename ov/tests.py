@@ -21,3 +21,1074 @@ Another way to test that 1 + 1 is equal to 2.
 True
 """}
 
+
+from django.db.models import Q
+from ov_django.ov.models import Context, Entry, Predicate, Triple, URI
+from ov_django.ov.uris import uri_hash
+
+class HashedURITest(TestCase):
+    def setUp(self):
+        self.context = Context.objects.create(label="Test", uri="http://example.org/vocab", ns="ex")
+        self.entry = Entry.objects.create(uri="http://example.org/vocab/term1", label="term1")
+
+    def test_hash_column(self):
+        """
+        Tests that uri is stored with its hash
+        """
+        self.assertEqual(self.entry.uri_hash, uri_hash("http://example.org/vocab/term1"))
+
+    def test_uri_lookups_use_hash(self):
+        """
+        Tests that uri equality lookups are transparently served by uri_hash
+        """
+        query = Entry.objects.filter(Q(uri=self.entry.uri) | Q(uri="http://example.org/other"))
+        self.assertTrue("uri_hash" in str(query.query))
+        self.assertEqual(list(query), [self.entry])
+        self.assertEqual(Entry.objects.get(uri=self.entry.uri), self.entry)
+        self.assertEqual(Entry.objects.get_or_create(uri=self.entry.uri), (self.entry, False))
+        self.assertEqual(list(Entry.objects.filter(uri__in=[self.entry.uri])), [self.entry])
+
+    def test_related_uri_lookups_use_hash(self):
+        predicate = Predicate.objects.create(uri="http://www.w3.org/2004/02/skos/core#related")
+        Triple.objects.create(subject=self.entry, predicate=predicate, literal="x")
+        query = Triple.objects.filter(predicate__uri=predicate.uri)
+        self.assertTrue("uri_hash" in str(query.query))
+        self.assertEqual(query.count(), 1)
+
+from ov_django.ov.models import EntryReference
+from ov_django.ov import partitions
+from ov_django.ov.importer import TriplesParser
+
+class PartitionTest(TestCase):
+    def test_partition_key_follows_subject(self):
+        """
+        Tests that Triple and EntryReference carry context of their subject
+        """
+        context = Context.objects.create(label="Test", uri="http://example.org/vocab", ns="ex")
+        subject = Entry.objects.create(uri="http://example.org/vocab/a", context=context)
+        reference = EntryReference.objects.create(subject=subject, object=subject, relation='synonym')
+        self.assertEqual(reference.context, context)
+
+    def test_statements_follow_moved_subject(self):
+        """
+        Tests that the statements of an entry moved to another context are moved with it
+        """
+        context = Context.objects.create(label="Test", uri="http://example.org/vocab", ns="ex")
+        other = Context.objects.create(label="Other", uri="http://example.org/other", ns="ot")
+        subject = Entry.objects.create(uri="http://example.org/vocab/a", context=context)
+        EntryReference.objects.create(subject=subject, object=subject, relation='synonym')
+        predicate = Predicate.objects.create(uri="http://www.w3.org/2004/02/skos/core#note")
+        Triple.objects.create(subject=subject, predicate=predicate, literal="a")
+        subject = Entry.objects.get(pk=subject.pk)
+        subject.context = other
+        subject.save()
+        self.assertEqual(EntryReference.objects.get(subject=subject).context, other)
+        self.assertEqual(Triple.objects.get(subject=subject).context, other)
+
+    def test_importer_moves_statements_read_before_scheme(self):
+        """
+        Tests that the statements read before the scheme of their subject get its context at the end of the import
+        """
+        context = Context.objects.create(label="Test", uri="http://example.org/vocab", ns="ex")
+        subject = Entry.objects.create(uri="http://example.org/vocab/a")
+        parser = TriplesParser()
+        parser.add_relation(subject, 'synonym', subject)
+        parser.set_scheme(subject, {'uri': context.uri})
+        subject.save(propagate_context=False)
+        parser.add_relation(subject, 'antonym', subject)
+        self.assertEqual(EntryReference.objects.filter(context=context).count(), 1)
+        parser.update_statement_contexts()
+        self.assertEqual(EntryReference.objects.filter(context=context).count(), 2)
+
+    def test_convert_sql_backfills_statements(self):
+        self.assertEqual(partitions.partitioned_tables(), ["ov_triple", "ov_entryreference"])
+        statement, = partitions.backfill_sql("ov_triple")
+        self.assertTrue(statement.startswith('UPDATE "ov_triple" t SET context_id = e.context_id FROM "ov_entry" e'))
+
+    def test_swap_sql(self):
+        statements = partitions.swap_sql("ov_triple", "5", [5], "ov_triple_p_5_staging")
+        self.assertEqual(statements[0], 'ALTER TABLE "ov_triple" DETACH PARTITION "ov_triple_p_5"')
+        self.assertTrue('ALTER TABLE "ov_triple" ATTACH PARTITION "ov_triple_p_5" FOR VALUES IN (5)' in statements)
+        self.assertEqual(statements[-1], 'DROP TABLE "ov_triple_p_5_old"')
+
+from ov_django.rdf import RdfStep
+
+class RdfPlanTest(TestCase):
+    def setUp(self):
+        self.context = Context.objects.create(label="Test", uri="http://example.org/vocab", ns="ex")
+        self.synset = Entry.objects.create(uri="http://example.org/vocab/s1", label='say "hi"',
+                                           gloss="a greeting", context=self.context)
+        self.word_sense = Entry.objects.create(uri="http://example.org/vocab/ws1", lexical_form="hi",
+                                               in_synset=self.synset, context=self.context, type_tag="Poetic")
+        self.synset.word_senses.add(self.word_sense)
+
+    def test_plan_is_compiled_once_per_class(self):
+        self.assertTrue(self.synset.get_rdf_plan() is self.word_sense.get_rdf_plan())
+
+    def test_to_rdf(self):
+        rdf = self.synset.to_rdf()
+        self.assertTrue("@prefix skos: <http://www.w3.org/2004/02/skos/core#>." in rdf)
+        self.assertFalse("@prefix foaf:" in rdf)
+        self.assertTrue('skos:prefLabel "say \\"hi\\""' in rdf)
+        self.assertTrue('v:description "a greeting"' in rdf)
+        self.assertTrue("wn20schema:containsWordSense <http://example.org/vocab/ws1>" in rdf)
+        rdf = self.word_sense.to_rdf()
+        self.assertTrue("ov:wordType ov:IPoetic" in rdf)
+        self.assertTrue("wn20schema:inSynset <http://example.org/vocab/s1>" in rdf)
+        self.assertFalse("containsWordSense" in rdf)
+
+    def test_property_uris(self):
+        uris, rval = self.synset.get_property_uris('context')
+        self.assertEqual(uris, ['skos:inScheme'])
+        self.assertEqual(rval, "<http://example.org/vocab>")
+
+    def test_value_conversion(self):
+        step = RdfStep(Entry, 'is_root', {"uri": "ov:depth", "value": "%s * 2"})
+        self.synset.is_root = 3
+        self.assertEqual(step.values(self.synset), [u"6"])
+        step = RdfStep(Entry, 'type_tag', {"uri": "ov:wordType", "dict": {"Poetic": 1}, "value": "%s + 1",
+                                           "uri_pattern": "ov:level%s"})
+        self.assertEqual(step.values(self.word_sense)[0].get_uri(), "http://www.openvocabulary.info/ontology/level2")
+
+class PrefetchTest(TestCase):
+    def setUp(self):
+        context = Context.objects.create(label="Test", uri="http://example.org/vocab", ns="ex")
+        related = Predicate.objects.create(uri="http://www.w3.org/2004/02/skos/core#related")
+        self.entries = []
+        for i in range(3):
+            parent = Entry.objects.create(uri="http://example.org/vocab/p%d" % i, label="parent", context=context)
+            synset = Entry.objects.create(uri="http://example.org/vocab/s%d" % i, label="synset", gloss="gloss",
+                                          context=context, parent=parent)
+            word_sense = Entry.objects.create(uri="http://example.org/vocab/ws%d" % i, lexical_form="word",
+                                              in_synset=synset, context=context)
+            synset.word_senses.add(word_sense)
+            Entry.objects.create(uri="http://example.org/vocab/c%d" % i, label="child", context=context, parent=synset)
+            Triple.objects.create(subject=synset, predicate=related, object=URI.objects.create(uri="http://example.org/x%d" % i))
+            self.entries += [synset, word_sense]
+
+    def test_constant_number_of_queries(self):
+        """
+        Tests that RDF of a batch of entries costs the same number of queries as of a single entry
+        """
+        single = Entry.objects.filter(pk=self.entries[0].pk)
+        batch = Entry.objects.filter(pk__in=[entry.pk for entry in self.entries])
+        self.assertNumQueries(6, lambda: Entry.objects.to_rdf(single))
+        rdf = []
+        self.assertNumQueries(6, lambda: rdf.append(Entry.objects.to_rdf(batch)))
+        self.assertEqual(rdf[0].count("skos:related <http://example.org/x"), 3)
+        self.assertEqual(rdf[0].count("skos:narrower <http://example.org/vocab/c"), 3)
+        self.assertEqual(rdf[0].count("wn20schema:containsWordSense"), 3)
+        self.assertEqual(rdf[0].count('v:description "gloss"'), 6)
+        self.assertEqual(rdf[0].count("@prefix skos:"), 1)
+
+import gzip
+import StringIO
+import simplejson
+from ov_django.ov.export import export_context, gzip_stream
+
+class ExportTest(PrefetchTest):
+    def test_export_formats(self):
+        context = Context.objects.get(uri="http://example.org/vocab")
+        ntriples = "".join(export_context(context, 'nt', chunk_size=4))
+        self.assertEqual(ntriples.count("<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>"), 13)
+        self.assertTrue('<http://example.org/vocab/s0> <http://www.w3.org/2004/02/skos/core#narrower> <http://example.org/vocab/c0> .' in ntriples)
+        turtle = "".join(export_context(context, 'ttl', chunk_size=4))
+        self.assertEqual(turtle.count("a skos:Concept;"), 12)
+        self.assertEqual(turtle.count("@prefix skos:"), 1)
+        jsonld = simplejson.loads("".join(export_context(context, 'jsonld', chunk_size=4)))
+        self.assertEqual(len(jsonld["@graph"]), 13)
+        self.assertEqual(jsonld["@context"]["skos"], "http://www.w3.org/2004/02/skos/core#")
+
+    def test_gzip(self):
+        context = Context.objects.get(uri="http://example.org/vocab")
+        compressed = "".join(gzip_stream(export_context(context, 'nt')))
+        self.assertEqual(gzip.GzipFile(fileobj=StringIO.StringIO(compressed)).read(),
+                         "".join(export_context(context, 'nt')))
+
+    def test_export_view(self):
+        response = self.client.get("/export/ttl", {'uri': "http://example.org/vocab"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/turtle")
+        self.assertTrue("skos:ConceptScheme" in response.content)
+
+import threading
+from ov_django.ov import rendercache
+
+class RenderCacheTest(TestCase):
+    def setUp(self):
+        self.context = Context.objects.create(label="Test", uri="http://localhost:8000/thesauri/test", ns="ex")
+        self.entry = Entry.objects.create(uri="http://localhost:8000/thesauri/test/e1", label="first", context=self.context)
+
+    def test_rendering_is_cached_until_write(self):
+        response = self.client.get("/data/thesauri/test/e1")
+        self.assertTrue('skos:prefLabel "first"' in response.content)
+        stats = rendercache.get_stats()['ttl']
+        self.client.get("/data/thesauri/test/e1")
+        self.assertEqual(rendercache.get_stats()['ttl']['hits'], stats['hits'] + 1)
+        # -- a write in the context makes the rendering stale
+        Entry.objects.create(uri="http://localhost:8000/thesauri/test/e2", label="child", context=self.context, parent=self.entry)
+        response = self.client.get("/data/thesauri/test/e1")
+        self.assertTrue("skos:narrower <http://localhost:8000/thesauri/test/e2>" in response.content)
+
+    def test_suspended_invalidation(self):
+        version = rendercache.get_context_version(self.context.id)
+        rendercache.suspend_invalidation()
+        self.entry.label = "changed"
+        self.entry.save()
+        self.assertEqual(rendercache.get_context_version(self.context.id), version)
+        rendercache.resume_invalidation()
+        self.assertNotEqual(rendercache.get_context_version(self.context.id), version)
+
+    def test_suspension_is_per_thread(self):
+        rendercache.suspend_invalidation()
+        try:
+            seen = []
+            thread = threading.Thread(target=lambda: seen.append(getattr(rendercache._local, 'suspended', None)))
+            thread.start()
+            thread.join()
+            self.assertEqual(seen, [None])
+        finally:
+            rendercache.resume_invalidation()
+
+    def test_write_of_another_process(self):
+        """
+        Tests that renderings follow the modification stamp in the database, not a stamp of this process
+        """
+        self.client.get("/data/thesauri/test/e1")
+        # -- as an import run from the command line does it: no signals in this process
+        Entry.objects.filter(pk=self.entry.pk).update(label="changed")
+        Context.objects.filter(pk=self.context.pk).update(modified=datetime.datetime.now() + datetime.timedelta(seconds=1))
+        response = self.client.get("/data/thesauri/test/e1")
+        self.assertTrue('skos:prefLabel "changed"' in response.content)
+
+    def test_failed_import_resumes_invalidation(self):
+        path = tempfile.mkstemp()[1]
+        try:
+            open(path, "w").write("<http://localhost:8000/thesauri/test/e1> <http://www.w3.org/2004/02/skos/core#prefLabel> \"x\" .\n")
+            parser = TriplesParser()
+            parser.process_line = lambda line: 1 / 0
+            self.assertRaises(ZeroDivisionError, parser.read, path)
+            self.assertEqual(getattr(rendercache._local, 'suspended', None), None)
+        finally:
+            os.remove(path)
+
+import os
+import shutil
+import tempfile
+import datetime
+from ov_django.ov import staticsite
+
+class StaticSiteTest(TestCase):
+    def setUp(self):
+        self.output = tempfile.mkdtemp()
+        self.context = Context.objects.create(label="Test", uri="http://localhost:8000/thesauri/test", ns="ex")
+        self.parent = Entry.objects.create(uri="http://localhost:8000/thesauri/test/p", label="parent", context=self.context)
+        self.child = Entry.objects.create(uri="http://localhost:8000/thesauri/test/p/c/", label="child", context=self.context, parent=self.parent)
+        Entry.objects.create(uri="http://localhost:8000/thesauri/test/other", label="other", context=self.context)
+        Entry.objects.create(uri="http://example.org/external", label="external", context=self.context)
+
+    def tearDown(self):
+        shutil.rmtree(self.output)
+
+    def test_generate(self):
+        self.assertEqual(staticsite.generate(self.context, self.output, workers=1, chunk_size=2), 3)
+        turtle = open(os.path.join(self.output, "data/thesauri/test/p/index.ttl")).read()
+        self.assertTrue("skos:narrower <http://localhost:8000/thesauri/test/p/c>" in turtle)
+        self.assertTrue(os.path.exists(os.path.join(self.output, "html/thesauri/test/p/c/index.html")))
+
+    def test_queries_per_chunk(self):
+        """
+        Tests that a chunk costs the same number of queries no matter how many entries it has
+        """
+        def count_queries(ids):
+            # -- render_entries() resets connection.queries, the metrics cursors count them
+            metrics.instrument_connections()
+            metrics._local.queries = []
+            try:
+                staticsite.render_entries(self.output, ids)
+                return len(metrics._local.queries)
+            finally:
+                metrics._local.queries = None
+        ids = list(Entry.objects.values_list('pk', flat=True))
+        self.assertEqual(count_queries(ids[:1]), count_queries(ids))
+
+    def test_changed_entries_with_neighbours(self):
+        since = datetime.datetime.now()
+        Entry.objects.filter(pk=self.child.pk).update(modified=since + datetime.timedelta(seconds=1))
+        Entry.objects.exclude(pk=self.child.pk).update(modified=since - datetime.timedelta(days=1))
+        self.assertEqual(staticsite.changed_entry_ids(self.context, since), sorted([self.parent.pk, self.child.pk]))
+
+    def test_statement_changes_touch_subject(self):
+        Entry.objects.update(modified=datetime.datetime.now() - datetime.timedelta(days=1))
+        since = datetime.datetime.now() - datetime.timedelta(seconds=1)
+        reference = EntryReference.objects.create(subject=self.child, object=self.child, relation='synonym')
+        self.assertEqual(staticsite.changed_entry_ids(self.context, since), sorted([self.parent.pk, self.child.pk]))
+        Entry.objects.update(modified=datetime.datetime.now() - datetime.timedelta(days=1))
+        reference.delete()
+        self.assertEqual(staticsite.changed_entry_ids(self.context, since), sorted([self.parent.pk, self.child.pk]))
+
+from ov_django.ov import sitemaps
+
+class SitemapTest(TestCase):
+    def setUp(self):
+        self.output = tempfile.mkdtemp()
+        self.context = Context.objects.create(label="Test", uri="http://localhost:8000/thesauri/test", ns="ex")
+        for i in range(5):
+            Entry.objects.create(uri="http://localhost:8000/thesauri/test/e%d" % i, label="e", context=self.context)
+        Entry.objects.create(uri="http://example.org/external", label="external", context=self.context)
+
+    def tearDown(self):
+        shutil.rmtree(self.output)
+
+    def read_shard(self, number):
+        return gzip.open(os.path.join(self.output, sitemaps.SHARD_NAME % number)).read()
+
+    def test_shards_and_index(self):
+        self.assertEqual(sitemaps.generate(self.output, size=2), 3)
+        self.assertEqual(self.read_shard(2).count("<url>"), 1)
+        self.assertTrue("<loc>http://localhost:8000/html/thesauri/test/e0</loc>" in self.read_shard(0))
+        index = open(os.path.join(self.output, sitemaps.INDEX_NAME)).read()
+        self.assertEqual(index.count("<sitemap>"), 4)
+        datasets = open(os.path.join(self.output, sitemaps.DATASETS_NAME)).read()
+        self.assertTrue("<sc:dataDumpLocation>http://localhost:8000/export/nt?" in datasets)
+
+    def test_incremental(self):
+        sitemaps.generate(self.output, size=2)
+        Entry.objects.all().update(modified=datetime.datetime.now() - datetime.timedelta(days=1))
+        Entry.objects.create(uri="http://localhost:8000/thesauri/test/new", label="new", context=self.context)
+        # -- only the last shard is rewritten (and gets the new entry)
+        self.assertEqual(sitemaps.generate(self.output, incremental=True, size=2), 1)
+        self.assertTrue("/html/thesauri/test/new</loc>" in self.read_shard(2))
+
+from xml.dom import minidom
+from ov_django.rdf import NAMESPACES
+from ov_django.ov import negotiation
+from ov_django.ov.negotiation import negotiate
+
+class NegotiationTest(TestCase):
+    def setUp(self):
+        self.context = Context.objects.create(label="Test", uri="http://localhost:8000/thesauri/test", ns="ex")
+        self.entry = Entry.objects.create(uri="http://localhost:8000/thesauri/test/e1", label="first & <last>", context=self.context)
+
+    def test_accept_quality(self):
+        offered = ['text/html', 'text/turtle', 'application/rdf+xml']
+        self.assertEqual(negotiate("", offered), 'text/html')
+        self.assertEqual(negotiate("text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8", offered), 'text/html')
+        self.assertEqual(negotiate("text/html;q=0.5, application/rdf+xml", offered), 'application/rdf+xml')
+        self.assertEqual(negotiate("text/*;q=0.3, text/turtle;q=0.7", offered), 'text/turtle')
+        self.assertEqual(negotiate("*/*, text/html;q=0", offered), 'text/turtle')
+        self.assertEqual(negotiate("image/png", offered), None)
+        self.assertEqual(negotiate("text/turtle;q=x, text/html", offered), 'text/html')
+
+    def test_data_formats(self):
+        response = self.client.get("/data/thesauri/test/e1", HTTP_ACCEPT="application/rdf+xml")
+        self.assertEqual(response["Content-Type"], "application/rdf+xml")
+        labels = minidom.parseString(response.content).getElementsByTagNameNS(NAMESPACES['skos'], "prefLabel")
+        self.assertEqual(labels[0].firstChild.data, "first & <last>")
+        response = self.client.get("/data/thesauri/test/e1", HTTP_ACCEPT="application/n-triples")
+        self.assertTrue('<http://www.w3.org/2004/02/skos/core#prefLabel> "first & <last>" .' in response.content)
+        response = self.client.get("/data/thesauri/test/e1", HTTP_ACCEPT="application/ld+json")
+        self.assertEqual(simplejson.loads(response.content)["@graph"][0]["@id"], self.entry.uri)
+        self.assertEqual(self.client.get("/data/thesauri/test/e1")["Content-Type"], "text/turtle")
+
+    def test_page_and_redirect(self):
+        response = self.client.get("/html/thesauri/test/e1", HTTP_ACCEPT="application/x-turtle")
+        self.assertEqual(response["Content-Type"], "application/x-turtle")
+        self.assertEqual(response["Vary"], "Accept")
+        response = self.client.get("/thesauri/test/e1", HTTP_ACCEPT="text/html;q=0.9, application/ld+json")
+        self.assertEqual(response["Location"], "http://localhost:8000/data/thesauri/test/e1")
+        response = self.client.get("/thesauri/test/e1", HTTP_ACCEPT="text/html, application/ld+json;q=0.9")
+        self.assertEqual(response["Location"], "http://localhost:8000/html/thesauri/test/e1")
+
+    def test_export_rdfxml(self):
+        Entry.objects.create(uri="http://localhost:8000/thesauri/test/e2", label="child", context=self.context, parent=self.entry)
+        content = "".join(negotiation.SERIALIZERS_BY_NAME['rdf'].serialize(
+            [self.context.get_rdf_plan(), self.entry.get_rdf_plan()], [[self.context], list(Entry.objects.all())]))
+        self.assertEqual(len(minidom.parseString(content).getElementsByTagNameNS(NAMESPACES['rdf'], "Description")), 3)
+
+from django.template.loader import render_to_string
+from ov_django.ov.views import build_entry_page, build_entry_pages, render_entry_page
+
+class EntryPageTest(TestCase):
+    def setUp(self):
+        context = Context.objects.create(label="Test", uri="http://localhost:8000/thesauri/test", ns="ex")
+        parent = Entry.objects.create(uri="http://localhost:8000/thesauri/test/p", label="parent", context=context)
+        synset = Entry.objects.create(uri="http://localhost:8000/thesauri/test/s", label="synset", context=context)
+        self.entry = Entry.objects.create(uri="http://localhost:8000/thesauri/test/e", label="entry", context=context,
+                                          parent=parent, in_synset=synset)
+        predicate = Predicate.objects.create(uri="http://www.w3.org/2004/02/skos/core#related", label="related")
+        Triple.objects.create(subject=self.entry, predicate=predicate, object=URI.objects.create(uri=synset.uri))
+        Triple.objects.create(subject=self.entry, predicate=predicate, object=URI.objects.create(uri="http://example.org/x", label="external"))
+        Triple.objects.create(subject=self.entry, predicate=predicate, literal="literal", literal_lang="en")
+        self.context = context
+
+    def add_neighbours(self, count):
+        for i in range(count):
+            other = Entry.objects.create(uri="http://localhost:8000/thesauri/test/n%d" % Entry.objects.count(), label="n", context=self.context)
+            other.parent = self.entry
+            other.save()
+            self.entry.meanings.add(other)
+            self.entry.words.add(other)
+            self.entry.word_senses.add(other)
+            self.entry.types.add(URI.objects.create(uri="http://example.org/t%d" % other.pk))
+            EntryReference.objects.create(subject=self.entry, object=other, relation='hyponym')
+
+    def test_bounded_number_of_queries(self):
+        """
+        Tests that the page costs the same number of queries no matter how many neighbours the entry has
+        """
+        self.add_neighbours(1)
+        self.assertNumQueries(10, lambda: render_entry_page(self.entry))
+        self.add_neighbours(5)
+        html = []
+        self.assertNumQueries(10, lambda: html.append(render_entry_page(self.entry)))
+        self.assertEqual(html[0].count("title='Show narrower'"), 6)
+        self.assertEqual(html[0].count("title='show relation'"), 6)
+        self.assertTrue("title='Show related entry'>synset</a>" in html[0])
+        self.assertTrue(">external</a>" in html[0])
+        self.assertTrue('xml:lang="en">literal</span>' in html[0])
+
+    def test_view_model(self):
+        page = build_entry_page(self.entry)
+        self.assertEqual(page['parent'].label, "parent")
+        self.assertEqual(page['in_synset'].label, "synset")
+        self.assertEqual(sorted(t.object_entry is not None for t in page["triples"] if t.object_id), [False, True])
+
+    def test_pages_of_several_entries(self):
+        """
+        Tests that the pages loaded together are the same as the pages loaded one by one
+        """
+        self.add_neighbours(3)
+        entries = [self.entry] + list(Entry.objects.filter(parent=self.entry))
+        for size in (2, 50):
+            pages = build_entry_pages(entries, size=size)
+            for entry, page in zip(entries, pages):
+                single = build_entry_page(entry, size=size)
+                for name in ('types', 'meanings', 'words', 'word_senses', 'children', 'relations', 'triples'):
+                    self.assertEqual([obj.pk for obj in page[name]], [obj.pk for obj in single[name]])
+                for name in ('children', 'relations', 'triples'):
+                    self.assertEqual(page[name + '_count'], single[name + '_count'])
+                    self.assertEqual(page[name + '_next'] is None, single[name + '_next'] is None)
+        for entry, page in zip(entries, build_entry_pages(entries)):
+            self.assertTrue(render_entry_page(entry, page) == render_entry_page(entry))
+
+    def test_sections_paging(self):
+        self.add_neighbours(5)
+        Entry.objects.create(uri="http://localhost:8000/thesauri/test/unlabelled", parent=self.entry, context=self.context)
+        page = build_entry_page(self.entry, size=2)
+        self.assertEqual(len(page['children']), 2)
+        self.assertEqual(page['children_count'], 6)
+        self.assertEqual(page['triples_count'], 3)
+        self.assertEqual(page['relations_count'], 5)
+        html = render_to_string('basic/lookup.html', page)
+        self.assertTrue("more narrower concepts (2 of 6)" in html)
+        # -- the rest of the children page by page
+        uris = [child.uri for child in page['children']]
+        cursor = page['children_next']
+        while cursor:
+            response = self.client.get("/vocabularies/section", {'uri': self.entry.uri, 'section': 'children', 'cursor': cursor, 'size': 2})
+            result = simplejson.loads(response.content)
+            self.assertEqual(result['count'], 6)
+            uris += [item['uri'] for item in result['items']]
+            cursor = result['next']
+        self.assertEqual(len(set(uris)), 6)
+        self.assertEqual(uris[-1], "http://localhost:8000/thesauri/test/unlabelled")
+        response = self.client.get("/vocabularies/section", {'uri': self.entry.uri, 'section': 'children', 'cursor': "x"})
+        self.assertEqual(response.status_code, 400)
+
+from ov_django.ov import views
+from ov_django.ov.paging import browse
+
+class RootsBrowseTest(TestCase):
+    def setUp(self):
+        self.context = Context.objects.create(label="Test", uri="http://localhost:8000/thesauri/test", ns="ex")
+        for i in range(23):
+            Entry.objects.create(uri="http://localhost:8000/thesauri/test/r%d" % i, label="root %02d" % (i % 20) if i < 20 else None,
+                                 context=self.context, is_root=True)
+        self.roots = self.context.get_root_entries()
+
+    def test_forward_and_backward(self):
+        pages = [browse(self.roots, 'label', size=10)]
+        while pages[-1].has_next():
+            pages.append(browse(self.roots, 'label', after=pages[-1].next_cursor, size=10))
+        self.assertEqual([len(page) for page in pages], [10, 10, 3])
+        labels = [root.label for page in pages for root in page.object_list]
+        self.assertEqual(labels, ["root %02d" % i for i in range(20)] + [None] * 3)
+        self.assertFalse(pages[0].has_previous())
+        # -- and back again
+        back = browse(self.roots, 'label', before=pages[2].previous_cursor, size=10)
+        self.assertEqual(back.object_list, pages[1].object_list)
+        back = browse(self.roots, 'label', before=back.previous_cursor, size=10)
+        self.assertEqual(back.object_list, pages[0].object_list)
+        self.assertFalse(back.has_previous())
+
+    def test_vocabulary_page(self):
+        response = self.client.get("/vocabularies", {'uri': self.context.uri})
+        self.assertTrue("Page 1 of 3" in response.content)
+        cursor = response.context['results'][0].roots.next_cursor
+        response = self.client.get("/vocabularies", {'uri': self.context.uri, 'after': cursor, 'page': 2})
+        self.assertTrue("Page 2 of 3" in response.content)
+        self.assertEqual(response.context['results'][0].roots.object_list[0].label, "root 10")
+
+    def test_huge_roots_set(self):
+        limit, views.ROOTS_COUNT_LIMIT = views.ROOTS_COUNT_LIMIT, 15
+        try:
+            response = self.client.get("/vocabularies", {'uri': self.context.uri})
+        finally:
+            views.ROOTS_COUNT_LIMIT = limit
+        self.assertTrue("Page 1\n" in response.content)
+        self.assertTrue('rel="next">Next</a>' in response.content)
+
+from ov_django.ov.models import Tag
+from ov_django.ov import facets
+
+class FacetsTest(TestCase):
+    def setUp(self):
+        words = Tag.objects.create(label="words")
+        for i, (type, lang) in enumerate([('tez', 'en'), ('tez', 'pl'), ('tax', 'en'), ('tax', 'en')]):
+            context = Context.objects.create(label="C%d" % i, uri="http://example.org/c%d" % i, ns="c%d" % i, type=type, lang=lang)
+            if type == 'tez':
+                context.tags.add(words, Tag.objects.create(label="t%d" % i))
+        Context.objects.create(label="hidden", uri="http://example.org/hidden", ns="h", type='tax', visible=False)
+
+    def test_counts(self):
+        result = []
+        self.assertNumQueries(2, lambda: result.append(facets.get_facets()))
+        self.assertEqual(result[0], {'types': {'tez': 2, 'tax': 2}, 'langs': {'en': 3, 'pl': 1},
+                                     'tags': {'words': 2, 't0': 1, 't1': 1}})
+        # -- only the stamp is read when the counts are cached
+        self.assertNumQueries(1, lambda: facets.count_by('langs', 'en'))
+        # -- a change of contexts makes the counts stale
+        Context.objects.create(label="new", uri="http://example.org/new", ns="n", type='tax', lang='de')
+        self.assertEqual(facets.count_by('langs', 'de'), 1)
+        Context.objects.get(label="C0").tags.clear()
+        self.assertEqual(facets.count_by('tags', 'words'), 1)
+        Tag.objects.get(label="t1").delete()
+        self.assertEqual(facets.count_by('tags', 't1'), 0)
+        # -- as a process without the signals would change them
+        Context.objects.filter(label="C3").update(visible=False, modified=datetime.datetime.now() + datetime.timedelta(seconds=1))
+        self.assertEqual(facets.count_by('types', 'tax'), 2)
+        Context.objects.filter(label="new").delete()
+        self.assertEqual(facets.count_by('types', 'tax'), 1)
+
+    def test_sidebar_and_api(self):
+        response = self.client.get("/vocabularies")
+        self.assertTrue("Taxonomy (2)" in response.content)
+        self.assertTrue('class="blog-tag-size-3" rel="tag">en</a>' in response.content)
+        self.assertEqual(simplejson.loads(self.client.get("/facets").content)['types'], {'tez': 2, 'tax': 2})
+
+from ov_django.ov.uris import canonical_uri
+from ov_django.ov.models import URIAlias
+from ov_django.ov.resolver import resolve
+
+class CanonicalURITest(TestCase):
+    def setUp(self):
+        self.context = Context.objects.create(label="Test", uri="HTTP://LocalHost:8000/thesauri/test/", ns="ex")
+        self.entry = Entry.objects.create(uri="http://localhost:8000/thesauri/test/a%7eb/", label="entry", context=self.context)
+
+    def test_canonical_form(self):
+        self.assertEqual(canonical_uri("HTTP://Example.ORG:80/a/b/"), "http://example.org/a/b")
+        self.assertEqual(canonical_uri("http://example.org"), "http://example.org/")
+        self.assertEqual(canonical_uri("http://example.org/a%2fb%7E c"), "http://example.org/a%2Fb~%20c")
+        self.assertEqual(canonical_uri("http://example.org/ns#"), "http://example.org/ns#")
+        self.assertEqual(canonical_uri("http://example.org/a/?x=1"), "http://example.org/a/?x=1")
+        self.assertEqual(canonical_uri("urn:isbn:0451450523"), "urn:isbn:0451450523")
+
+    def test_stored_canonical(self):
+        self.assertEqual(Context.objects.get(pk=self.context.pk).uri, "http://localhost:8000/thesauri/test")
+        self.assertEqual(Entry.objects.get(pk=self.entry.pk).uri, "http://localhost:8000/thesauri/test/a~b")
+        self.assertEqual(Entry.objects.get(uri="http://LOCALHOST:8000/thesauri/test/a~b/").pk, self.entry.pk)
+        self.assertEqual(Context.objects.get(uri="http://localhost:8000/thesauri/test/").pk, self.context.pk)
+
+    def test_resolver(self):
+        self.assertNumQueries(1, lambda: resolve("http://localhost:8000/thesauri/test/"))
+        self.assertEqual(resolve("http://localhost:8000/thesauri/test/a%7Eb/").pk, self.entry.pk)
+        self.assertEqual(resolve("http://www.openvocabulary.info/thesauri/test/a~b"), None)
+        URIAlias.objects.create(alias="http://www.openvocabulary.info/thesauri/test/a~b/", uri=self.entry.uri)
+        self.assertEqual(resolve("http://www.openvocabulary.info/thesauri/test/a~b", (Entry,)).pk, self.entry.pk)
+
+    def test_views(self):
+        self.assertEqual(self.client.get("/html/thesauri/test/a~b/").status_code, 200)
+        self.assertEqual(self.client.get("/data/thesauri/test/a%7Eb").status_code, 200)
+        response = self.client.get("/vocabularies/lookup", {'uri': "http://localhost:8000/thesauri/test/"})
+        self.assertEqual(response.context['results'][0].pk, self.context.pk)
+
+from ov_django.ov.conditional import CACHE_CONTROL
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        self.context = Context.objects.create(label="Test", uri="http://localhost:8000/thesauri/test", ns="ex", visible=True)
+        self.entry = Entry.objects.create(uri="http://localhost:8000/thesauri/test/e1", label="first", context=self.context)
+
+    def test_entry_validators(self):
+        response = self.client.get("/data/thesauri/test/e1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], CACHE_CONTROL['data'])
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+        # -- the current representation is not rendered again
+        stats = rendercache.get_stats()['ttl']
+        response = self.client.get("/data/thesauri/test/e1", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, "")
+        self.assertEqual(rendercache.get_stats()['ttl'], stats)
+        # -- other media type, other tag
+        response = self.client.get("/data/thesauri/test/e1", HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT="application/rdf+xml")
+        self.assertEqual(response.status_code, 200)
+        # -- a write in the context changes the tag
+        Entry.objects.create(uri="http://localhost:8000/thesauri/test/e2", label="child", context=self.context, parent=self.entry)
+        response = self.client.get("/data/thesauri/test/e1", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_if_modified_since(self):
+        response = self.client.get("/html/thesauri/test/e1")
+        self.assertEqual(response["Cache-Control"], CACHE_CONTROL['html'])
+        response = self.client.get("/html/thesauri/test/e1", HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get("/html/thesauri/test/e1", HTTP_IF_MODIFIED_SINCE="Sat, 01 Jan 2000 00:00:00 GMT")
+        self.assertEqual(response.status_code, 200)
+
+    def test_export_and_api(self):
+        response = self.client.get("/export/nt", {'uri': self.context.uri})
+        self.assertEqual(response["Cache-Control"], CACHE_CONTROL['export'])
+        response = self.client.get("/export/nt", {'uri': self.context.uri}, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get("/get/path/%d" % self.entry.pk)
+        self.assertEqual(response["Cache-Control"], CACHE_CONTROL['api'])
+        response = self.client.get("/get/path/%d" % self.entry.pk, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get("/facets", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get("/facets", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+from ov_django.ov.resolver import resolve_many
+from ov_django.ov import batch
+
+class BatchLookupTest(TestCase):
+    def setUp(self):
+        self.context = Context.objects.create(label="Test", uri="http://localhost:8000/thesauri/test", ns="ex", lang="en")
+        other = Context.objects.create(label="Other", uri="http://localhost:8000/thesauri/other", ns="ot", lang="pl")
+        self.synsets = {}
+        for context, name, words in ((self.context, "feline", ("cat", "puss")), (self.context, "pet", ("cat", "dog")),
+                                     (other, "kot", ("cat",))):
+            synset = Entry.objects.create(uri="%s/%s" % (context.uri, name), label=name, synset_id=name, context=context)
+            for word in words:
+                sense = Entry.objects.create(uri="%s/%s-%s" % (context.uri, name, word), label=word, context=context)
+                synset.word_senses.add(sense)
+            self.synsets[name] = synset
+        Entry.objects.create(uri="http://localhost:8000/thesauri/test/catalog", label="Catalog", context=self.context)
+
+    def post(self, path, data):
+        response = self.client.post(path, simplejson.dumps(data), content_type="application/json")
+        return response.status_code, simplejson.loads(response.content)
+
+    def test_all_synsets(self):
+        status, result = self.post("/batch/search/allsynsets", {'words': ["cat", "dog", "cow"], 'lang': "en"})
+        self.assertEqual(status, 200)
+        self.assertEqual(sorted(synset['label'] for synset in result['cat']), ["feline", "pet"])
+        self.assertEqual([synset['id'] for synset in result['dog']], [self.synsets['pet'].pk])
+        self.assertEqual(result['cow'], [])
+        status, result = self.post("/batch/search/allsynsets", {'words': ["cat"], 'lang': "en", 'limit': 1})
+        self.assertEqual(len(result['cat']), 1)
+        # -- form fields
+        response = self.client.post("/batch/search/allsynsets", {'word': ["cat", "puss"], 'lang': "pl"})
+        result = simplejson.loads(response.content)
+        self.assertEqual([synset['label'] for synset in result['cat']], ["kot"])
+        self.assertEqual(result['puss'], [])
+
+    def test_synset_and_prefix(self):
+        status, result = self.post("/batch/search/synset", {'words': ["puss", "cata"], 'context_namespace': self.context.uri})
+        self.assertEqual([synset['label'] for synset in result['puss']], ["feline"])
+        self.assertEqual([entry['label'] for entry in result['cata']], ["Catalog"])
+
+    def test_uris(self):
+        uris = [self.synsets['pet'].uri + "/", "http://localhost:8000/thesauri/test/none", self.synsets['kot'].uri]
+        self.assertNumQueries(1, lambda: resolve_many(uris[:1] + uris[2:], (Entry,)))
+        status, result = self.post("/batch/get/uri", {'uris': uris})
+        self.assertEqual(result[uris[0]]['id'], self.synsets['pet'].pk)
+        self.assertEqual(result[uris[1]], None)
+        self.assertEqual(result[uris[2]]['label'], "kot")
+
+    def test_limits(self):
+        self.assertEqual(self.post("/batch/search/allsynsets", {'words': [], 'lang': "en"})[0], 400)
+        self.assertEqual(self.post("/batch/search/allsynsets", {'words': ["cat"]})[0], 400)
+        self.assertEqual(self.post("/batch/get/uri", {'uris': ["x"] * (batch.MAX_ITEMS + 1)})[0], 400)
+
+class SynsetDictTest(TestCase):
+    def setUp(self):
+        self.context = Context.objects.create(label="Test", uri="http://localhost:8000/thesauri/test", ns="ex", lang="en")
+        self.animal = Entry.objects.create(uri="http://localhost:8000/thesauri/test/animal", label="animal", synset_id="a", context=self.context)
+        self.synsets = []
+        for name in ("cat", "dog", "cow"):
+            synset = Entry.objects.create(uri="http://localhost:8000/thesauri/test/%s" % name, label=name, synset_id=name,
+                                          gloss="a %s" % name, parent=self.animal, context=self.context)
+            for i in range(2):
+                sense = Entry.objects.create(uri="%s-%d" % (synset.uri, i), label=name, tag_count=i, context=self.context)
+                word = Entry.objects.create(uri="%s-w%d" % (synset.uri, i), lexical_form="%s%d" % (name, i), context=self.context)
+                sense.words.add(word)
+                synset.word_senses.add(sense)
+            self.synsets.append(synset)
+
+    def test_bulk_queries(self):
+        synsets = list(Entry.objects.filter(synset_id__in=["cat", "dog", "cow"]).select_related('context'))
+        self.assertNumQueries(3, Entry.objects.synset_dicts, synsets)
+        dicts = Entry.objects.synset_dicts(synsets)
+        cat = [d for d in dicts if d['label'] == "cat"][0]
+        self.assertEqual(cat['gloss'], "a cat")
+        self.assertEqual(cat['context'], {'id': self.context.id, 'uri': self.context.uri, 'lang': "en"})
+        self.assertEqual(cat['parent']['id'], self.animal.id)
+        self.assertEqual(len(cat['word_senses']), 2)
+        self.assertEqual(sorted(word['lexical_form'] for sense in cat['word_senses'] for word in sense['words']), ["cat0", "cat1"])
+        self.assertEqual(Entry.objects.synset_dicts([]), [])
+
+    def test_handlers(self):
+        response = self.client.get("/search/allsynsets/dog", {'lang': "en"})
+        result = simplejson.loads(response.content)
+        self.assertEqual([synset['id'] for synset in result], [self.synsets[1].id])
+        response = self.client.get("/get/uri", {'uri': self.synsets[2].uri})
+        self.assertEqual(simplejson.loads(response.content)['synset_id'], "cow")
+        response = self.client.get("/search/synset/anim", {'context_namespace': self.context.uri})
+        self.assertEqual([synset['label'] for synset in simplejson.loads(response.content)], ["animal"])
+
+class RelatedTest(TestCase):
+    def setUp(self):
+        self.context = Context.objects.create(label="Test", uri="http://localhost:8000/thesauri/test", ns="ex")
+        self.hub = Entry.objects.create(uri="http://localhost:8000/thesauri/test/hub", label="hub", context=self.context)
+        for i in range(3):
+            other = Entry.objects.create(uri="http://localhost:8000/thesauri/test/o%d" % i, label="o%d" % i, context=self.context)
+            EntryReference.objects.create(subject=self.hub, object=other, relation="hyponym")
+            EntryReference.objects.create(subject=other, object=self.hub, relation="hypernym")
+        EntryReference.objects.create(subject=self.hub, object=self.hub, relation="similarTo")
+
+    def get(self, **params):
+        return simplejson.loads(self.client.get("/search/related/%d" % self.hub.pk, params).content)
+
+    def test_grouped(self):
+        result = self.get()
+        self.assertEqual(sorted(result['relations']), ["hypernym", "hyponym", "similarTo"])
+        self.assertEqual(len(result['relations']['hyponym']), 3)
+        self.assertEqual(len(result['relations']['similarTo']), 1)
+        self.assertEqual(result['relations']['hypernym'][0]['object']['label'], "hub")
+        self.assertEqual(result['next'], None)
+        result = self.get(relation="hyponym")
+        self.assertEqual(sorted(result['relations']), ["hyponym"])
+
+    def test_pages(self):
+        seen = []
+        cursor = None
+        while True:
+            result = self.get(size=2, **({'cursor': cursor} if cursor else {}))
+            for references in result['relations'].values():
+                seen.extend((ref['subject']['label'], ref['relation'], ref['object']['label']) for ref in references)
+            cursor = result['next']
+            if not cursor:
+                break
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(len(set(seen)), 7)
+        self.assertEqual(self.client.get("/search/related/%d" % self.hub.pk, {'cursor': "bogus"}).status_code, 400)
+
+from ov_django.ov.streaming import iter_chunks
+
+class StreamingTest(TestCase):
+    def setUp(self):
+        self.context = Context.objects.create(label="Test", uri="http://localhost:8000/thesauri/test", ns="ex", lang="en")
+        for i in range(5):
+            synset = Entry.objects.create(uri="http://localhost:8000/thesauri/test/s%d" % i, label="s%d" % i, synset_id="s%d" % i, context=self.context)
+            synset.word_senses.add(Entry.objects.create(uri="%s-ws" % synset.uri, label="word", context=self.context))
+
+    def test_chunks(self):
+        chunks = list(iter_chunks(Entry.objects.filter(synset_id__isnull=False), 2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 2, 1])
+        self.assertEqual(len(set(entry.pk for chunk in chunks for entry in chunk)), 5)
+
+    def test_ndjson(self):
+        response = self.client.get("/search/allsynsets/word", {'lang': "en", 'stream': 1})
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        lines = response.content.splitlines()
+        self.assertEqual(sorted(simplejson.loads(line)['label'] for line in lines), ["s%d" % i for i in range(5)])
+        response = self.client.get("/search/synset/word", {'context_namespace': self.context.uri}, HTTP_ACCEPT="application/x-ndjson")
+        self.assertEqual(len(response.content.splitlines()), 5)
+
+    def test_json_array(self):
+        streamed = self.client.get("/search/allsynsets/word", {'lang': "en", 'stream': "json"})
+        self.assertEqual(simplejson.loads(streamed.content),
+                         simplejson.loads(self.client.get("/search/allsynsets/word", {'lang': "en"}).content))
+
+from ov_django.ov import autocomplete
+
+class AutocompleteTest(TestCase):
+    def setUp(self):
+        self.context = Context.objects.create(label="Test", uri="http://localhost:8000/thesauri/test", ns="ex", lang="pl")
+        self.other = Context.objects.create(label="Other", uri="http://localhost:8000/thesauri/other", ns="ot", lang="pl")
+        for i, (label, tag_count) in enumerate(((u"\u017b\xf3\u0142w", 5), (u"\u017curaw", 10), (u"zebra", 1), (u"ko\u0144", 7))):
+            Entry.objects.create(uri="http://localhost:8000/thesauri/test/%d" % i, label=label, tag_count=tag_count, context=self.context)
+        Entry.objects.create(uri="http://localhost:8000/thesauri/other/w", lexical_form=u"zubr", tag_count=8, context=self.other)
+        autocomplete.refresh()
+
+    def test_prefixes(self):
+        self.assertEqual(autocomplete.normalize(u"  \u017b\xf3\u0142w  B\u0142otny "), u"zolw blotny")
+        labels = lambda results: [result['label'] for result in results]
+        self.assertEqual(labels(autocomplete.complete(u"z", context_id=self.context.id)), [u"\u017curaw", u"\u017b\xf3\u0142w", u"zebra"])
+        self.assertEqual(labels(autocomplete.complete(u"ZU", lang="pl")), [u"\u017curaw", u"zubr"])
+        self.assertEqual(labels(autocomplete.complete(u"\u017c\xf3\u0142w", lang="pl", limit=1)), [u"\u017b\xf3\u0142w"])
+        self.assertEqual(autocomplete.complete(u"x", lang="pl"), [])
+
+    def test_refresh_and_endpoint(self):
+        autocomplete.complete(u"k", context_id=self.context.id)
+        Entry.objects.create(uri="http://localhost:8000/thesauri/test/k", label=u"kot", tag_count=9, context=self.context)
+        autocomplete._checked = 0
+        results = autocomplete.complete(u"k", context_id=self.context.id)
+        self.assertEqual([result['label'] for result in results], [u"kot", u"ko\u0144"])
+        response = self.client.get("/autocomplete/ko", {'context_namespace': self.context.uri, 'limit': 1})
+        self.assertEqual([result['label'] for result in simplejson.loads(response.content)], [u"kot"])
+        self.assertEqual(self.client.get("/autocomplete/ko").status_code, 400)
+
+    def test_snapshot(self):
+        path = os.path.join(tempfile.mkdtemp(), "autocomplete.pickle")
+        self.assertEqual(autocomplete.write_snapshot(path), 5)
+        self.assertTrue(os.path.exists(path))
+        shutil.rmtree(os.path.dirname(path))
+
+    def test_label_and_lexical_form(self):
+        """
+        Tests that an entry is found by both its label and lexical form, once
+        """
+        entry = Entry.objects.create(uri="http://localhost:8000/thesauri/other/s", label=u"bison", lexical_form=u"bizon",
+                                     tag_count=2, context=self.other)
+        autocomplete.refresh()
+        for prefix in (u"bis", u"biz", u"bi", u"bison", u"bizon"):
+            self.assertEqual([result['id'] for result in autocomplete.complete(prefix, context_id=self.other.id)], [entry.id])
+        self.assertEqual([result['id'] for result in autocomplete.complete(u"b", context_id=self.other.id)], [entry.id])
+        self.assertEqual([match['id'] for match in fuzzy.match(u"bisom", context_id=self.other.id, k=2)], [entry.id])
+
+    def test_warm(self):
+        self.assertEqual(autocomplete.warm(), 5)
+        self.assertEqual(sorted(autocomplete._indexes), sorted([self.context.id, self.other.id]))
+
+from django.test.client import RequestFactory
+from ov_django.ov import fuzzy
+
+class FuzzyTest(TestCase):
+    def setUp(self):
+        self.context = Context.objects.create(label="Test", uri="http://localhost:8000/thesauri/test", ns="ex", lang="pl")
+        for i, (label, tag_count) in enumerate(((u"\u017b\xf3\u0142w", 5), (u"\u017curaw", 10), (u"zebra", 1),
+                                                (u"kr\xf3lik domowy", 7), (u"krowa", 3))):
+            Entry.objects.create(uri="http://localhost:8000/thesauri/test/%d" % i, label=label, tag_count=tag_count, context=self.context)
+        autocomplete.refresh()
+
+    def test_distance(self):
+        self.assertEqual(fuzzy.distance(u"kitten", u"sitting", 3), 3)
+        self.assertEqual(fuzzy.distance(u"kitten", u"sitting", 2), 3)
+        self.assertEqual(fuzzy.distance(u"", u"ab", 2), 2)
+
+    def test_match(self):
+        labels = lambda results: [(result['label'], result['distance']) for result in results]
+        self.assertEqual(labels(fuzzy.match(u"zolw", lang="pl")), [(u"\u017b\xf3\u0142w", 0)])
+        self.assertEqual(labels(fuzzy.match(u"krulik domowy", lang="pl")), [(u"kr\xf3lik domowy", 1)])
+        self.assertEqual(labels(fuzzy.match(u"zuraf", lang="pl")), [(u"\u017curaw", 1)])
+        self.assertEqual(labels(fuzzy.match(u"krwa", context_id=self.context.id, k=2)), [(u"krowa", 1)])
+        self.assertEqual(fuzzy.match(u"xyz", lang="pl"), [])
+        # -- rebuilt after a write
+        Entry.objects.create(uri="http://localhost:8000/thesauri/test/z", label=u"zebu", context=self.context)
+        autocomplete.refresh()
+        self.assertEqual(labels(fuzzy.match(u"zebr", lang="pl", k=1)), [(u"zebra", 1), (u"zebu", 1)])
+
+    def test_endpoint_and_fallback(self):
+        response = self.client.get("/fuzzy/zuraf", {'lang': "pl"})
+        self.assertEqual(simplejson.loads(response.content)[0]['label'], u"\u017curaw")
+        self.assertEqual(self.client.get("/fuzzy/zuraf").status_code, 400)
+        request = RequestFactory().get("/search/label/zuraf", {'fuzzy': 1}, HTTP_LANG="pl", HTTP_ACCEPT_ENCODING="application/json")
+        self.assertEqual(simplejson.loads(views.search_label(request, u"zuraf").content), "http://localhost:8000/thesauri/test/1")
+        request = RequestFactory().get("/search/label/zuraf", HTTP_LANG="pl", HTTP_ACCEPT_ENCODING="application/json")
+        self.assertEqual(views.search_label(request, u"zuraf").status_code, 404)
+        request = RequestFactory().get("/search/label/zuraf", {'fuzzy': 0}, HTTP_LANG="pl", HTTP_ACCEPT_ENCODING="application/json")
+        self.assertEqual(views.search_label(request, u"zuraf").status_code, 404)
+        # -- an explicit fuzzy=0 turns the fallback off even where it is on by default
+        default, views.SEARCH_LABEL_FUZZY = views.SEARCH_LABEL_FUZZY, True
+        try:
+            self.assertEqual(views.search_label(request, u"zuraf").status_code, 404)
+            request = RequestFactory().get("/search/label/zuraf", HTTP_LANG="pl", HTTP_ACCEPT_ENCODING="application/json")
+            self.assertEqual(views.search_label(request, u"zuraf").status_code, 200)
+        finally:
+            views.SEARCH_LABEL_FUZZY = default
+
+import math
+from ov_django.ov import similarity
+
+class SimilarityTest(TestCase):
+    def setUp(self):
+        self.context = Context.objects.create(label="Test", uri="http://localhost:8000/thesauri/test", ns="ex")
+        entry = lambda name, parent=None, context=self.context: Entry.objects.create(
+            uri="%s/%s" % (context.uri, name), label=name, synset_id=name, parent=parent, context=context)
+        self.entity = entry("entity")
+        self.animal = entry("animal", self.entity)
+        self.cat = entry("cat", self.animal)
+        self.dog = entry("dog")
+        self.plant = entry("plant", self.entity)
+        self.rose = entry("rose")
+        EntryReference.objects.create(subject=self.dog, object=self.animal, relation="hypernym")
+        EntryReference.objects.create(subject=self.plant, object=self.rose, relation="hyponym")
+        other = Context.objects.create(label="Other", uri="http://localhost:8000/thesauri/other", ns="ot")
+        self.other = entry("other", context=other)
+        autocomplete.refresh()
+
+    def test_measures(self):
+        cat_dog, cat_rose, cat_cat, cat_other = similarity.compare(
+            [(self.cat.pk, self.dog.pk), (self.cat.pk, self.rose.pk), (self.cat.pk, self.cat.pk), (self.cat.pk, self.other.pk)])
+        self.assertEqual((cat_dog['lcs'], cat_dog['path_length']), (self.animal.pk, 2))
+        self.assertAlmostEqual(cat_dog['path'], 1.0 / 3)
+        self.assertAlmostEqual(cat_dog['wup'], 2.0 / 3)
+        self.assertAlmostEqual(cat_dog['lch'], math.log(2))
+        self.assertEqual((cat_rose['lcs'], cat_rose['path_length']), (self.entity.pk, 4))
+        self.assertAlmostEqual(cat_rose['wup'], 1.0 / 3)
+        self.assertEqual((cat_cat['lcs'], cat_cat['path']), (self.cat.pk, 1.0))
+        self.assertEqual(cat_other['lcs'], None)
+        self.assertEqual(similarity.get_graph(self.context.pk).max_depth, 3)
+
+    def test_edges_of_references_without_partition_key(self):
+        EntryReference.objects.filter(subject=self.dog).update(context=None)
+        self.assertTrue((self.dog.pk, self.animal.pk) in list(similarity.hypernym_edges(self.context.pk)))
+
+    def test_endpoints(self):
+        result = simplejson.loads(self.client.get("/similarity/%d/%d" % (self.cat.pk, self.dog.pk)).content)
+        self.assertEqual(result['lcs']['label'], "animal")
+        response = self.client.post("/similarity", simplejson.dumps({'pairs': [[self.cat.pk, self.rose.pk], [self.dog.pk, self.other.pk]]}),
+                                    content_type="application/json")
+        result = simplejson.loads(response.content)
+        self.assertEqual([r['lcs'] and r['lcs']['label'] for r in result], ["entity", None])
+        response = self.client.post("/similarity", {'pair': ["%d,%d" % (self.cat.pk, self.dog.pk)]})
+        self.assertEqual(simplejson.loads(response.content)[0]['path_length'], 2)
+        self.assertEqual(self.client.post("/similarity", {'pair': ["1,2,3"]}).status_code, 400)
+
+
+from ov_django.ov import annotator
+
+class AnnotateTest(TestCase):
+    def setUp(self):
+        self.context = Context.objects.create(label="Test", uri="http://localhost:8000/thesauri/test", ns="ex", lang="en")
+        self.synsets = {}
+        for name, labels in (("machine", ("machine learning",)), ("learning", ("learning",)), ("dog", ("hot dog", "dog"))):
+            synset = Entry.objects.create(uri="%s/%s" % (self.context.uri, name), label=name, synset_id=name, context=self.context)
+            for label in labels:
+                sense = Entry.objects.create(uri="%s/%s-%s" % (synset.uri, name, len(label)), label=label, context=self.context)
+                synset.word_senses.add(sense)
+            self.synsets[name] = synset
+        word = Entry.objects.create(uri="%s/w-cafe" % self.context.uri, lexical_form=u"caf\u00e9", context=self.context)
+        self.synsets["dog"].word_senses.all()[0].words.add(word)
+        self.taxonomy = Context.objects.create(label="Taxonomy", uri="http://localhost:8000/taxonomies/t", ns="tx", lang="pl")
+        self.science = Entry.objects.create(uri="%s/science" % self.taxonomy.uri, label="Computer Science", context=self.taxonomy)
+        autocomplete.refresh()
+
+    def test_annotate(self):
+        text = u"Machine  learning of a hot-dog in the CAFE."
+        spans = annotator.annotate(text, lang="en")
+        self.assertEqual([span['text'] for span in spans], [u"Machine  learning", u"hot-dog", u"CAFE"])
+        self.assertEqual(spans[0]['candidates'], [(self.context.pk, self.synsets["machine"].pk)])
+        self.assertEqual(spans[2]['candidates'], [(self.context.pk, self.synsets["dog"].pk)])
+        spans = annotator.annotate(text, lang="en", overlapping=True)
+        self.assertEqual([span['text'] for span in spans], [u"Machine  learning", u"learning", u"hot-dog", u"dog", u"CAFE"])
+        spans = annotator.annotate(u"computer science", context_id=self.taxonomy.pk)
+        self.assertEqual(spans[0]['candidates'], [(self.taxonomy.pk, self.science.pk)])
+
+    def test_endpoint(self):
+        response = self.client.post("/annotate", simplejson.dumps({'text': u"machine learning", 'lang': "en"}),
+                                    content_type="application/json")
+        spans = simplejson.loads(response.content)['spans']
+        self.assertEqual([(span['start'], span['end']) for span in spans], [(0, 16)])
+        self.assertEqual(spans[0]['candidates'][0]['label'], "machine")
+        response = self.client.post("/annotate", {'text': u"Computer science", 'context_namespace': self.taxonomy.uri})
+        self.assertEqual(simplejson.loads(response.content)['spans'][0]['candidates'][0]['id'], self.science.pk)
+        self.assertEqual(self.client.post("/annotate", {'text': u"machine"}).status_code, 400)
+
+
+import zlib
+from ov_django.ov import serialization
+
+class SerializationTest(TestCase):
+    def setUp(self):
+        self.context = Context.objects.create(label="Test", uri="http://localhost:8000/thesauri/test", ns="ex", lang="en")
+        self.entry = Entry.objects.create(uri="http://localhost:8000/thesauri/test/cat", label="cat", synset_id="cat", context=self.context)
+
+    def test_msgpack(self):
+        self.assertEqual(serialization.packb({u"a": [1, -1, None, True]}), "\x81\xa1a\x94\x01\xff\xc0\xc3")
+        self.assertEqual(serialization.packb(256), "\xcd\x01\x00")
+        values = [0, 127, 128, -32, -33, -129, 65536, 2 ** 40, -2 ** 40, 1.5, u"\u017c\xf3\u0142w", u"x" * 300,
+                  range(20), dict((str(i), i) for i in xrange(20)), {u"nested": [{}, [], u""]}, False]
+        self.assertEqual(serialization.unpackb(serialization.packb(values)), values)
+        self.assertRaises(serialization.SerializationError, serialization.packb, object())
+
+    def test_negotiation(self):
+        response = self.client.get("/facets", HTTP_ACCEPT="application/x-msgpack")
+        self.assertEqual(response["Content-Type"], "application/x-msgpack")
+        self.assertEqual(serialization.unpackb(response.content), facets.get_facets())
+        response = self.client.post("/batch/get/uri", simplejson.dumps({'uris': [self.entry.uri]}), content_type="application/json",
+                                    HTTP_ACCEPT="application/msgpack;q=1, application/json;q=0.5")
+        self.assertEqual(serialization.unpackb(response.content)[self.entry.uri]['label'], "cat")
+        response = self.client.post("/batch/get/uri", simplejson.dumps({'uris': [self.entry.uri]}), content_type="application/json")
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(simplejson.loads(response.content)[self.entry.uri]['label'], "cat")
+        request = RequestFactory().get("/search/label/cat", HTTP_LANG="en", HTTP_ACCEPT="application/x-msgpack")
+        self.assertEqual(serialization.unpackb(views.search_label(request, "cat").content), self.entry.uri)
+
+    def test_compression(self):
+        uris = ["http://localhost:8000/thesauri/test/missing%d" % i for i in xrange(50)]
+        body = simplejson.dumps({'uris': uris})
+        response = self.client.post("/batch/get/uri", body, content_type="application/json", HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertEqual(sorted(simplejson.loads(zlib.decompress(response.content, 16 + zlib.MAX_WBITS))), sorted(uris))
+        response = self.client.post("/batch/get/uri", body, content_type="application/json", HTTP_ACCEPT_ENCODING="gzip;q=0, deflate")
+        self.assertEqual(response["Content-Encoding"], "deflate")
+        self.assertEqual(len(simplejson.loads(zlib.decompress(response.content))), 50)
+        response = self.client.post("/batch/get/uri", simplejson.dumps({'uris': uris[:1]}), content_type="application/json",
+                                    HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_etag_of_compressed_response(self):
+        plain = self.client.get("/facets")["ETag"]
+        compressed = self.client.get("/facets", HTTP_ACCEPT_ENCODING="gzip")["ETag"]
+        self.assertNotEqual(plain, compressed)
+        self.assertEqual(self.client.get("/facets", HTTP_IF_NONE_MATCH=compressed).status_code, 200)
+        self.assertEqual(self.client.get("/facets", HTTP_IF_NONE_MATCH=compressed, HTTP_ACCEPT_ENCODING="gzip").status_code, 304)
+
+
+import logging
+from ov_django.ov import metrics
+from ov_django.ov.urls import similarityOfSynsets
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        Context.objects.create(label="Test", uri="http://localhost:8000/thesauri/test", ns="ex", lang="en", type="tez")
+        metrics.reset()
+
+    def test_routes(self):
+        self.assertEqual(metrics.route_of("/similarity", similarityOfSynsets), "similarity[/]?$")
+        self.assertEqual(metrics.route_of("/similarity/1/2", similarityOfSynsets), r"similarity/(?P<id1>\d+)/(?P<id2>\d+)[/]?$")
+        self.assertEqual(metrics.route_of("/nowhere", None), metrics.UNMATCHED)
+
+    def test_exposition(self):
+        self.client.get("/facets")
+        self.client.get("/facets")
+        recorded = metrics.get_metrics()["facets[/]?$"]
+        self.assertEqual((recorded['count'], recorded['statuses']), (2, {'2xx': 2}))
+        self.assertTrue(recorded['queries'] >= 1 and recorded['bytes'] > 0)
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('ov_request_duration_seconds_count{route="facets[/]?$"} 2' in response.content)
+        self.assertTrue('ov_request_duration_seconds_bucket{route="facets[/]?$",le="+Inf"} 2' in response.content)
+        self.assertEqual(self.client.get("/metrics", REMOTE_ADDR="10.0.0.1").status_code, 403)
+
+    def test_slow_requests(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logging.getLogger('ov.metrics').addHandler(handler)
+        slow, metrics.SLOW_REQUEST = metrics.SLOW_REQUEST, 0
+        try:
+            self.client.get("/facets")
+        finally:
+            metrics.SLOW_REQUEST = slow
+            logging.getLogger('ov.metrics').removeHandler(handler)
+        self.assertEqual(len(records), 1)
+        self.assertTrue("SELECT" in records[0].getMessage())
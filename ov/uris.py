@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# encoding: utf-8
+"""
+uris.py
+
+Helpers for the hashed URI storage (canonical uri + fixed-width hash with the unique index)
+used by the Entry, URI and Predicate models, and the canonical form of URIs.
+
+URIs are stored in the canonical form and hashed in it, so any spelling of a URI
+differing only in the scheme/host case, default port, percent-encoding or a trailing
+slash is found with a single equality lookup on the hash.
+
+Copyright (c)  Knowledge Hives sp. z o.o.. All rights reserved.
+"""
+
+import re
+import string
+import hashlib
+import urlparse
+
+from django.utils.encoding import smart_str
+
+"""
+Width of the hash column (hex digest of MD5)
+"""
+URI_HASH_LENGTH = 32
+
+RE_PERCENT = re.compile(r"%([0-9A-Fa-f]{2})")
+UNRESERVED = set(string.ascii_letters + string.digits + "-._~")
+DISALLOWED = set(' "<>\\^`{|}')
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+def _unquote_unreserved(match):
+	char = chr(int(match.group(1), 16))
+	return char if char in UNRESERVED else "%" + match.group(1).upper()
+
+def _normalize_escapes(value):
+	"""
+	Decodes escaped unreserved characters, upper-cases other escapes and escapes characters not allowed in URIs
+	(non-ASCII characters of IRIs are kept)
+	"""
+	value = RE_PERCENT.sub(_unquote_unreserved, value)
+	result = []
+	for i, char in enumerate(value):
+		if char in DISALLOWED or ord(char) < 0x20 or ord(char) == 0x7f or \
+		   (char == "%" and not RE_PERCENT.match(value, i)):
+			result.append("%%%02X" % ord(char))
+		else:
+			result.append(char)
+	return "".join(result)
+
+def canonical_uri(uri):
+	"""
+	Returns canonical form of given URI: lower case scheme and host, no default port, normalized
+	percent-encoding and no trailing slash of the path (unless the path is just /)
+	"""
+	if not uri:
+		return uri
+	uri = _normalize_escapes(uri.strip())
+	scheme, netloc, path, query, fragment = urlparse.urlsplit(uri)
+	if not netloc:
+		return uri
+	scheme = scheme.lower()
+	userinfo, at, host = netloc.rpartition("@")
+	host = host.lower()
+	if ":" in host and not host.endswith("]"):
+		host, port = host.rsplit(":", 1)
+		if port and port != DEFAULT_PORTS.get(scheme):
+			host = host + ":" + port
+	if not path:
+		path = "/"
+	elif len(path) > 1 and path.endswith("/") and not query and not fragment:
+		path = path.rstrip("/") or "/"
+	result = urlparse.urlunsplit((scheme, userinfo + at + host, path, query, fragment))
+	# -- urlunsplit drops empty query and fragment
+	if fragment == "" and uri.endswith("#"):
+		result += "#"
+	return result
+
+def uri_hash(uri):
+	"""
+	Returns fixed-width hash of (the canonical form of) given URI used for indexed equality lookups
+	"""
+	if uri is None:
+		return None
+	return hashlib.md5(smart_str(canonical_uri(uri))).hexdigest()
@@ -36,12 +36,19 @@
 from django.conf.urls.defaults import *
 from piston.resource import Resource
 from ov_django.ov.handlers import *
+from ov_django.ov.streaming import stream_format, streaming_response
+from ov_django.ov.conditional import global_stamp, make_etag, not_modified, set_validators
+from ov_django.ov.serialization import DataResponse, response_format, compress, accepted_encoding
+from ov_django.ov import autocomplete
 
 urlpatterns = patterns('ov_django.ov.views',
 	(r'^$', 'welcome'),
 	(r'vocabularies[/]?$', 'list_vocabularies'),
 	(r'vocabularies/search$', 'search_concepts'),
 	(r'vocabularies/lookup$', 'lookup_concept'),
+	(r'vocabularies/section$', 'entry_section_page'),
+	(r'export/(?P<format>nt|ttl|rdf|jsonld)$', 'export_vocabulary'),
+	(r'^metrics$', 'metrics_exposition'),
 	(r'html/(?P<path>(?:taxonomies|thesauri|industries)[/].+)$', 'lookup_concept'),
 	(r'data/(?P<path>(?:taxonomies|thesauri|industries)[/].+)', 'rdfdata'),
 	(r'(?P<path>(?:taxonomies|thesauri|industries)[/].+)', 'redirect'),
@@ -57,12 +64,68 @@ class CsrfExemptResource(Resource):
 		super(CsrfExemptResource, self).__init__(handler, authentication)
 		self.csrf_exempt = getattr(self.handler, 'csrf_exempt', True)
 
+	def __call__(self, request, *args, **kwargs):
+		"""
+		Answers conditional GETs (ETag / Last-Modified) before the handler reads anything.
+		Handlers may define validators(request, *args, **kwargs) returning (etag, stamp);
+		by default the stamp of all the vocabularies is used.
+		Handlers defining stream(request, *args, **kwargs) stream the response if asked to (see ov/streaming.py).
+		Responses are serialized in the format asked for and compressed (see ov/serialization.py),
+		so the entity tag carries the content coding the request accepts.
+		"""
+		if request.method != 'GET':
+			return self.serialize(request, super(CsrfExemptResource, self).__call__(request, *args, **kwargs))
+		validators = getattr(self.handler, 'validators', None) or default_validators
+		etag, stamp = validators(request, *args, **kwargs)
+		coding = accepted_encoding(request)
+		if etag and coding:
+			etag = "%s-%s" % (etag, coding)
+		response = not_modified(request, etag, stamp, 'api')
+		if response is None:
+			format = stream_format(request) if hasattr(self.handler, 'stream') else None
+			if format:
+				response = streaming_response(self.handler.stream(request, *args, **kwargs), format)
+			else:
+				response = self.serialize(request, super(CsrfExemptResource, self).__call__(request, *args, **kwargs))
+			if response.status_code == 200:
+				set_validators(response, etag, stamp, 'api')
+		return response
+
+	def serialize(self, request, response):
+		if isinstance(response, DataResponse):
+			response.serialize(request)
+		return compress(request, response)
+
+	def determine_emitter(self, request, *args, **kwargs):
+		"""
+		Emitter of the handlers returning models: the format asked for by the Accept header unless given explicitly
+		"""
+		return kwargs.pop('emitter_format', None) or response_format(request)
+
+def default_validators(request, *args, **kwargs):
+	"""
+	Validators of API responses: the request (with the parameters passed in headers) and the last
+	modification of any vocabulary
+	"""
+	stamp = global_stamp()
+	meta = request.META
+	return make_etag(stamp, request.get_full_path(), meta.get('HTTP_LANG'), meta.get('HTTP_CONTEXT_NAMESPACE'),
+	                 meta.get('HTTP_URI'), meta.get('HTTP_ACCEPT')), stamp
+
 searchSynsetByWord = CsrfExemptResource(SearchSynsetByWordHandler)
 searchAllSynsetsByWord = CsrfExemptResource(SearchAllSynsetsByWordHandler)
 searchRelated = CsrfExemptResource(SearchRelatedHandler)
 getSynsetForId = CsrfExemptResource(GetSynsetForIdHandler)
 getPathForId = CsrfExemptResource(GetPathForIdHandler)
 getSynsetForUri = CsrfExemptResource(GetSynsetForUriHandler)
+getFacets = CsrfExemptResource(FacetsHandler)
+autocompleteLabel = CsrfExemptResource(AutocompleteHandler)
+fuzzyLabel = CsrfExemptResource(FuzzyLabelHandler)
+similarityOfSynsets = CsrfExemptResource(SimilarityHandler)
+annotateText = CsrfExemptResource(AnnotateHandler)
+batchSearchAllSynsetsByWord = CsrfExemptResource(BatchSearchAllSynsetsByWordHandler)
+batchSearchSynsetByWord = CsrfExemptResource(BatchSearchSynsetByWordHandler)
+batchGetSynsetForUri = CsrfExemptResource(BatchGetSynsetForUriHandler)
 
 """
 URL patterns for REST API. It uses Piston API (http://bitbucket.org/jespern/django-piston).
@@ -70,10 +133,24 @@ The default response serialization is JSON. To use different serialization add t
 { 'emitter_format': 'xml' }
 """
 urlpatterns += patterns('',
+	# -- batch lookups (POST) go first, the patterns below would match them
+	(r'^batch/search/allsynsets[/]?$', batchSearchAllSynsetsByWord),
+	(r'^batch/search/synset[/]?$', batchSearchSynsetByWord),
+	(r'^batch/get/uri[/]?$', batchGetSynsetForUri),
 	(r'search/synset/(?P<word>.+)[/]?$', searchSynsetByWord),
 	(r'search/allsynsets/(?P<word>.+)[/]?$', searchAllSynsetsByWord),
 	(r'search/related/(?P<id>\d+)[/]?$', searchRelated),
 	(r'get/id/(?P<id>\d+)[/]?$', getSynsetForId),
 	(r'get/path/(?P<id>\d+)[/]?$', getPathForId),
 	(r'get/uri[/]?$', getSynsetForUri),
+	(r'facets[/]?$', getFacets),
+	(r'autocomplete/(?P<prefix>.+?)[/]?$', autocompleteLabel),
+	(r'fuzzy/(?P<label>.+?)[/]?$', fuzzyLabel),
+	(r'similarity/(?P<id1>\d+)/(?P<id2>\d+)[/]?$', similarityOfSynsets),
+	(r'^similarity[/]?$', similarityOfSynsets),
+	(r'^annotate[/]?$', annotateText),
 )
+
+# -- autocomplete indexes built before the first autocomplete request (see ov/autocomplete.py)
+if autocomplete.WARM:
+	autocomplete.warm_in_background()
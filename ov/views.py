@@ -1,18 +1,26 @@
 # -*- coding: utf-8 -*-
 import datetime
-import re
+import urllib
 from exceptions import NotImplementedError
 
-from django.template.loader import get_template
+from django.template.loader import get_template, render_to_string
 from django.template import Context
-from django.http import HttpResponse, Http404, HttpResponseNotFound
+from django.http import HttpResponse, Http404, HttpResponseNotFound, HttpResponseBadRequest, HttpResponseForbidden
 from django.shortcuts import render_to_response, get_object_or_404
-from django.db.models import Q
+from django.db.models import Q, Count
 from django.core import serializers
-from django.core.paginator import Paginator
+from django.utils.cache import patch_vary_headers
 
 from ov_django.settings import BASE_URL_PATH, BASE_OV_PATH
 from ov_django.ov.models import *
+from ov_django.ov.export import EXPORT_FORMATS, export_context, gzip_stream
+from ov_django.ov.negotiation import SERIALIZERS_BY_MEDIA_TYPE, DEFAULT_SERIALIZER, rdf_media_types, negotiate
+from ov_django.ov.paging import keyset_page, browse
+from ov_django.ov.resolver import resolve
+from ov_django.ov.conditional import entry_stamp, context_stamp, make_etag, not_modified, set_validators
+from ov_django.ov import rendercache, facets, fuzzy, metrics
+from ov_django.ov.serialization import ENCODERS, DataResponse, response_format, compress
+from ov_django.ov.constants import CONTENT_TYPE_TO_SERIALIZATION
 from ov_django import settings
 from simplejson import dumps
 
@@ -25,17 +33,39 @@ def welcome(request):
 	state = "welcome"
 	return render_to_response('basic/welcome.html', locals())
 
-def setup_context_roots_page(context, page):
+ROOTS_PAGE_SIZE = 10
+"""
+Roots of a context are counted up to this number only, bigger sets are browsed with next/previous links
+"""
+ROOTS_COUNT_LIMIT = getattr(settings, 'OV_ROOTS_COUNT_LIMIT', 10000)
+
+def count_context_roots(context):
+	"""
+	Returns (cached) number of roots of given context, None if there are more than ROOTS_COUNT_LIMIT
 	"""
-	Sets roots property for given context. Roots will span only selected page.
-	Context will be modified!
+	def count():
+		total = context.get_root_entries()[:ROOTS_COUNT_LIMIT + 1].count()
+		return total if total <= ROOTS_COUNT_LIMIT else -1
+	total = rendercache.get_context_value(context.id, 'roots', count)
+	return total if total >= 0 else None
+
+def setup_context_roots_page(context, request):
 	"""
-	paginator = Paginator(context.get_root_entries(), 10)
+	Sets roots property for given context. Roots will span only the page selected by the cursor
+	(after or before GET params; keyset pagination on (label, id)). Context will be modified!
+	"""
+	number = get_page(request)
+	after = request.GET.get('after', None)
+	before = request.GET.get('before', None)
+	if not (after or before):
+		number = 1
 	try:
-		roots = paginator.page(page)
-	except (EmptyPage, InvalidPage):
-		roots = paginator.page(paginator.num_pages)
-	context.roots = roots#.object_list
+		roots = browse(context.get_root_entries(), 'label', after, before, ROOTS_PAGE_SIZE, number,
+		               count_context_roots(context))
+	except ValueError:
+		roots = browse(context.get_root_entries(), 'label', size=ROOTS_PAGE_SIZE, number=1,
+		               total=count_context_roots(context))
+	context.roots = roots
 
 def get_page(request):
 	"""
@@ -57,8 +87,8 @@ def list_vocabularies(request):
 	lang = request.GET.get('lang', None)
 	uri = request.GET.get('uri', None)
 
-	langs = Context.objects.get_langs()
-	tags = Tag.objects.all()
+	langs = facets.get_langs()
+	tags = facets.get_tags()
 
 	results = None
 	if tag:
@@ -69,7 +99,7 @@ def list_vocabularies(request):
 		results = Context.objects.filter(lang=lang)
 	elif uri:
 		context = get_object_or_404(Context, uri=uri)
-		setup_context_roots_page(context, get_page(request))
+		setup_context_roots_page(context, request)
 		results = [context]
 	else:
 		results = Context.objects.filter(visible=True)
@@ -108,45 +138,252 @@ def lookup_concept(request, path=None):
 		uri = request.GET.get('uri', None)
 	print "URI: %s" % uri
 	if uri:
-		# add trailing slash
-		if uri[-1] <> '/':
-			uri = uri + '/'
-		contexts = Context.objects.filter(Q(uri=uri) | Q(uri=uri[:-1]))
-		if len(contexts) > 0:
-			context = contexts[0]
-			setup_context_roots_page(context, get_page(request))
+		# -- any form of the uri (trailing slash, case of the host, ...) or its alias
+		resolved = resolve(uri)
+		if isinstance(resolved, Context):
+			context = resolved
+			setup_context_roots_page(context, request)
 			return render_to_response('basic/vocabularies.html', {
 				'results': [context],
-				'langs': Context.objects.get_langs(),
-				'tags': Tag.objects.all(),
-				'uri': uri,
+				'langs': facets.get_langs(),
+				'tags': facets.get_tags(),
+				'uri': context.uri,
 				})
-		else:
-			# no conexts found, try entries
-			entries = Entry.objects.filter(Q(uri=uri) | Q(uri=uri[:-1]))
-			if len(entries) > 0:
-				entry = entries[0]
-				print "Entry:", entry
-				needsrdf = re.match("^.*application/x-turtle.*$", accept)
-				if needsrdf:
-					return HttpResponse(entry.to_rdf(), mimetype="application/x-turtle")
+		elif resolved:
+			entry = resolved
+			print "Entry:", entry
+			media_type = negotiate(accept, PAGE_MEDIA_TYPES)
+			is_rdf = media_type in SERIALIZERS_BY_MEDIA_TYPE
+			policy = 'data' if is_rdf else 'html'
+			stamp = entry_stamp(entry)
+			etag = make_etag(stamp, 'entry', entry.pk, media_type)
+			response = not_modified(request, etag, stamp, policy)
+			if response is None:
+				if is_rdf:
+					response = entry_rdf_response(entry, media_type)
 				else:
-					return render_to_response('basic/lookup.html', locals())#, mimetype="application/xhtml+xml")
-			else:
-				# no entries found
-				return HttpResponseNotFound()
+					response = HttpResponse(rendercache.get_rendered(entry, 'html', lambda: render_entry_page(entry)))
+				set_validators(response, etag, stamp, policy)
+			patch_vary_headers(response, ('Accept',))
+			return response
+		else:
+			# no contexts nor entries found
+			return HttpResponseNotFound()
 	return render_to_response('basic/lookup.html', locals())#, mimetype="application/xhtml+xml")
 
+def _statements_of(model, entries):
+	"""
+	Returns triples or references of given entries, filtered by the partition key too (see ov/partitions.py)
+	"""
+	queryset = model.objects.filter(subject__in=[entry.pk for entry in entries])
+	context_ids = set(entry.context_id for entry in entries)
+	if None not in context_ids:
+		queryset = queryset.filter(context__in=list(context_ids))
+	return queryset
+
+"""
+Sections of the entry page listed a page at a time: name -> (queryset of given entries, field of the entry, ordering field)
+"""
+ENTRY_SECTIONS = {
+	'children'  : (lambda entries: Entry.objects.filter(parent__in=[entry.pk for entry in entries]), 'parent', 'label'),
+	'relations' : (lambda entries: _statements_of(EntryReference, entries).select_related('object'), 'subject', 'relation'),
+	'triples'   : (lambda entries: _statements_of(Triple, entries).select_related('predicate', 'object'), 'subject', 'predicate'),
+}
+
+ENTRY_SECTION_SIZE = getattr(settings, 'OV_ENTRY_SECTION_SIZE', 50)
+ENTRY_SECTION_MAX_SIZE = 500
+
+def _attach_object_entries(triples):
+	"""
+	Sets object_entry of given triples: the entry described by this end-point among their objects, if any
+	"""
+	object_uris = [ triple.object.uri for triple in triples if triple.object_id ]
+	object_entries = dict((e.uri, e) for e in Entry.objects.filter(uri__in=object_uris)) if object_uris else {}
+	for triple in triples:
+		triple.object_entry = object_entries.get(triple.object.uri) if triple.object_id else None
+
+def entry_section(entry, section, cursor=None, size=ENTRY_SECTION_SIZE):
+	"""
+	Returns (objects, next cursor) of the page of given section of the entry page starting after given cursor
+	"""
+	queryset, key, field = ENTRY_SECTIONS[section]
+	objects, next = keyset_page(queryset([entry]), field, cursor, size)
+	if section == 'triples':
+		_attach_object_entries(objects)
+	return objects, next
+
+def count_entry_sections(entry):
+	"""
+	Returns (cached) numbers of objects in the sections of the entry page
+	"""
+	return rendercache.get_rendered(entry, 'counts',
+		lambda: dict((name, queryset([entry]).count()) for name, (queryset, key, field) in ENTRY_SECTIONS.items()))
+
+"""
+Many to many fields of Entry listed in full on the entry page
+"""
+ENTRY_PAGE_LISTS = ('types', 'meanings', 'words', 'word_senses')
+
+def _entry_lists(entries):
+	"""
+	Returns {entry id: {field: objects}} of the ENTRY_PAGE_LISTS of given entries, one query per field
+	(ordered like the related managers)
+	"""
+	lists = dict((entry.pk, dict((name, []) for name in ENTRY_PAGE_LISTS)) for entry in entries)
+	for name in ENTRY_PAGE_LISTS:
+		field = Entry._meta.get_field(name)
+		source, target = field.m2m_field_name(), field.m2m_reverse_field_name()
+		ordering = [ ('-' if o.startswith('-') else '') + target + '__' + o.lstrip('-') for o in field.rel.to._meta.ordering ]
+		links = getattr(Entry, name).through.objects.filter(**{source + '__in': list(lists)}).select_related(target)
+		for link in links.order_by(*(ordering + [target])):
+			lists[getattr(link, source + '_id')][name].append(getattr(link, target))
+	return lists
+
+def _entry_page(entry, referenced, lists):
+	page = {
+		'entry': entry,
+		'parent': referenced.get(entry.parent_id),
+		'in_synset': referenced.get(entry.in_synset_id),
+	}
+	page.update(lists[entry.pk])
+	return page
+
+def _set_section(page, section, objects, next, count):
+	page[section] = objects
+	page[section + '_next'] = next
+	page[section + '_count'] = count
+
+def _referenced(entries):
+	return Entry.objects.in_bulk([pk for entry in entries for pk in (entry.parent_id, entry.in_synset_id) if pk])
+
+def build_entry_page(entry, size=ENTRY_SECTION_SIZE):
+	"""
+	Loads everything basic/lookup.html shows about given entry in a bounded number of bulk queries
+	(the long sections only a page of given size). Returns the template context (plain lists,
+	the template does not query the database).
+	"""
+	page = _entry_page(entry, _referenced([entry]), _entry_lists([entry]))
+	counts = None
+	for section in ENTRY_SECTIONS:
+		objects, next = entry_section(entry, section, size=size)
+		if next and counts is None:
+			counts = count_entry_sections(entry)
+		_set_section(page, section, objects, next, counts[section] if next else len(objects))
+	return page
+
+def build_entry_pages(entries, size=ENTRY_SECTION_SIZE):
+	"""
+	Returns build_entry_page() of each of given entries, loaded together: the number of queries does not
+	depend on the number of entries (except for the sections longer than a page, read per entry)
+	"""
+	entries = list(entries)
+	if not entries:
+		return []
+	lists = _entry_lists(entries)
+	referenced = _referenced(entries)
+	pages = dict((entry.pk, _entry_page(entry, referenced, lists)) for entry in entries)
+	for section, (queryset, key, field) in ENTRY_SECTIONS.items():
+		counts = dict(queryset(entries).order_by().values_list(key).annotate(count=Count('pk')))
+		short = [ entry for entry in entries if counts.get(entry.pk, 0) <= size ]
+		objects = dict((entry.pk, []) for entry in short)
+		if short:
+			# -- whole sections, in the order of keyset_page (objects without the ordering field last)
+			rows = queryset(short)
+			meta = rows.model._meta
+			if meta.get_field(field).null:
+				rows = list(rows.filter(**{field + '__isnull': False}).order_by(field, 'pk')) + \
+				       list(rows.filter(**{field + '__isnull': True}).order_by('pk'))
+			else:
+				rows = list(rows.order_by(field, 'pk'))
+			if section == 'triples':
+				_attach_object_entries(rows)
+			for obj in rows:
+				objects[getattr(obj, meta.get_field(key).attname)].append(obj)
+		for entry in entries:
+			if entry.pk in objects:
+				_set_section(pages[entry.pk], section, objects[entry.pk], None, len(objects[entry.pk]))
+			else:
+				page, next = entry_section(entry, section, size=size)
+				_set_section(pages[entry.pk], section, page, next, counts[entry.pk])
+	return [ pages[entry.pk] for entry in entries ]
+
+def entry_href(entry):
+	"""
+	Returns address of the page of given entry (see create_entry_anchor)
+	"""
+	if entry.uri.startswith(BASE_URL_PATH):
+		return entry.uri
+	return "/vocabularies/lookup?%s" % urllib.urlencode({'uri': entry.uri.encode('utf-8')})
+
+def _section_item(section, obj):
+	if section == 'children':
+		return {'uri': obj.uri, 'label': obj.get_label(), 'href': entry_href(obj)}
+	if section == 'relations':
+		return {'relation': obj.relation, 'relation_label': DICT_ENTRY_RELATION_TYPES.get(obj.relation, obj.relation),
+		        'uri': obj.object.uri, 'label': obj.object.get_label(), 'href': entry_href(obj.object)}
+	item = {'predicate': obj.predicate.uri, 'predicate_label': obj.predicate.label or obj.predicate.uri}
+	if obj.object_id:
+		item.update({'uri': obj.object.uri, 'label': obj.object.label or obj.object.uri,
+		             'href': entry_href(obj.object_entry) if obj.object_entry else obj.object.uri})
+		if obj.object_entry:
+			item['label'] = obj.object_entry.get_label()
+	else:
+		item.update({'literal': obj.literal, 'lang': obj.literal_lang})
+	return item
+
+def entry_section_page(request):
+	"""
+	part of REST API - JSON page of a section (children, relations, triples) of the entry page;
+	GET params: uri, section, cursor (next of the previous page), size
+	"""
+	entry = get_object_or_404(Entry, uri=request.GET.get('uri', None))
+	section = request.GET.get('section', None)
+	if section not in ENTRY_SECTIONS:
+		return HttpResponseBadRequest("Unknown section: %s" % section)
+	try:
+		size = min(max(int(request.GET.get('size', ENTRY_SECTION_SIZE)), 1), ENTRY_SECTION_MAX_SIZE)
+		objects, next = entry_section(entry, section, request.GET.get('cursor', None), size)
+	except ValueError, e:
+		return HttpResponseBadRequest(str(e))
+	return HttpResponse(dumps({
+		'items': [ _section_item(section, obj) for obj in objects ],
+		'next': next,
+		'count': count_entry_sections(entry)[section],
+	}), mimetype="application/json")
+
+def render_entry_page(entry, page=None):
+	"""
+	Returns HTML page of given entry (of given build_entry_page() result, if already loaded)
+	"""
+	return render_to_string('basic/lookup.html', page or build_entry_page(entry))
+
+"""
+Media types of the html/ pages followed by these of the data/ (RDF) representations, in the order of preference
+"""
+PAGE_MEDIA_TYPES = ['text/html', 'application/xhtml+xml'] + rdf_media_types()
+
+def render_entry_rdf(entry, serializer=DEFAULT_SERIALIZER):
+	"""
+	Returns (cached) RDF representation of given entry, Turtle by default
+	"""
+	def render():
+		entries = Entry.objects.prefetch_neighbourhood([entry])
+		return "".join(serializer.serialize([entry.get_rdf_plan()], [entries]))
+	return rendercache.get_rendered(entry, serializer.name, render)
+
+def entry_rdf_response(entry, media_type):
+	return HttpResponse(render_entry_rdf(entry, SERIALIZERS_BY_MEDIA_TYPE[media_type]), mimetype=media_type)
+
 def redirect(request, path):
 	"""
 	Redirects to appropriate service
 	"""
-	accept = request.META.get("HTTP_ACCEPT", "")
-	needsrdf = re.match("^.*application\/x-turtle.*$", accept)
-	prefix = "data/" if needsrdf else "html/"
+	media_type = negotiate(request.META.get("HTTP_ACCEPT", ""), PAGE_MEDIA_TYPES)
+	prefix = "data/" if media_type in SERIALIZERS_BY_MEDIA_TYPE else "html/"
 
 	response = HttpResponse(content="", status=303)
 	response["Location"] = BASE_URL_PATH + prefix + path
+	patch_vary_headers(response, ('Accept',))
 
 	return response
 
@@ -155,27 +392,69 @@ def rdfdata(request, path):
 	"""
 	Responds with RDF representation of the resource
 	"""
-	uri = BASE_OV_PATH + path
-	result = Entry.objects.lookup(uri) if id != '' else None
+	result = resolve(BASE_OV_PATH + path, (Entry,))
 	if result:
-		return HttpResponse(result.to_rdf(), mimetype="application/x-turtle")
+		# -- Turtle unless other RDF format is preferred
+		media_type = negotiate(request.META.get("HTTP_ACCEPT", ""), rdf_media_types()) or DEFAULT_SERIALIZER.media_types[0]
+		stamp = entry_stamp(result)
+		etag = make_etag(stamp, 'entry', result.pk, media_type)
+		response = not_modified(request, etag, stamp, 'data')
+		if response is None:
+			response = set_validators(entry_rdf_response(result, media_type), etag, stamp, 'data')
+		patch_vary_headers(response, ('Accept',))
+		return response
 	else:
 		raise Http404
 
 
+def export_vocabulary(request, format):
+	"""
+	Streams whole vocabulary (given by uri GET param) in given format; gzip=1 compresses the stream
+	"""
+	context = get_object_or_404(Context, uri=request.GET.get('uri', None))
+	compressed = bool(request.GET.get('gzip', None))
+	stamp = context_stamp(context)
+	etag = make_etag(stamp, 'export', context.pk, format, compressed)
+	response = not_modified(request, etag, stamp, 'export')
+	if response:
+		return response
+	content = export_context(context, format)
+	mimetype, extension = EXPORT_FORMATS[format]
+	filename = "%s.%s" % (context.ns or context.id, extension)
+	if compressed:
+		content = gzip_stream(content)
+		mimetype = "application/x-gzip"
+		filename += ".gz"
+	response = HttpResponse(content, mimetype=mimetype)
+	response["Content-Disposition"] = "attachment; filename=%s" % filename
+	return set_validators(response, etag, stamp, 'export')
+
+
+"""
+Whether search_label falls back to the nearest label (within small edit distance, see ov/fuzzy.py) by default
+"""
+SEARCH_LABEL_FUZZY = getattr(settings, 'OV_SEARCH_LABEL_FUZZY', False)
+
 def search_label(request, label):
 	"part of REST API - searches OV for entries with given label (and language); uri pattern: search/label/<label_to_search>"
-	accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', None)
-	if accept_encoding is None:
-		accept_encoding = settings.DEFAULT_SERIALIZATION_TYPE
+	# -- older clients give the content type in Accept-Encoding
+	format = CONTENT_TYPE_TO_SERIALIZATION.get(request.META.get('HTTP_ACCEPT_ENCODING', None))
+	if format not in ENCODERS:
+		format = response_format(request, ENCODERS)
 
 	if request.method == "GET":
 		lang = request.META["HTTP_LANG"]
 		results = Entry.objects.filter(Q(lexical_form__iexact=label) | Q(label__iexact=label)).filter(context__lang=lang)
 		if results:
-			response = HttpResponse(dumps(results[0].uri), content_type=accept_encoding)
+			response = compress(request, DataResponse(results[0].uri).serialize(request, format))
 		else:
-			response = HttpResponseNotFound();
+			# -- the nearest label (typo tolerance)
+			use_fuzzy = request.GET['fuzzy'].lower() in ('1', 'true', 'yes') if 'fuzzy' in request.GET else SEARCH_LABEL_FUZZY
+			nearest = fuzzy.match(label, lang=lang, limit=1) if use_fuzzy else None
+			if nearest:
+				response = compress(request, DataResponse(Entry.objects.get(pk=nearest[0]['id']).uri).serialize(request, format))
+			else:
+				response = HttpResponseNotFound();
 		return response
 	elif request.method == "POST": #TODO Handling user authentication etc.
 		print request.POST.lists()
@@ -183,4 +462,8 @@ def search_label(request, label):
 		raise NotImplementedError
 
 
-
+def metrics_exposition(request):
+	"Metrics of this process (see ov/metrics.py) in the Prometheus text format, for local scrapers only"
+	if request.META.get('REMOTE_ADDR') not in metrics.ALLOWED_IPS:
+		return HttpResponseForbidden()
+	return HttpResponse(metrics.exposition().encode('utf-8'), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,10 +1,13 @@
 # -*- coding: utf-8 -*-
 # encoding: utf-8
 import re
+import operator
 import uuid
+from xml.sax.saxutils import escape, quoteattr
 
 from django.db import models
 from django.db.models.query import QuerySet
+from django.db.models.fields import FieldDoesNotExist
 
 """
 Namespaces recognized by this package
@@ -45,72 +48,337 @@ DEF_INSTANCE_NAMESPACE = "http://id.ibookfactory.com/"
 
 TURTLE_NS_HEAD = "@prefix %s: <%s>.\n"
 
+RDF_TYPE = NAMESPACES['rdf'] + "type"
+
+RE_PREFIXED_NAME = re.compile(r"^(?P<prefix>[A-Za-z][\w-]*):(?P<local>[^/].*)?$")
+RE_LOCAL_NAME = re.compile(r"^[A-Za-z0-9_][\w-]*$")
+RE_XML_LOCAL_NAME = re.compile(r"^[A-Za-z_][\w.-]*$")
+RE_XML_SPLIT = re.compile(r"^(?P<ns>.*[#/])(?P<local>[A-Za-z_][\w.-]*)$")
+
+RDFXML_HEAD = '<?xml version="1.0" encoding="UTF-8"?>\n<rdf:RDF%s>\n'
+RDFXML_FOOT = '</rdf:RDF>\n'
+
+def expand_uri(value):
+	"""
+	Expands prefixed name (e.g. skos:Concept) into the full URI; other values are returned as they are
+	"""
+	m = RE_PREFIXED_NAME.match(value)
+	if m and m.group('prefix') in NAMESPACES:
+		return NAMESPACES[m.group('prefix')] + (m.group('local') or '')
+	return value
+
+def uri_of(value):
+	"""
+	Returns (full) URI of given URI object, prefixed name or URI string
+	"""
+	if hasattr(value, "get_uri"):
+		value = value.get_uri()
+	return expand_uri(value)
+
+def escape_literal(value):
+	"""
+	Escapes string for the Turtle/N-Triples quoted literal
+	"""
+	return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').replace('\r', '\\r')
+
+class RdfStep(object):
+	"""
+	Compiled rdfMeta entry of a single property: resolved accessors, condition and predicate tokens
+	"""
+	def __init__(self, klass, prop, spec):
+		self.prop = prop
+		self.spec = spec
+		uris = spec["uri"]
+		self.spec_uris = uris if isinstance(uris, (list, tuple, QuerySet)) else [ uris ]
+		self.predicates = [ uri_of(puri) for puri in self.spec_uris ]
+		self.accessor = _accessor(klass, spec.get("property", prop))
+		self.convert = _value_converter(spec) if "value" in spec else None
+		self.condition = None
+		if "condition" in spec:
+			cname, cvalue = spec["condition"]
+			self.condition = (_condition_accessor(klass, cname, cvalue), cvalue)
+		self.uri_pattern = expand_uri(spec["uri_pattern"]) if "uri_pattern" in spec else None
+		self.literal_pattern = spec.get("literal_pattern")
+		self.attribute = spec.get("attribute")
+		self.xsd = spec.get("xsd")
+		self.lang = spec.get("lang")
+
+	def applies(self, obj):
+		"""
+		Checks the condition of this property for given object
+		"""
+		if self.condition:
+			accessor, expected = self.condition
+			return accessor(obj) == expected
+		return True
+
+	def values(self, obj):
+		"""
+		Returns list of values (URI objects or literals) of this property for given object
+		"""
+		prefetched = getattr(obj, "_rdf_prefetched", None)
+		value = prefetched[self.prop] if prefetched and self.prop in prefetched else self.accessor(obj)
+		# --- if this is a relation type of property
+		if hasattr(value, 'all') and callable(value.all):
+			items = value.all()
+		elif isinstance(value, (list, tuple, QuerySet)):
+			items = value
+		# --- single value
+		else:
+			if self.convert:
+				value = self.convert(value)
+			elif self.attribute and value is not None:
+				value = getattr(value, self.attribute)
+			if value and self.uri_pattern:
+				return [ URI(self.uri_pattern % value) ]
+			if value is not None and self.literal_pattern:
+				return [ self.literal_pattern % value ]
+			items = [ value ]
+		result = []
+		for item in items:
+			if hasattr(item, "get_uri"):
+				result.append(URI(uri_of(item)))
+			elif item:
+				result.append(unicode(item))
+		return result
+
+def _prefix_of(uri):
+	"""
+	Returns (namespace, prefix) allowing to shorten given URI, None if there is none
+	"""
+	best = None
+	for ns, prefix in INV_NAMESPACE.items():
+		if uri.startswith(ns) and RE_LOCAL_NAME.match(uri[len(ns):]) and (not best or len(ns) > len(best[0])):
+			best = (ns, prefix)
+	return best
+
+def _accessor(klass, name):
+	"""
+	Resolves accessor of given attribute or (argument-less) method
+	"""
+	if callable(getattr(klass, name, None)):
+		return operator.methodcaller(name)
+	return operator.attrgetter(name)
+
+def _condition_accessor(klass, name, expected):
+	"""
+	Resolves accessor of a condition - checking foreign key columns without fetching related objects
+	"""
+	if expected is None and hasattr(klass, "_meta"):
+		try:
+			return operator.attrgetter(klass._meta.get_field(name).attname)
+		except FieldDoesNotExist:
+			pass
+	return _accessor(klass, name)
+
+def _value_converter(spec):
+	"""
+	Compiles the "value" conversion of a property: a Python expression in which %s stands for the value
+	(e.g. "%s * 2"). With "dict" the values are mapped first, so the expression is evaluated once per key.
+	"""
+	pattern = spec["value"]
+	if "dict" in spec:
+		return dict((key, eval(pattern % mapped)) for key, mapped in spec["dict"].items()).__getitem__
+	return eval("lambda value: " + pattern % "value")
+
+class RdfPlan(object):
+	"""
+	Serialization plan of an RdfConcept class, compiled once per class from its rdfMeta
+	"""
+	def __init__(self, concept):
+		klass = concept.__class__
+		self.rdf_types = [ uri_of(rdf_type) for rdf_type in concept.get_rdf_types() ]
+		self.steps = [ RdfStep(klass, prop, spec) for prop, spec in concept.rdfMeta().items() ]
+		self.by_prop = dict((step.prop, step) for step in self.steps)
+		# -- only prefixes actually used by the predicates, types and uri patterns
+		used = set()
+		for step in self.steps:
+			used.update(_prefix_of(puri) for puri in step.predicates)
+			if step.uri_pattern:
+				used.add(_prefix_of(step.uri_pattern.replace("%s", "_")))
+		used.update(_prefix_of(rdf_type) for rdf_type in self.rdf_types)
+		used.discard(None)
+		self.prefixes = sorted(used, key=lambda (ns, prefix): (-len(ns), prefix))
+		self.head = "".join(TURTLE_NS_HEAD % (prefix, ns) for ns, prefix in sorted(self.prefixes, key=lambda (ns, prefix): prefix))
+		self.type_tokens = ", ".join(self.turtle_uri(uri) for uri in self.rdf_types)
+		for step in self.steps:
+			step.tokens = [ self.turtle_uri(puri) for puri in step.predicates ]
+			step.xml_tags = [ self.xml_tag(puri) for puri in step.predicates ]
+		self.type_tags = [ '\t<rdf:type rdf:resource=%s/>\n' % quoteattr(uri) for uri in self.rdf_types ]
+
+	def statements(self, obj):
+		"""
+		Yields (step, values) for all the properties of given object having values
+		"""
+		for step in self.steps:
+			if step.applies(obj):
+				values = step.values(obj)
+				if values:
+					yield step, values
+
+	def turtle_uri(self, uri):
+		"""
+		Generates appropriate URI form <http://full/uri> or short:uri
+		"""
+		for ns, prefix in self.prefixes:
+			if uri.startswith(ns) and RE_LOCAL_NAME.match(uri[len(ns):]):
+				return prefix + ":" + uri[len(ns):]
+		return "<%s>" % uri
+
+	def turtle_value(self, step, value):
+		if isinstance(value, URI):
+			return self.turtle_uri(value.get_uri())
+		literal = '"%s"' % escape_literal(value)
+		if step.lang:
+			return literal + "@" + step.lang
+		if step.xsd:
+			return literal + "^^" + self.turtle_uri(uri_of(step.xsd))
+		return literal
+
+	def to_turtle(self, obj):
+		"""
+		Returns Turtle description of given object (without prefixes head)
+		"""
+		rdf = [ "\n%s\n\ta %s" % (self.turtle_uri(obj.get_uri()), self.type_tokens) ]
+		for step, values in self.statements(obj):
+			rval = ", ".join(self.turtle_value(step, value) for value in values)
+			for token in step.tokens:
+				rdf.append(";\n\t%s %s" % (token, rval))
+		rdf.append(".\n")
+		return "".join(rdf)
+
+	def ntriples_value(self, step, value):
+		if isinstance(value, URI):
+			return "<%s>" % value.get_uri()
+		literal = '"%s"' % escape_literal(value)
+		if step.lang:
+			return literal + "@" + step.lang
+		if step.xsd:
+			return literal + "^^<%s>" % uri_of(step.xsd)
+		return literal
+
+	def to_ntriples(self, obj):
+		"""
+		Returns N-Triples description of given object
+		"""
+		subject = "<%s>" % obj.get_uri()
+		rdf = [ "%s <%s> <%s> .\n" % (subject, RDF_TYPE, rdf_type) for rdf_type in self.rdf_types ]
+		for step, values in self.statements(obj):
+			for value in values:
+				rval = self.ntriples_value(step, value)
+				for puri in step.predicates:
+					rdf.append("%s <%s> %s .\n" % (subject, puri, rval))
+		return "".join(rdf)
+
+	def compact_uri(self, uri):
+		"""
+		Returns prefixed name of given URI (if this plan uses its namespace) or the URI itself
+		"""
+		token = self.turtle_uri(uri)
+		return uri if token[0] == "<" else token
+
+	def jsonld_context(self):
+		return dict((prefix, ns) for ns, prefix in self.prefixes)
+
+	def jsonld_value(self, step, value):
+		if isinstance(value, URI):
+			return { "@id" : value.get_uri() }
+		if step.lang:
+			return { "@value" : value, "@language" : step.lang }
+		if step.xsd:
+			return { "@value" : value, "@type" : uri_of(step.xsd) }
+		return value
+
+	def to_jsonld(self, obj):
+		"""
+		Returns JSON-LD node (dictionary) of given object, using prefixes of jsonld_context
+		"""
+		node = { "@id" : obj.get_uri(), "@type" : [ self.compact_uri(rdf_type) for rdf_type in self.rdf_types ] }
+		for step, values in self.statements(obj):
+			rval = [ self.jsonld_value(step, value) for value in values ]
+			for puri in step.predicates:
+				node.setdefault(self.compact_uri(puri), []).extend(rval)
+		return node
+
+	def xml_namespaces(self):
+		"""
+		Returns xmlns declarations (of the rdf:RDF element) of the prefixes used by this plan
+		"""
+		namespaces = dict((prefix, ns) for ns, prefix in self.prefixes)
+		namespaces['rdf'] = NAMESPACES['rdf']
+		return namespaces
+
+	def xml_tag(self, uri):
+		"""
+		Returns (opening tag, closing tag) of the RDF/XML property element of given predicate URI
+		"""
+		token = self.turtle_uri(uri)
+		if token[0] != "<" and RE_XML_LOCAL_NAME.match(token.split(":", 1)[1]):
+			return "<%s" % token, "</%s>" % token
+		m = RE_XML_SPLIT.match(uri)
+		if not m:
+			raise ValueError("Predicate not expressible in RDF/XML: %s" % uri)
+		# -- namespace without a prefix declared in place
+		return '<%s xmlns=%s' % (m.group('local'), quoteattr(m.group('ns'))), "</%s>" % m.group('local')
+
+	def rdfxml_value(self, step, value, tag):
+		start, end = tag
+		if isinstance(value, URI):
+			return '\t%s rdf:resource=%s/>\n' % (start, quoteattr(value.get_uri()))
+		if step.lang:
+			start += ' xml:lang=%s' % quoteattr(step.lang)
+		elif step.xsd:
+			start += ' rdf:datatype=%s' % quoteattr(uri_of(step.xsd))
+		return '\t%s>%s%s\n' % (start, escape(value), end)
+
+	def to_rdfxml(self, obj):
+		"""
+		Returns RDF/XML rdf:Description element of given object (without the rdf:RDF element)
+		"""
+		rdf = [ '<rdf:Description rdf:about=%s>\n' % quoteattr(obj.get_uri()) ] + self.type_tags
+		for step, values in self.statements(obj):
+			for value in values:
+				for tag in step.xml_tags:
+					rdf.append(self.rdfxml_value(step, value, tag))
+		rdf.append('</rdf:Description>\n')
+		return "".join(rdf)
+
 class RdfConcept(object):
 	"""
 	Use this model to get additional features from the RDF data model
 	"""
+	_rdf_plans = {}
+
 	def __init__(self, uri=None, rdf_types=[]):
 		_uri = uri
 		_rdf_types = rdf_types
 
+	def get_rdf_plan(self):
+		"""
+		Returns serialization plan of this class (compiled on first use)
+		"""
+		klass = self.__class__
+		plan = RdfConcept._rdf_plans.get(klass)
+		if plan is None:
+			plan = RdfConcept._rdf_plans[klass] = RdfPlan(self)
+		return plan
+
 	def to_rdf(self):
 		"""
 		Returns RDF (Turtle) representation of this object
 		"""
-		rdf = self.__head__()
-		rdf += "\n%s\n" % self.to_uri(self.get_uri())
-		#
-		rdf += "\ta %s" % self.object_to_string(self.get_rdf_types())
-		#
-		# -- for each defined property --
-		rdfMeta = self.rdfMeta()
-		for prop in rdfMeta:
-			condition = True
-			if "condition" in rdfMeta[prop]:
-				ctuple = rdfMeta[prop]["condition"]
-				cvalue = self.get_value(ctuple[0])
-				condition = cvalue == ctuple[1]
-			if condition:
-				try:
-					property_uri, rval = self.get_property_uris(prop, rdfMeta)
-					if rval:
-						for puri in property_uri:
-							rdf += ";\n\t%s %s" % (self.to_uri(puri), rval)
-				except ValueError, e:
-					print "Could not properly unpack property %s of %s" % (prop, self.get_uri())
-		#
-		rdf += ".\n"
-		return rdf
+		plan = self.get_rdf_plan()
+		return plan.head + plan.to_turtle(self)
 
 	def get_property_uris(self, prop, rdfMeta=None):
 		"""
-		Returns list with property uris of given prop type
+		Returns list with property uris of given prop type and Turtle representation of its value(s)
 		"""
-		if not rdfMeta:
-			rdfMeta = self.rdfMeta()
-		rdfprops = rdfMeta[prop]
-		# -- get the value of this property
-		dbval = getattr(self, rdfprops["property"]) if "property" in rdfprops else getattr(self, prop)
-		if callable(dbval):
-			rval = self.objects_as_rdf_list(dbval())
-		# --- if this is a relation type of property
-		elif hasattr(dbval, 'all') and callable(dbval.all):
-			rval = self.objects_as_rdf_list(dbval.all())
-		# --- if this is a literal ?
-		else:
-			rval = self.property_to_string(prop)
-		# -- property
-		property_uri = rdfMeta[prop]["uri"]
-		# -- repack
-#        result_prop_uri = []
-		if isinstance(property_uri, (list, tuple, QuerySet)):
-			result_prop_uri = property_uri
-#            for puri in property_uri:
-#                result_prop_uri += puri
-		else:
-			result_prop_uri = [ property_uri ]
-		# -- return
-		return result_prop_uri, rval
+		plan = self.get_rdf_plan()
+		step = plan.by_prop[prop]
+		values = step.values(self)
+		rval = ", ".join(plan.turtle_value(step, value) for value in values) if values else None
+		return step.spec_uris, rval
 
 	def get_literal_type(self, prop, rdfMeta=None):
 		"""
@@ -118,13 +386,8 @@ class RdfConcept(object):
 
 		TODO: should be delivered by data not model in the future
 		"""
-		if not rdfMeta:
-			rdfMeta = self.rdfMeta()
-		if prop in rdfMeta:
-			rdfprops = rdfMeta[prop]
-			if "xsd" in rdfprops:
-				return rdfprops["xsd"]
-		return None
+		step = self.get_rdf_plan().by_prop.get(prop)
+		return step.xsd if step else None
 
 	def get_literal_lang(self, prop, rdfMeta=None):
 		"""
@@ -132,22 +395,8 @@ class RdfConcept(object):
 
 		TODO: should be delivered by data not model in the future
 		"""
-		if not rdfMeta:
-			rdfMeta = self.rdfMeta()
-		if prop in rdfMeta:
-			rdfprops = rdfMeta[prop]
-			if "lang" in rdfprops:
-				return rdfprops["lang"]
-		return None
-
-	"""
-	Creates generic head in the RDF turtle format.
-	"""
-	def __head__(self):
-		head = ""
-		for key, value in NAMESPACES.items():
-			head += TURTLE_NS_HEAD % (key, value)
-		return head
+		step = self.get_rdf_plan().by_prop.get(prop)
+		return step.lang if step else None
 
 	"""
 	Returns URI of this object.
@@ -179,82 +428,6 @@ class RdfConcept(object):
 	def get_class_name(self):
 		return self.__class__.__name__
 
-	"""
-	Converts an array of objects to a list compatible with RDF
-	"""
-	def objects_as_rdf_list(self, objects):
-		n = len(objects)
-		if n == 0:
-			raise ValueError("Cannot list empty array or non-array")
-		elif n == 1:
-			return self.object_to_string(objects[0])
-		else:
-			return ", ".join("%s" % self.object_to_string(v) for v in objects ) # -- I love the power of Python :)
-
-	"""
-	Convert arbitrary object to RDF compatible representation "literal", <resource>
-	"""
-	def object_to_string(self, obj):
-		if hasattr(obj, "get_uri"):
-			return self.to_uri(obj.get_uri())
-		elif isinstance(obj, (list, tuple, QuerySet)):
-			return self.objects_as_rdf_list(obj)
-		elif obj:
-			return '"' + unicode(obj) + '"'
-		else:
-			return None
-
-	"""
-	Returns value for given property using this property as given, or mathing property or callable function from rdf spec
-
-	"""
-	def get_property_value(self, prop, rdfprops):
-		if "property" in rdfprops and hasattr(self, rdfprops["property"]):
-			if callable(eval("self."+rdfprops["property"])):
-				dbval = eval("self."+rdfprops["property"]+"()")
-			else:
-				dbval = getattr(self, rdfprops["property"])
-		else:
-			dbval = getattr(self, prop)
-
-		return dbval
-
-	"""
-	returns value by given property
-	"""
-	def get_value(self, prop):
-		val = None
-		if hasattr(self, prop) and callable(eval("self."+prop)):
-			val = eval("self."+prop+"()")
-		elif hasattr(self, prop):
-			val = getattr(self, prop)
-		return val
-
-	"""
-	Converts to string information based on the property information
-	"""
-	def property_to_string(self, prop):
-		if prop is None:
-			return prop
-
-		rdfMeta = self.rdfMeta()
-		rdfprops = rdfMeta[prop]
-		dbval = self.get_property_value(prop, rdfprops)
-		#-- check if if conversion for value is given
-		if 'value' in rdfprops:
-			if 'dict' in rdfprops:
-				dbval = rdfprops['dict'][dbval]
-			dbval = eval(rdfprops["value"] % dbval)
-		elif 'attribute' in rdfprops:
-			dbval = getattr(dbval, rdfprops['attribute'])
-		#-- then check if we are about to create a URI after all
-		if dbval and 'uri_pattern' in rdfprops:
-			return self.to_uri(rdfprops["uri_pattern"] % dbval)
-		elif 'literal_pattern' in rdfprops:
-			return rdfprops["literal_pattern"] % dbval
-		else:
-			return self.object_to_string(dbval)
-
 	"""
 	Generates appropriate URI form <http://full/uri> or short:uri
 	"""
@@ -70,6 +70,7 @@ TEMPLATE_LOADERS = (
 )
 
 MIDDLEWARE_CLASSES = (
+    'ov_django.ov.metrics.MetricsMiddleware', # first, to measure the others too
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -111,7 +112,41 @@ HAYSTACK_SEARCH_ENGINE = 'solr'
 HAYSTACK_WHOOSH_PATH = os.path.join(os.path.dirname(__file__), 'index').replace('\\','/'),
 HAYSTACK_SOLR_URL = 'http://localhost:8983/solr'
 
+# ----------------- cache configuration --------------
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+#    'render': {
+#        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+#        'LOCATION': '127.0.0.1:11211',
+#    },
+}
+
 # ---------------- ov configuration ------------------
 
 BASE_URL_PATH = "http://localhost:8000/"
 BASE_OV_PATH = BASE_URL_PATH #"http://www.openvocabulary.info/"
+OV_RENDER_CACHE = 'default' # cache alias for rendered entries (keyed on Context.modified, any cache works)
+OV_RENDER_CACHE_TIMEOUT = 24 * 60 * 60
+# Cache-Control of the responses per kind of end-point (html, data, export, api), see ov/conditional.py
+#OV_CACHE_CONTROL = {'html': 'public, max-age=3600', 'export': 'public, max-age=86400'}
+# Maximal number of words/uris in one batch lookup and of results per word, see ov/batch.py
+#OV_BATCH_MAX_ITEMS = 1000
+#OV_BATCH_MAX_RESULTS = 50
+# Autocomplete indexes: snapshot file (written by the autocomplete command), interval (seconds)
+# of checking for modified vocabularies and building all of them at start, see ov/autocomplete.py
+#OV_AUTOCOMPLETE_SNAPSHOT = "/var/lib/ov/autocomplete.pickle"
+#OV_AUTOCOMPLETE_CHECK_INTERVAL = 60
+#OV_AUTOCOMPLETE_WARM = True
+# search_label falls back to the nearest label (typo tolerance, see ov/fuzzy.py) unless ?fuzzy= is given
+#OV_SEARCH_LABEL_FUZZY = True
+# Maximal length (characters) of a text to annotate, see ov/annotator.py
+#OV_ANNOTATE_MAX_LENGTH = 1000000
+# REST API responses of at least this size (bytes) are compressed (gzip/deflate), see ov/serialization.py
+#OV_COMPRESS_MIN_SIZE = 1024
+# Requests slower than this (seconds) are logged with their queries (logger ov.metrics); addresses
+# allowed to read the metrics end-point, see ov/metrics.py
+#OV_METRICS_SLOW_REQUEST = 1.0
+#OV_METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')